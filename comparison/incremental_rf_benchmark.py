@@ -0,0 +1,73 @@
+'''
+Check that updating ``IncrementalRandomForest`` with new observations does
+not get slower as the history grows.
+
+For every history size, the forest is trained on the history and then
+updated with a few single new rows; the median update time is recorded.
+The script fails if the update time at the largest history exceeds
+`--max-ratio` times the one at the smallest. Below ``max_samples`` (2000 by
+default) the trees are fitted on bootstraps of the whole history, so the
+sizes should start there.
+
+usage:
+    python comparison/incremental_rf_benchmark.py
+    python comparison/incremental_rf_benchmark.py --sizes 2000 8000 32000 128000 --dim 8
+'''
+import argparse
+import sys
+import time
+
+import numpy as np
+import ConfigSpace as CS
+
+from xbbo.configspace.space import DenseConfigurationSpace
+from xbbo.surrogate.incremental_rf import IncrementalRandomForest
+
+
+def update_time(n, dim, repeats, seed):
+    rng = np.random.RandomState(seed)
+    cs = CS.ConfigurationSpace(seed=seed)
+    cs.add_hyperparameters([
+        CS.UniformFloatHyperparameter('x{}'.format(i), 0, 1)
+        for i in range(dim)
+    ])
+    cs = DenseConfigurationSpace(cs, encoding_cat='bin', encoding_ord='bin')
+    X = rng.rand(n + repeats, dim)
+    y = np.sum((X - 0.5)**2, axis=1) + 0.01 * rng.randn(n + repeats)
+    model = IncrementalRandomForest(cs, rng=rng)
+    model.train(X[:n], y[:n])
+    times = []
+    for i in range(n + 1, n + repeats + 1):
+        st = time.perf_counter()
+        model.train(X[:i], y[:i])
+        times.append(time.perf_counter() - st)
+        assert model.n_refit_trees >= 1
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes',
+                        type=int,
+                        nargs='+',
+                        default=[2000, 8000, 32000])
+    parser.add_argument('--dim', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-ratio', type=float, default=3.)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    times = []
+    for n in args.sizes:
+        times.append(update_time(n, args.dim, args.repeats, args.seed))
+        print('history {:>7d}: 1-row update {:.4f}s'.format(n, times[-1]))
+    ratio = times[-1] / times[0]
+    print('update time ratio (largest / smallest history): {:.2f}'.format(ratio))
+    if ratio > args.max_ratio:
+        print('FAIL: update time grows with the history (> {})'.format(
+            args.max_ratio))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+'''
+Micro-benchmark of optimizer overhead (not solution quality).
+
+For every registered search algorithm, sweep the history size, the problem
+dimension and the batch size (`n_suggestions`) and record the wall time of
+`suggest` / `observe`, the peak RSS and per-phase timings.
+
+usage:
+    python comparison/latency_benchmark.py --out latency.json
+    python comparison/latency_benchmark.py --algs tpe rs --out new.json --baseline latency.json
+'''
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from xbbo.problem.fast_example_problem import Ackley
+from xbbo.search_algorithm import alg_register
+from xbbo.core.constants import MAXINT, Key
+from xbbo.core.tracer import TRACER
+
+METRICS = ['suggest_p50', 'suggest_p95', 'observe_p50', 'observe_p95']
+
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in KB on linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 2**20
+    return peak / 2**10
+
+
+def _suggest_observe(hpopt, problem, batch, timing):
+    st = time.perf_counter()
+    trial_list = hpopt.suggest(n_suggestions=batch)
+    suggest_time = time.perf_counter() - st
+
+    st = time.perf_counter()
+    for trial in trial_list:
+        res = problem(trial.config_dict)
+        trial.add_observe_value(observe_value=res[Key.FUNC_VALUE])
+    timing['evaluate'] += time.perf_counter() - st
+
+    st = time.perf_counter()
+    hpopt.observe(trial_list=trial_list)
+    observe_time = time.perf_counter() - st
+    return len(trial_list), suggest_time, observe_time
+
+
+def run_one_cell(opt_name, dim, history, batch, repeats, seed):
+    '''
+    Fill the optimizer with `history` observations, then time `repeats`
+    further suggest/observe rounds of `batch` suggestions each.
+    '''
+    res = {
+        'alg': opt_name,
+        'dim': dim,
+        'history': history,
+        'batch': batch,
+        'error': None
+    }
+    timing = {'fill': 0., 'suggest': 0., 'evaluate': 0., 'observe': 0.}
+    try:
+        problem = Ackley(dim=dim, rng=seed)
+        cs = problem.get_configuration_space()
+        hpopt = alg_register[opt_name](space=cs,
+                                       seed=seed,
+                                       suggest_limit=history + repeats)
+        n_trials = 0
+        st = time.perf_counter()
+        while n_trials < history:
+            n, _, _ = _suggest_observe(hpopt, problem, batch, timing)
+            n_trials += n
+        timing['fill'] = time.perf_counter() - st
+        timing['evaluate'] = 0.
+
+        TRACER.reset()
+        TRACER.enable()
+        suggest_times, observe_times = [], []
+        for _ in range(repeats):
+            _, s_t, o_t = _suggest_observe(hpopt, problem, batch, timing)
+            suggest_times.append(s_t)
+            observe_times.append(o_t)
+        TRACER.disable()
+        # per-span totals (surrogate.train, acq.maximize, ...)
+        res['spans'] = TRACER.summary()
+        timing['suggest'] = float(np.sum(suggest_times))
+        timing['observe'] = float(np.sum(observe_times))
+        res.update({
+            'suggest_p50': float(np.percentile(suggest_times, 50)),
+            'suggest_p95': float(np.percentile(suggest_times, 95)),
+            'observe_p50': float(np.percentile(observe_times, 50)),
+            'observe_p95': float(np.percentile(observe_times, 95)),
+        })
+    except Exception:
+        res['error'] = traceback.format_exc(limit=3)
+    res['phases'] = timing
+    res['peak_rss_mb'] = _peak_rss_mb()
+    return res
+
+
+def _run_isolated(cell, timeout):
+    # a fresh process per cell so that peak RSS is not polluted by previous
+    # cells and a hanging optimizer can be killed
+    ctx = multiprocessing.get_context('spawn')
+    pool = ctx.Pool(1)
+    try:
+        return pool.apply_async(run_one_cell, cell).get(timeout)
+    except multiprocessing.TimeoutError:
+        alg, dim, history, batch = cell[:4]
+        return {
+            'alg': alg,
+            'dim': dim,
+            'history': history,
+            'batch': batch,
+            'error': 'timeout after {}s'.format(timeout),
+            'phases': {},
+            'peak_rss_mb': None
+        }
+    finally:
+        pool.terminate()
+
+
+def benchmark(test_algs,
+              dims=(2, 10),
+              histories=(10, 100),
+              batches=(1, 4),
+              repeats=10,
+              father_seed=42,
+              isolate=True,
+              timeout=600):
+    rng = np.random.RandomState(father_seed)
+    cells = []
+    for alg in test_algs:
+        for dim in dims:
+            for history in histories:
+                for batch in batches:
+                    cells.append((alg, dim, history, batch, repeats,
+                                  rng.randint(MAXINT)))
+    results = []
+    for cell in cells:
+        res = _run_isolated(cell, timeout) if isolate else run_one_cell(*cell)
+        print(_format_row(res))
+        results.append(res)
+    return results
+
+
+def _format_row(res):
+    name = '{}(dim={},history={},batch={})'.format(res['alg'], res['dim'],
+                                                   res['history'],
+                                                   res['batch'])
+    if res['error']:
+        return '{}: failed\n{}'.format(name, res['error'])
+    return '{}: suggest p50/p95={:.4f}/{:.4f}s, observe p50/p95={:.4f}/{:.4f}s, peak_rss={:.1f}MB'.format(
+        name, res['suggest_p50'], res['suggest_p95'], res['observe_p50'],
+        res['observe_p95'], res['peak_rss_mb'])
+
+
+def _cell_key(res):
+    return (res['alg'], res['dim'], res['history'], res['batch'])
+
+
+def compare(results, baseline, rtol=0.2, atol=1e-3):
+    '''
+    Flag every metric that is slower than the baseline by more than
+    `rtol` (relative) and `atol` seconds (absolute, to ignore noise on
+    sub-millisecond calls).
+    '''
+    base = {_cell_key(r): r for r in baseline if not r['error']}
+    regressions = []
+    for res in results:
+        key = _cell_key(res)
+        if res['error'] or key not in base:
+            continue
+        for m in METRICS:
+            old, new = base[key][m], res[m]
+            if new > old * (1 + rtol) and new - old > atol:
+                regressions.append({
+                    'alg': res['alg'],
+                    'dim': res['dim'],
+                    'history': res['history'],
+                    'batch': res['batch'],
+                    'metric': m,
+                    'baseline': old,
+                    'current': new,
+                    'ratio': new / old if old > 0 else np.inf
+                })
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='suggest/observe latency benchmark')
+    parser.add_argument('--algs', nargs='+', default=None,
+                        help='default: every entry in alg_register')
+    parser.add_argument('--dims', nargs='+', type=int, default=[2, 10])
+    parser.add_argument('--histories', nargs='+', type=int, default=[10, 100])
+    parser.add_argument('--batches', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-isolate', action='store_true',
+                        help='run all cells in this process (peak RSS becomes cumulative)')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='seconds per cell before it is killed')
+    parser.add_argument('--out', default='latency_benchmark.json')
+    parser.add_argument('--baseline', default=None,
+                        help='stored result file to compare against')
+    parser.add_argument('--rtol', type=float, default=0.2)
+    parser.add_argument('--atol', type=float, default=1e-3)
+    args = parser.parse_args()
+
+    test_algs = args.algs if args.algs else list(alg_register.keys())
+    results = benchmark(test_algs,
+                        dims=args.dims,
+                        histories=args.histories,
+                        batches=args.batches,
+                        repeats=args.repeats,
+                        father_seed=args.seed,
+                        isolate=not args.no_isolate,
+                        timeout=args.timeout)
+    out = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'repeats': args.repeats,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    with open(args.out, 'w') as f:
+        json.dump(out, f, indent=2)
+    print('results saved to {}'.format(args.out))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.rtol, args.atol)
+        for r in regressions:
+            print('REGRESSION {alg}(dim={dim},history={history},batch={batch}) '
+                  '{metric}: {baseline:.4f}s -> {current:.4f}s (x{ratio:.2f})'.format(**r))
+        if regressions:
+            sys.exit(1)
+        print('no regression against {}'.format(args.baseline))
@@ -11,11 +11,47 @@ from xbbo.acquisition_function.base import AbstractAcquisitionFunction, Acquisit
 from xbbo.configspace.space import DenseConfigurationSpace, DenseConfiguration, get_one_exchange_neighbourhood
 from xbbo.core.trials import Trials
 from xbbo.core.constants import MAXINT
+from xbbo.core.tracer import span
 from xbbo.utils.util import get_types
 
 logger = logging.getLogger(__name__)
 
 
+class _DeadlineExceeded(Exception):
+    pass
+
+
+class _AnytimeObjective():
+    '''
+    Wrap a scipy objective so that it aborts the optimizer once `deadline`
+    (``time.perf_counter()``) is exceeded; `run` then returns the best
+    point evaluated so far instead of raising.
+    '''
+    def __init__(self, func, deadline=np.inf):
+        self.func = func
+        self.deadline = deadline
+        self.best_x = None
+        self.best_fun = np.inf
+
+    def __call__(self, x):
+        if self.best_x is not None and time.perf_counter() >= self.deadline:
+            raise _DeadlineExceeded()
+        fun = self.func(x)
+        if fun < self.best_fun:
+            self.best_x, self.best_fun = np.array(x, copy=True), fun
+        return fun
+
+    def run(self, optimizer, **kwargs):
+        try:
+            return optimizer(**kwargs)
+        except _DeadlineExceeded:
+            logger.debug('Scipy optimizer stopped at deadline.')
+            return scipy.optimize.OptimizeResult(x=self.best_x,
+                                                 fun=self.best_fun,
+                                                 success=False,
+                                                 message='deadline exceeded')
+
+
 class RandomSearch(AcquisitionFunctionMaximizer):
     """Get candidate solutions via random sampling of configurations.
 
@@ -26,11 +62,26 @@ class RandomSearch(AcquisitionFunctionMaximizer):
     config_space : ~xbbo.configspace.DenseConfigurationSpace
 
     rng : np.random.RandomState or int, optional
+
+    chunk_size: int
+        number of configurations sampled and scored at once when sorting
+        under a deadline; the first chunk is always scored
     """
+    def __init__(
+        self,
+        acquisition_function: AbstractAcquisitionFunction,
+        config_space: DenseConfigurationSpace,
+        rng: np.random.RandomState = np.random.RandomState(42),
+        chunk_size: int = 100,
+    ):
+        super().__init__(acquisition_function, config_space, rng)
+        self.chunk_size = chunk_size
+
     def _maximize(self,
                   trials: Trials,
                   num_points: int,
                   _sorted: bool = False,
+                  deadline: float = np.inf,
                   **kwargs) -> List[Tuple[float, DenseConfiguration]]:
         """Randomly sampled configurations
 
@@ -44,6 +95,9 @@ class RandomSearch(AcquisitionFunctionMaximizer):
             number of points to be sampled
         _sorted: bool
             whether random configurations are sorted according to acquisition function
+        deadline: float
+            ``time.perf_counter()`` value after which no more chunks are
+            sampled and scored (only with `_sorted`)
 
         Returns
         -------
@@ -51,11 +105,9 @@ class RandomSearch(AcquisitionFunctionMaximizer):
             An iterable consistng of
             tuple(acqusition_value, :class:`xbbo.configspace.DenseConfiguration`).
         """
-        if num_points > 1:
-            rand_configs = self.config_space.sample_configuration(
-                size=num_points)
-        else:
-            rand_configs = [self.config_space.sample_configuration(size=1)]
+        if _sorted and np.isfinite(deadline):
+            return self._sort_chunks_until(num_points, deadline)
+        rand_configs = self.config_space.sample_configuration(size=num_points)
         if _sorted:
             for i in range(len(rand_configs)):
                 rand_configs[i].origin = 'Random Search (sorted)'
@@ -65,6 +117,26 @@ class RandomSearch(AcquisitionFunctionMaximizer):
                 rand_configs[i].origin = 'Random Search'
             return [(0, rand_configs[i]) for i in range(len(rand_configs))]
 
+    def _sort_chunks_until(
+            self, num_points: int,
+            deadline: float) -> List[Tuple[float, DenseConfiguration]]:
+        rand_configs, acq_values = [], []
+        while len(rand_configs) < num_points:
+            size = min(self.chunk_size, num_points - len(rand_configs))
+            configs = self.config_space.sample_configuration(size=size)
+            acq_values.append(self.acquisition_function(configs).ravel())
+            rand_configs += configs
+            if time.perf_counter() >= deadline:
+                logger.debug('Random search ran out of time after %d of %d configurations.',
+                             len(rand_configs), num_points)
+                break
+        for config in rand_configs:
+            config.origin = 'Random Search (sorted)'
+        acq_values = np.concatenate(acq_values)
+        # random tie-breaking, as in _sort_configs_by_acq_value
+        indices = np.lexsort((self.rng.rand(len(acq_values)), acq_values))
+        return [(acq_values[ind], rand_configs[ind]) for ind in indices[::-1]]
+
 
 class LocalSearch(AcquisitionFunctionMaximizer):
     """Implementation of xbbo's local search.
@@ -96,7 +168,11 @@ class LocalSearch(AcquisitionFunctionMaximizer):
         self.max_steps = max_steps
         self.n_steps_plateau_walk = n_steps_plateau_walk
 
-    def _maximize(self, trials: Trials, num_points: int,
+    def _maximize(self,
+                  trials: Trials,
+                  num_points: int,
+                  deadline: float = np.inf,
+                  candidates: Optional[List[Tuple[float, DenseConfiguration]]] = None,
                   **kwargs) -> List[Tuple[float, DenseConfiguration]]:
         """Starts a local search from the given startpoint and quits
         if either the max number of steps is reached or no neighbor
@@ -110,6 +186,13 @@ class LocalSearch(AcquisitionFunctionMaximizer):
             current stats object
         num_points: int
             number of points to be sampled
+        deadline: float
+            ``time.perf_counter()`` value after which the searches stop and
+            return their current incumbents; start points (sorted by
+            acquisition value) that were not reached are skipped
+        candidates: list of tuple(acquisition value, DenseConfiguration), optional
+            already scored configurations (e.g. of a random search) that
+            compete with the previous configurations as start points
         ***kwargs:
             Additional parameters that will be passed to the
             acquisition function
@@ -123,12 +206,17 @@ class LocalSearch(AcquisitionFunctionMaximizer):
 
         """
 
-        init_points = self._get_initial_points(num_points, trials)
+        init_points = self._get_initial_points(num_points, trials, candidates)
 
         acq_configs = []
         # Start N local search from different random start points
         for start_point in init_points:
-            acq_val, DenseConfiguration = self._one_iter(start_point, **kwargs)
+            if acq_configs and time.perf_counter() >= deadline:
+                logger.debug("Local search ran out of time after %d of %d start points.",
+                             len(acq_configs), len(init_points))
+                break
+            acq_val, DenseConfiguration = self._one_iter(
+                start_point, deadline, **kwargs)
 
             DenseConfiguration.origin = "Local Search"
             acq_configs.append((acq_val, DenseConfiguration))
@@ -141,25 +229,32 @@ class LocalSearch(AcquisitionFunctionMaximizer):
 
         return acq_configs
 
-    def _get_initial_points(self, num_points, trials):
+    def _get_initial_points(self, num_points, trials, candidates=None):
 
-        if trials.is_empty():
+        if trials.is_empty() and not candidates:
             init_points = self.config_space.sample_configuration(
                 size=num_points)
         else:
-            # initiate local search with best configurations from previous runs
-            configs_previous_runs = trials.get_all_configs()
-            configs_previous_runs_sorted = self._sort_configs_by_acq_value(
-                configs_previous_runs)
-            num_configs_local_search = int(
-                min(len(configs_previous_runs_sorted), num_points))
-            init_points = list(
-                map(lambda x: x[1],
-                    configs_previous_runs_sorted[:num_configs_local_search]))
+            # initiate local search with best configurations from previous runs,
+            # scored on the stored vectors so only those are rebuilt
+            acq_values = self.acquisition_function(trials.get_vectors(),
+                                                   convert=False).ravel()
+            configs = trials.get_all_configs()
+            if candidates:
+                acq_values = np.concatenate(
+                    [acq_values,
+                     np.ravel([acq for acq, _ in candidates])])
+                configs = list(configs) + [config for _, config in candidates]
+            # random tie-breaking, as in _sort_configs_by_acq_value
+            order = np.lexsort((self.rng.rand(len(acq_values)),
+                                acq_values))[::-1][:num_points]
+            init_points = [configs[i] for i in order]
 
         return init_points
 
-    def _one_iter(self, start_point: DenseConfiguration,
+    def _one_iter(self,
+                  start_point: DenseConfiguration,
+                  deadline: float = np.inf,
                   **kwargs) -> Tuple[float, DenseConfiguration]:
 
         incumbent = start_point
@@ -180,6 +275,7 @@ class LocalSearch(AcquisitionFunctionMaximizer):
             # Get neighborhood of the current incumbent
             # by randomly drawing configurations
             changed_inc = False
+            timeout = False
 
             # Get one exchange neighborhood returns an iterator (in contrast of
             # the previously returned list).
@@ -187,6 +283,9 @@ class LocalSearch(AcquisitionFunctionMaximizer):
                 incumbent, seed=self.rng.randint(MAXINT))
 
             for neighbor in all_neighbors:
+                if time.perf_counter() >= deadline:
+                    timeout = True
+                    break
                 s_time = time.time()
                 acq_val = self.acquisition_function([neighbor], **kwargs)
                 neighbors_looked_at += 1
@@ -199,7 +298,7 @@ class LocalSearch(AcquisitionFunctionMaximizer):
                     changed_inc = True
                     break
 
-            if (not changed_inc) or \
+            if (not changed_inc) or timeout or \
                     (self.max_steps is not None and
                      local_search_steps == self.max_steps):
                 logger.debug(
@@ -207,7 +306,7 @@ class LocalSearch(AcquisitionFunctionMaximizer):
                     "configurations. Computing the acquisition "
                     "value for one DenseConfiguration took %f seconds"
                     " on average.", local_search_steps, neighbors_looked_at,
-                    np.mean(time_n))
+                    np.mean(time_n) if time_n else 0.)
                 break
 
         return acq_val_incumbent, incumbent
@@ -240,15 +339,18 @@ class ScipyGlobalOptimizer(AcquisitionFunctionMaximizer):
                  trials: Trials,
                  initial_config=None,
                  drop_self_duplicate: bool = False,
+                 time_budget: Optional[float] = None,
                  **kwargs) -> List[Tuple[float, DenseConfiguration]]:
-        def negative_acquisition(x):
-            # shape of x = (d,)
-            return -self.acquisition_function(x,
-                                              convert=False)[0]  # shape=(1,)
+        negative_acquisition = _AnytimeObjective(
+            lambda x: -self.acquisition_function(x, convert=False)[0],
+            self.get_deadline(time_budget))  # shape of x = (d,)
 
         acq_configs = []
-        result = scipy.optimize.differential_evolution(
-            func=negative_acquisition, bounds=self.bounds)
+        with span('acq.maximize', maximizer=type(self).__name__):
+            result = negative_acquisition.run(
+                scipy.optimize.differential_evolution,
+                func=negative_acquisition,
+                bounds=self.bounds)
         if not result.success:
             logger.debug(
                 'Scipy differential evolution optimizer failed. Info:\n%s' %
@@ -306,18 +408,26 @@ class RandomScipyOptimizer(AcquisitionFunctionMaximizer):
                  num_points: int,
                  drop_self_duplicate: bool = False,
                  num_trials=10,
+                 time_budget: Optional[float] = None,
                  **kwargs) -> List[Tuple[float, DenseConfiguration]]:
+        deadline = self.get_deadline(time_budget)
         acq_configs = []
 
         initial_configs = self.random_search.maximize(trials, num_points,
-                                                      **kwargs).challengers
+                                                      time_budget=time_budget,
+                                                      **kwargs)
         initial_acqs = self.acquisition_function(initial_configs)
         acq_configs.extend(zip(initial_acqs, initial_configs))
 
         success_count = 0
         for config in initial_configs[:num_trials]:
+            remain = deadline - time.perf_counter()
+            if remain <= 0:
+                break
             scipy_configs = self.scipy_optimizer.maximize(
-                trials, initial_config=config).challengers
+                trials,
+                initial_config=config,
+                time_budget=None if np.isinf(remain) else remain)
             if not scipy_configs:  # empty
                 continue
             scipy_acqs = self.acquisition_function(scipy_configs)
@@ -377,24 +487,33 @@ class ScipyOptimizer(AcquisitionFunctionMaximizer):
 
     def maximize(self,
                  trials: Trials,
-                 initial_config=None,
+                 num_points: int = 1,
                  drop_self_duplicate: bool = False,
-                 **kwargs) -> List[Tuple[float, DenseConfiguration]]:
-        def negative_acquisition(x):
-            # shape of x = (d,)
-            x = np.clip(x, 0.0, 1.0)  # fix numerical problem in L-BFGS-B
-            return -self.acquisition_function(x,
-                                              convert=False)[0]  # shape=(1,)
+                 time_budget: Optional[float] = None,
+                 initial_config: Optional[DenseConfiguration] = None,
+                 **kwargs) -> List[DenseConfiguration]:
+        '''
+        One run of L-BFGS-B from `initial_config` (a random configuration if
+        None); `num_points` is accepted for the common maximizer interface,
+        a single configuration is returned.
+        '''
+        negative_acquisition = _AnytimeObjective(
+            lambda x: -self.acquisition_function(
+                np.clip(x, 0.0, 1.0),  # fix numerical problem in L-BFGS-B
+                convert=False)[0],
+            self.get_deadline(time_budget))  # shape of x = (d,)
 
         if initial_config is None:
-            initial_config = self.config_space.sample_configuration()
+            initial_config = self.config_space.sample_configuration()[0]
         init_point = initial_config.get_array(sparse=False)
 
         acq_configs = []
-        result = scipy.optimize.minimize(fun=negative_acquisition,
-                                         x0=init_point,
-                                         bounds=self.bounds,
-                                         **self.scipy_config)
+        with span('acq.maximize', maximizer=type(self).__name__):
+            result = negative_acquisition.run(scipy.optimize.minimize,
+                                              fun=negative_acquisition,
+                                              x0=init_point,
+                                              bounds=self.bounds,
+                                              **self.scipy_config)
         # if result.success:
         #     acq_configs.append((result.fun, DenseConfiguration(self.config_space, vector=result.x)))
         if not result.success:
@@ -446,6 +565,15 @@ class InterleavedLocalAndRandomSearch(AcquisitionFunctionMaximizer):
     n_sls_iterations: int
         [Local Search] number of local search iterations
 
+    random_time_fraction: float
+        share of a ``time_budget`` given to the random search
+
+    With a ``time_budget``, the random configurations are scored in chunks
+    until their share of the budget expires (at least one chunk), and the
+    local searches then refine the best start points among the previous
+    configurations and the scored random ones for the rest of the budget, so
+    the best candidates found so far are always returned.
+
     """
     def __init__(
         self,
@@ -455,8 +583,10 @@ class InterleavedLocalAndRandomSearch(AcquisitionFunctionMaximizer):
         max_steps: Optional[int] = None,
         n_steps_plateau_walk: int = 10,
         n_sls_iterations: int = 10,
+        random_time_fraction: float = 0.5,
     ):
         super().__init__(acquisition_function, config_space, rng)
+        self.random_time_fraction = random_time_fraction
         self.random_search = RandomSearch(
             acquisition_function=acquisition_function,
             config_space=config_space,
@@ -481,6 +611,7 @@ class InterleavedLocalAndRandomSearch(AcquisitionFunctionMaximizer):
                  trials: Trials,
                  num_points: int,
                  drop_self_duplicate: bool = False,
+                 time_budget: Optional[float] = None,
                  **kwargs) -> Iterable[DenseConfiguration]:
         """Maximize acquisition function using ``_maximize``.
 
@@ -490,6 +621,9 @@ class InterleavedLocalAndRandomSearch(AcquisitionFunctionMaximizer):
             trials object
         num_points: int
             number of points to be sampled
+        time_budget: float, optional
+            seconds after which the random and local searches stop and the
+            best configurations found so far are returned
         random_configuration_chooser: ~xbbo.acq_maximizer.random_configuration_chooser.RandomConfigurationChooser
             part of the returned ChallengerList such
             that we can interleave random configurations
@@ -505,16 +639,30 @@ class InterleavedLocalAndRandomSearch(AcquisitionFunctionMaximizer):
             to be concrete: ~xbbo.ei_optimization.ChallengerList
         """
 
-        next_configs_by_local_search = self.local_search._maximize(
-            trials, self.n_sls_iterations, **kwargs)
-
-        # Get configurations sorted by EI
-        new_kwargs = {"_sorted":True}
-        new_kwargs.update(kwargs)
-        next_configs_by_random_search_sorted = self.random_search._maximize(
-            trials,
-            num_points - len(next_configs_by_local_search),
-            **new_kwargs)
+        deadline = self.get_deadline(time_budget)
+        random_deadline = deadline if time_budget is None else \
+            self.get_deadline(time_budget * self.random_time_fraction)
+        n_local = self.n_sls_iterations if trials.is_empty() else min(
+            trials.trials_num, self.n_sls_iterations)
+        with span('acq.maximize', rows=num_points,
+                  maximizer=type(self).__name__):
+            # Get configurations sorted by EI (cheap, one batched call)
+            new_kwargs = {"_sorted":True}
+            new_kwargs.update(kwargs)
+            with span('acq.random_search', rows=num_points - n_local):
+                next_configs_by_random_search_sorted = self.random_search._maximize(
+                    trials,
+                    num_points - n_local,
+                    deadline=random_deadline,
+                    **new_kwargs)
+
+            # under a deadline, refine the best of the random batch as well
+            candidates = next_configs_by_random_search_sorted[:self.n_sls_iterations] \
+                if np.isfinite(deadline) else None
+            with span('acq.local_search', rows=n_local):
+                next_configs_by_local_search = self.local_search._maximize(
+                    trials, self.n_sls_iterations, deadline=deadline,
+                    candidates=candidates, **kwargs)
 
         # Having the configurations from random search, sorted by their
         # acquisition function value is important for the first few iterations
@@ -536,6 +684,30 @@ class InterleavedLocalAndRandomSearch(AcquisitionFunctionMaximizer):
         raise NotImplementedError()
 
 
+class FiniteSpaceSearch(AcquisitionFunctionMaximizer):
+    """Evaluate the acquisition function on every unevaluated configuration.
+
+    Needs ``trials.get_space_index()`` (a finite space); the remaining
+    configurations are decoded to vectors and scored in one batched call,
+    and only the `num_points` best are turned into configurations.
+    """
+    def _maximize(self, trials: Trials, num_points: int,
+                  **kwargs) -> List[Tuple[float, DenseConfiguration]]:
+        index = trials.get_space_index()
+        remaining = index.remaining()
+        if len(remaining) == 0:
+            return []
+        acq_values = self.acquisition_function(index.decode(remaining),
+                                               convert=False).ravel()
+        # random tie-breaking, as in _sort_configs_by_acq_value
+        order = np.lexsort((self.rng.rand(len(acq_values)),
+                            acq_values))[::-1][:num_points]
+        configs = index.configs(self.config_space, remaining[order])
+        for config in configs:
+            config.origin = 'Finite Space Search'
+        return list(zip(acq_values[order], configs))
+
+
 
     # """Get candidate solutions via random sampling of configurations.
 
@@ -1,11 +1,13 @@
 from collections import OrderedDict
+import time
 import numpy as np
 import abc
-from typing import Iterable, List, Tuple, Union
+from typing import Iterable, List, Optional, Tuple, Union
 # import logging
 
 from xbbo.configspace.space import DenseConfiguration, DenseConfigurationSpace, convert_denseConfigurations_to_array
 from xbbo.core.trials import Trials
+from xbbo.core.tracer import span
 from xbbo.surrogate.base import SurrogateModel
 
 
@@ -70,13 +72,16 @@ class AbstractAcquisitionFunction(object, metaclass=abc.ABCMeta):
             acquisition values for X
         """
         if convert:
-            X = convert_denseConfigurations_to_array(configurations)
+            with span('acq.convert', rows=len(configurations)):
+                X = convert_denseConfigurations_to_array(configurations)
         else:
             X = configurations  # to be compatible with multi-objective acq to call single acq
         if len(X.shape) == 1:
             X = X[np.newaxis, :]
 
-        acq = self._compute(X, **kwargs)
+        with span('acq.compute', rows=X.shape[0],
+                  acq=type(self).__name__):
+            acq = self._compute(X, **kwargs)
         if np.any(np.isnan(acq)):
             idx = np.where(np.isnan(acq))[0]
             acq[idx, :] = -np.finfo(np.float).max
@@ -134,6 +139,7 @@ class AcquisitionFunctionMaximizer(object, metaclass=abc.ABCMeta):
                  trials: Trials,
                  num_points: int,
                  drop_self_duplicate: bool = False,
+                 time_budget: Optional[float] = None,
                  **kwargs) -> Iterable[DenseConfiguration]:
         """Maximize acquisition function using ``_maximize``.
 
@@ -145,6 +151,8 @@ class AcquisitionFunctionMaximizer(object, metaclass=abc.ABCMeta):
             current stats object
         num_points: int
             number of points to be sampled
+        time_budget: float, optional
+            seconds after which the best configurations found so far are returned
         **kwargs
 
         Returns
@@ -152,12 +160,28 @@ class AcquisitionFunctionMaximizer(object, metaclass=abc.ABCMeta):
         iterable
             An iterable consisting of :class:`xbbo.config_space.DenseConfiguration`.
         """
-        configs = [t[1] for t in self._maximize(trials, num_points, **kwargs)]
+        with span('acq.maximize', rows=num_points,
+                  maximizer=type(self).__name__):
+            configs = [
+                t[1] for t in self._maximize(
+                    trials,
+                    num_points,
+                    deadline=self.get_deadline(time_budget),
+                    **kwargs)
+            ]
         return self.unique(configs=configs) if drop_self_duplicate else configs
 
+    @staticmethod
+    def get_deadline(time_budget: Optional[float]) -> float:
+        '''Absolute `time.perf_counter()` deadline of a call with `time_budget` seconds.'''
+        if time_budget is None:
+            return np.inf
+        return time.perf_counter() + time_budget
+
     @staticmethod
     def unique(configs: Iterable[DenseConfiguration]):
-        return list(OrderedDict.fromkeys(configs))
+        with span('dedup', rows=len(configs)):
+            return list(OrderedDict.fromkeys(configs))
 
     @abc.abstractmethod
     def _maximize(self, trials: Trials, num_points: int,
@@ -177,6 +201,8 @@ class AcquisitionFunctionMaximizer(object, metaclass=abc.ABCMeta):
         num_points: int
             number of points to be sampled
         **kwargs
+            may contain ``deadline``, the ``time.perf_counter()`` value at which
+            the best candidates found so far should be returned
 
         Returns
         -------
@@ -70,7 +70,12 @@ class Classifier():
                  split_use_predict=True,
                  rng=np.random.RandomState(),
                  dynamic_C=True,
+                 warm_start=True,
                  **kwargs):
+        '''
+        ::warm_start: reuse the KMeans centers and the SVM boundary of the previous bag when
+            the classifier is retrained on a changed bag (incremental treeify)
+        '''
         self.training_counter = 0
         assert sample_dims >= 1
         assert split_dims >= 1
@@ -87,6 +92,7 @@ class Classifier():
         self.normalize = normalize
         self.split_use_predict = split_use_predict
         self.dynamic_C = dynamic_C
+        self.warm_start = warm_start
         #create a gaussian process regressor
         noise = 0.1
         m52 = ConstantKernel(1.0) * Matern(length_scale=1.0, nu=2.5)
@@ -128,6 +134,12 @@ class Classifier():
                                     random_state=self.rng))])
             else:
                 raise NotImplementedError
+        if self.splitter_type in ['kmeans', 'value']:
+            self._svm_pipeline = self.svm
+        if self.splitter_type == 'kmeans':
+            self._kmean_pipeline = self.kmean
+        # row bytes -> side of the boundary, for candidate pools reused between two fits
+        self._side_cache = {}
 
         #data structures to store
         # self.real_samples = []
@@ -152,6 +164,19 @@ class Classifier():
 
         self.verbose = verbose
 
+    def set_rng(self, rng):
+        self.rng = rng
+        for model in (getattr(self, 'kmean', None), getattr(self, 'svm', None),
+                      getattr(self, '_kmean_pipeline', None),
+                      getattr(self, '_svm_pipeline', None)):
+            if model is not None:
+                model.set_params(
+                    **{
+                        name: rng
+                        for name in model.get_params()
+                        if name.endswith('random_state')
+                    })
+
     def correct_classes(self, svm_label):
         # the 0-1 labels in kmean can be different from the actual
         # flip the label is not consistent
@@ -165,6 +190,7 @@ class Classifier():
                 else:
                     svm_label[idx] = 0
             self.svm.steps[-1][-1].flip_predictions = True
+            self._side_cache = {}
         self.good_label_metric, self.bad_label_metric = self.get_cluster_metric(
             svm_label)
         return svm_label
@@ -172,6 +198,7 @@ class Classifier():
     def is_splittable_svm(self):
         try:
             if self.splitter_type in ['kmeans', 'value']:
+                self.svm = self._svm_pipeline  # drop a retry SVC of the previous fit
                 plabel = self.learn_clusters()
                 if plabel.min() == plabel.max():
                     print('Warning: only 1 cluster')
@@ -362,20 +389,32 @@ class Classifier():
         plt.savefig("boundary.pdf")
         plt.close()
 
-    def get_sample_ratio_in_region(self, cands, path):
+    def split_side(self, X, cache=False):
+        '''
+        Side of the learned boundary (0: good kid, 1: bad kid) of every row of X.
+        With `cache`, the sides are memoized per row until the boundary is refit, for
+        candidate pools that are tested repeatedly (e.g. the samples of the leaf).
+        '''
+        if not cache:
+            if self.splitter_type in ['kmeans', 'value']:
+                return self.svm.predict(X)
+            return (self.regressor.predict(X) <=
+                    self.regressor_threshold).astype(int)
+        keys = [row.tobytes() for row in np.ascontiguousarray(X)]
+        miss = [i for i, key in enumerate(keys) if key not in self._side_cache]
+        if miss:
+            for i, side in zip(miss, self.split_side(X[miss])):
+                self._side_cache[keys[i]] = side
+        return np.array([self._side_cache[key] for key in keys])
+
+    def get_sample_ratio_in_region(self, cands, path, cache=False):
         total = len(cands)
         for node in path:
             if len(cands) == 0:
                 return 0, np.array([])
             assert len(cands) > 0
-            if node[0].classifier.splitter_type in ['kmeans', 'value']:
-                boundary = node[0].classifier.svm
-                cands = cands[boundary.predict(cands) == node[1]]
-            elif node[0].classifier.splitter_type == 'linreg':
-                cands = cands[(
-                    node[0].classifier.regressor.predict(cands) <= node[0].
-                    classifier.regressor_threshold).astype(int) == node[1]]
             # node[1] store the direction to go
+            cands = cands[node[0].classifier.split_side(cands, cache) == node[1]]
         ratio = len(cands) / total
         assert len(cands) <= total
         return ratio, cands
@@ -465,7 +504,7 @@ class Classifier():
         #shrink the cands region
 
         ratio_check, centers = self.get_sample_ratio_in_region(
-            self.true_X, path)
+            self.true_X, path, cache=True)
         # no current samples located in the region
         # should not happen
         # print("ratio check:", ratio_check, len(self.X) )
@@ -776,6 +815,13 @@ class Classifier():
 
     def learn_boundary(self, plabel):
         assert len(plabel) == len(self.split_X)
+        self._side_cache = {}
+        clf = self.svm.steps[-1][-1] if isinstance(self.svm,
+                                                   Pipeline) else self.svm
+        clf.flip_predictions = False
+        if self.warm_start and hasattr(clf, 'support_') and np.array_equal(
+                self.svm.predict(self.split_X), plabel):
+            return  # the boundary of the previous bag still separates the new labels
         self.svm.fit(self.split_X, plabel)
 
     def learn_clusters(self):
@@ -788,8 +834,17 @@ class Classifier():
                              axis=1)  # 是否考虑normalize，消除scale的影响
         assert tmp.shape[0] == self.fX.shape[0]
 
+        self._side_cache = {}
         if self.splitter_type == 'kmeans':
-            self.kmean = self.kmean.fit(tmp)
+            kmean = self._kmean_pipeline
+            cluster = self.kmean.steps[-1][-1]
+            if self.warm_start and hasattr(cluster, 'cluster_centers_'):
+                # start from the clusters of the previous bag, with a new estimator so
+                # that the configured one keeps its init for the next cold fit
+                name, base = kmean.steps[-1]
+                kmean = Pipeline(kmean.steps[:-1] + [(name, KMeans(**dict(
+                    base.get_params(), init=cluster.cluster_centers_, n_init=1)))])
+            self.kmean = kmean.fit(tmp)
             plabel = self.kmean.predict(tmp)
         elif self.splitter_type == 'linreg':
             self.regressor = self.regressor.fit(self.split_X, self.fX)
@@ -821,16 +876,8 @@ class Classifier():
 
         return plabel
 
-    def split_data(self):
-        # good_real_samples = []
-        # good_samples = []
-        # bad_real_samples = []
-        # bad_samples  = []
-        good = ([], [], [], [])
-        bad = ([], [], [], [])
-        if len(self.sample_X) == 0:
-            return good, bad
-
+    def split_labels(self):
+        '''Kid (0: good, 1: bad) of every sample in the bag.'''
         if self.splitter_type in ['kmeans', 'value']:
             if self.svm_label is None:
                 plabel = self.learn_clusters()
@@ -844,7 +891,7 @@ class Classifier():
                         break
                     else:
                         if not self.dynamic_C:
-                            return False
+                            return None
                         self.svm = WrappedSVC(
                             C=10**(i + 1),
                             kernel=self.kernel_type,
@@ -867,7 +914,21 @@ class Classifier():
                 plabel = self.svm_label
         else:
             plabel = self.learn_clusters()
+        return plabel
+
+    def split_data(self):
+        # good_real_samples = []
+        # good_samples = []
+        # bad_real_samples = []
+        # bad_samples  = []
+        good = ([], [], [], [])
+        bad = ([], [], [], [])
+        if len(self.sample_X) == 0:
+            return good, bad
 
+        plabel = self.split_labels()
+        if plabel is None:
+            return False
         for idx in range(0, len(plabel)):
             if plabel[idx] == 0:
                 good[0].append(self.sample_X[idx])
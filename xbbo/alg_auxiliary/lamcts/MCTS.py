@@ -16,13 +16,51 @@ import sys
 import pickle
 import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+
+from xbbo.core.constants import MAXINT
 from .Node import Node
 from .utils import latin_hypercube, from_unit_cube
 # from torch.quasirandom import SobolEngine
 # import torch
 
 
+class _PathNode():
+    '''Picklable stand-in of a node on a path, proposals only use its classifier.'''
+    def __init__(self, classifier):
+        self.classifier = classifier
+
+
+def propose_samples(solver_type, classifier, path, num_samples, lb, ub,
+                    latent_samples, f_samples, samples, init_within_leaf):
+    if solver_type == 'bo':
+        return classifier.propose_samples_bo(latent_samples, f_samples,
+                                             num_samples, path, lb, ub,
+                                             samples)
+    elif solver_type == 'cmaes':
+        return classifier.propose_samples_cmaes(num_samples, path,
+                                                init_within_leaf, lb, ub)
+    elif solver_type == 'random':
+        return classifier.propose_samples_rs(latent_samples, f_samples,
+                                             num_samples, path, lb, ub,
+                                             samples)
+    elif solver_type in ['turbo', 'gradient']:
+        raise NotImplementedError
+    raise Exception("solver not implemented")
+
+
+def _train_classifier(classifier, seed):
+    classifier.set_rng(np.random.RandomState(seed))
+    splittable = len(classifier.sample_X) > 2 and classifier.is_splittable_svm()
+    return splittable, classifier
+
+
+def _propose_samples(seed, solver_type, classifier, *args):
+    classifier.set_rng(np.random.RandomState(seed))
+    return propose_samples(solver_type, classifier, *args)
+
+
 class MCTS:
     #############################################
 
@@ -52,12 +90,20 @@ class MCTS:
             rng=np.random.RandomState(),
             split_use_predict=True,
             verbose=False,
+            incremental_treeify=False,
+            batch_paths=False,
+            n_workers=1,
+            parallel_min_samples=500,
             **kwargs):
         '''
         ::solver: type=str, default='cmaes', choices=['cmaes'], help='leaf solver'
         ::init_within_leaf: type=str, default='mean', choices=['mean', 'random', 'max'], help='how to choose initial value within leaf for cmaes and gradient'
         ::leaf_size:  type=int, default=20, help='min leaf size before splitting'
         ::split_type: type=str, default='kmeans', choices=['kmeans', 'linreg', 'value'], help='how to split nodes for LaMCTS. value = just split in half based on value'
+        ::incremental_treeify: type=bool, default=False, help='keep the tree between treeifies and only re-split the nodes whose bag changed'
+        ::batch_paths: type=bool, default=False, help='select one path per suggestion (with virtual visits) instead of proposing the whole batch from a single leaf'
+        ::n_workers: type=int, default=1, help='processes that train the classifiers of a tree level and propose from the selected leaves concurrently'
+        ::parallel_min_samples: type=int, default=500, help='use the processes only when the nodes of a batch hold at least this many samples in total, smaller batches are cheaper in this process'
         '''
         self.space = space
         # = args
@@ -111,24 +157,13 @@ class MCTS:
         self.kwargs = kwargs
         #we start the most basic form of the tree, 3 nodes and height = 1
         self.split_use_predict = split_use_predict
-        root = Node(
-            parent=None,
-            sample_dims=self.sample_latent_dims,
-            split_dims=self.split_latent_dims,
-            true_dims=self.dims,
-            reset_id=True,
-            kernel_type=self.kernel_type,
-            cmaes_sigma_mult=self.cmaes_sigma_mult,
-            leaf_size=self.LEAF_SAMPLE_SIZE,
-            splitter_type=self.splitter_type,
-            split_metric=self.split_metric,
-            use_gpr=self.use_gpr,
-            gamma_type=self.gamma_type,
-            normalize=self.normalize,
-            verbose=self.verbose,
-            rng=self.rng,
-            split_use_predict=split_use_predict,
-            **kwargs)
+        self.incremental_treeify = incremental_treeify
+        self._treeify_data = None
+        self.batch_paths = batch_paths
+        self.n_workers = n_workers
+        self.parallel_min_samples = parallel_min_samples
+        self._pool = None
+        root = self._new_node(parent=None, reset_id=True)
         self.nodes.append(root)
 
         self.ROOT = root
@@ -136,30 +171,77 @@ class MCTS:
         # self.init_train()
         self.iterations_since_treeify = 0
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _use_pool(self, nodes):
+        return self.n_workers > 1 and len(nodes) > 1 and sum(
+            len(node.classifier.sample_X)
+            for node in nodes) >= self.parallel_min_samples
+
+    def _map(self, fn, *iterables):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_workers)
+        return list(self._pool.map(fn, *iterables))
+
+    def _train_nodes(self, nodes):
+        '''
+        Decide whether `nodes` (independent, e.g. of the same depth) are splittable. With
+        `n_workers` > 1 and enough samples their classifiers are trained in worker
+        processes.
+        '''
+        if not self._use_pool(nodes):
+            for node in nodes:
+                node.train_classifier()
+            return
+        seeds = self.rng.randint(MAXINT, size=len(nodes))
+        for node, (splittable, classifier) in zip(
+                nodes,
+                self._map(_train_classifier, [node.classifier for node in nodes],
+                          seeds)):
+            classifier.set_rng(self.rng)
+            node.classifier = classifier
+            node.is_svm_splittable = splittable
+
+    def _new_node(self, parent, reset_id=False):
+        return Node(parent=parent,
+                    sample_dims=self.sample_latent_dims,
+                    split_dims=self.split_latent_dims,
+                    true_dims=self.dims,
+                    reset_id=reset_id,
+                    kernel_type=self.kernel_type,
+                    cmaes_sigma_mult=self.cmaes_sigma_mult,
+                    leaf_size=self.LEAF_SAMPLE_SIZE,
+                    splitter_type=self.splitter_type,
+                    split_metric=self.split_metric,
+                    use_gpr=self.use_gpr,
+                    gamma_type=self.gamma_type,
+                    normalize=self.normalize,
+                    verbose=self.verbose,
+                    rng=self.rng,
+                    split_use_predict=self.split_use_predict,
+                    **self.kwargs)
+
     def populate_training_data(self):
         #only keep root
         self.ROOT.obj_counter = 0
         for node in self.nodes:
             node.clear_data()
         self.nodes.clear()
-        new_root = Node(
-            parent=None,
-            sample_dims=self.sample_latent_dims,
-            split_dims=self.split_latent_dims,
-            true_dims=self.dims,
-            reset_id=True,
-            kernel_type=self.kernel_type,
-            cmaes_sigma_mult=self.cmaes_sigma_mult,
-            leaf_size=self.LEAF_SAMPLE_SIZE,
-            splitter_type=self.splitter_type,
-            split_metric=self.split_metric,
-            use_gpr=self.use_gpr,
-            gamma_type=self.gamma_type,
-            normalize=self.normalize,
-            verbose=self.verbose,
-            rng=self.rng,
-            split_use_predict=self.split_use_predict,
-            **self.kwargs)
+        new_root = self._new_node(parent=None, reset_id=True)
         self.nodes.append(new_root)
 
         self.ROOT = new_root
@@ -193,12 +275,15 @@ class MCTS:
     def dynamic_treeify(self):
         # we bifurcate a node once it contains over 20 samples
         # the node will bifurcate into a good and a bad kid
+        if self.incremental_treeify:
+            return self.update_treeify()
         self.populate_training_data()
         assert len(self.ROOT.sample_X) == len(self.samples)
         assert len(self.nodes) == 1
 
         while self.is_splitable():
             to_split = self.get_split_idx()
+            kids = []
             #print("==>to split:", to_split, " total:", len(self.nodes) )
             for nidx in to_split:
                 parent = self.nodes[
@@ -213,57 +298,101 @@ class MCTS:
                     parent.sample_X)
                 assert len(good_kid_data[0]) > 0
                 assert len(bad_kid_data[0]) > 0
-                good_kid = Node(
-                    parent=parent,
-                    sample_dims=self.sample_latent_dims,
-                    split_dims=self.split_latent_dims,
-                    true_dims=self.dims,
-                    reset_id=False,
-                    kernel_type=self.kernel_type,
-                    cmaes_sigma_mult=self.cmaes_sigma_mult,
-                    leaf_size=self.LEAF_SAMPLE_SIZE,
-                    splitter_type=self.splitter_type,
-                    split_metric=self.split_metric,
-                    use_gpr=self.use_gpr,
-                    gamma_type=self.gamma_type,
-                    normalize=self.normalize,
-                    verbose=self.verbose,
-                    rng=self.rng,
-                    split_use_predict=self.split_use_predict,
-                    **self.kwargs)
-                bad_kid = Node(
-                    parent=parent,
-                    sample_dims=self.sample_latent_dims,
-                    split_dims=self.split_latent_dims,
-                    true_dims=self.dims,
-                    reset_id=False,
-                    kernel_type=self.kernel_type,
-                    cmaes_sigma_mult=self.cmaes_sigma_mult,
-                    leaf_size=self.LEAF_SAMPLE_SIZE,
-                    splitter_type=self.splitter_type,
-                    split_metric=self.split_metric,
-                    use_gpr=self.use_gpr,
-                    gamma_type=self.gamma_type,
-                    normalize=self.normalize,
-                    verbose=self.verbose,
-                    rng=self.rng,
-                    split_use_predict=self.split_use_predict,
-                    **self.kwargs)
-                good_kid.update_bag(good_kid_data[0], good_kid_data[1],
-                                    good_kid_data[2], good_kid_data[3])
-                bad_kid.update_bag(bad_kid_data[0], bad_kid_data[1],
-                                   bad_kid_data[2], bad_kid_data[3])
+                good_kid = self._new_node(parent)
+                bad_kid = self._new_node(parent)
+                good_kid.update_bag(good_kid_data[0],
+                                    good_kid_data[1],
+                                    good_kid_data[2],
+                                    good_kid_data[3],
+                                    retrain=False)
+                bad_kid.update_bag(bad_kid_data[0],
+                                   bad_kid_data[1],
+                                   bad_kid_data[2],
+                                   bad_kid_data[3],
+                                   retrain=False)
 
                 parent.update_kids(good_kid=good_kid, bad_kid=bad_kid)
 
                 self.nodes.append(good_kid)
                 self.nodes.append(bad_kid)
+                kids += [good_kid, bad_kid]
+            self._train_nodes(kids)
 
             #print("continue split:", self.is_splitable())
 
         if self.verbose:
             self.print_tree()
 
+    def _assign_bag(self, node, idx, data):
+        '''
+        Give `node` the samples `idx`. Returns whether its classifier has to be retrained,
+        i.e. the bag changed and is large enough to be split.
+        '''
+        changed = node.bag_idx is None or not np.array_equal(node.bag_idx, idx)
+        node.update_bag(*(d[idx] for d in data), retrain=False)
+        node.bag_idx = idx
+        if changed and len(idx) <= self.LEAF_SAMPLE_SIZE:
+            # a node too small to be split never needs its classifier
+            node.is_svm_splittable = False
+            return False
+        return changed
+
+    def update_treeify(self):
+        '''
+        `dynamic_treeify` that keeps the tree between two calls: the samples are routed
+        down from the root and only the nodes whose bag changed are re-split (warm-started),
+        the split and subtree of the others are reused.
+        '''
+        data = [
+            np.asarray(d) for d in (self.latent_samples, self.split_vectors,
+                                    self.samples, self.f_samples)
+        ]
+        prev = self._treeify_data
+        if prev is None or any(
+                not np.array_equal(d[:len(p)], p) for d, p in zip(data, prev)):
+            # first call, or the latent encoding of old samples changed
+            self.ROOT = self._new_node(parent=None, reset_id=True)
+        self._treeify_data = data
+
+        self.nodes = []
+        self.CURT = self.ROOT
+        level = [(self.ROOT,
+                  self._assign_bag(self.ROOT, np.arange(len(self.samples)),
+                                   data))]
+        while level:
+            self._train_nodes([node for node, retrain in level if retrain])
+            next_level = []
+            for node, retrain in level:
+                node.id = len(self.nodes)
+                self.nodes.append(node)
+                if not (len(node.sample_X) > self.LEAF_SAMPLE_SIZE
+                        and node.is_svm_splittable):
+                    node.kids = []
+                    continue
+                if retrain or node.is_leaf():
+                    plabel = np.asarray(node.classifier.split_labels())
+                    good_idx = node.bag_idx[plabel == 0]
+                    bad_idx = node.bag_idx[plabel == 1]
+                else:
+                    good_idx = node.kids[0].bag_idx
+                    bad_idx = node.kids[1].bag_idx
+                assert len(good_idx) > 0 and len(bad_idx) > 0
+                kids = node.kids or [
+                    self._new_node(node), self._new_node(node)
+                ]
+                kids_retrain = [
+                    self._assign_bag(kid, idx, data)
+                    for kid, idx in zip(kids, (good_idx, bad_idx))
+                ]
+                if node.is_leaf():
+                    node.update_kids(good_kid=kids[0], bad_kid=kids[1])
+                next_level.extend(zip(kids, kids_retrain))
+            level = next_level
+        Node.obj_counter = len(self.nodes)
+
+        if self.verbose:
+            self.print_tree()
+
     # def collect_samples(self, sample, value=None, split_info=None, final_obs=None):
     #     #TODO: to perform some checks here
     #     if value == None:
@@ -379,6 +508,25 @@ class MCTS:
         # print([n[1] for n in path])
         return curt_node, path
 
+    def select_batch(self, num):
+        '''
+        `num` paths, each selection counts as a (virtual) visit of the nodes on its path
+        so that the following ones are pushed towards other leaves.
+        '''
+        selections = []
+        visited = []
+        for _ in range(num):
+            leaf, path = self.select()
+            selections.append((leaf, path))
+            node = leaf
+            while node is not None:
+                node.n += 1
+                visited.append(node)
+                node = node.parent
+        for node in visited:
+            node.n -= 1
+        return selections
+
     def no_tree_select(self):
         # select the best leaf regardless of tree path
         self.reset_to_root()
@@ -456,34 +604,43 @@ class MCTS:
                 # self.latent_samples = self.func.sample_latent_converter.encode([s[0] for s in self.samples], self.func.env.get_obs())
                 self.dynamic_treeify()
             self.iterations_since_treeify += 1
-            self.leaf, self.path = self.select()
+            if self.batch_paths and suggest_num > 1:
+                self.selections = self.select_batch(suggest_num)
+            else:
+                self.selections = [self.select()]
+            self.leaf, self.path = self.selections[0]
         self.sample_per_inner_alg_count += 1
-        if self.solver_type == 'bo':
-            assert type(self.split_latent_converter) == type(
-                self.sample_latent_converter), "current sample via split path"
-            latent_samples = self.leaf.propose_samples_bo(
-                self.latent_samples, self.f_samples, suggest_num, self.path,
-                self.sample_latent_bounds.lb, self.sample_latent_bounds.ub,
-                self.samples)
-        elif self.solver_type == 'turbo':
-            raise NotImplementedError
-        elif self.solver_type == 'cmaes':
-            latent_samples = self.leaf.propose_samples_cmaes(
-                suggest_num, self.path, self.init_within_leaf,
-                self.sample_latent_bounds.lb, self.sample_latent_bounds.ub)
-        elif self.solver_type == 'gradient':
-            raise NotImplementedError
-        elif self.solver_type == 'random':
+        if self.solver_type in ['bo', 'random']:
             assert type(self.split_latent_converter) == type(
                 self.sample_latent_converter), "current sample via split path"
-            latent_samples = self.leaf.propose_samples_rs(
-                self.latent_samples, self.f_samples, suggest_num, self.path,
-                self.sample_latent_bounds.lb, self.sample_latent_bounds.ub,
-                self.samples)
+        # number of samples to propose from every distinct leaf
+        groups = {}
+        for i in range(suggest_num):
+            leaf, path = self.selections[i % len(self.selections)]
+            groups.setdefault(id(leaf), [leaf, path, 0])[2] += 1
+        groups = list(groups.values())
+        args = (self.sample_latent_bounds.lb, self.sample_latent_bounds.ub,
+                self.latent_samples, self.f_samples, self.samples,
+                self.init_within_leaf)
+        if not self._use_pool([leaf for leaf, _, _ in groups]):
+            proposals = [
+                propose_samples(self.solver_type, leaf.classifier, path, num,
+                                *args) for leaf, path, num in groups
+            ]
         else:
-            raise Exception("solver not implemented")
+            proposals = self._map(
+                _propose_samples,
+                self.rng.randint(MAXINT, size=len(groups)),
+                *zip(*[(self.solver_type, leaf.classifier,
+                        [(_PathNode(node.classifier), choice)
+                         for node, choice in path], num) + args
+                       for leaf, path, num in groups]))
+        leaves, latent_samples = [], []
+        for (leaf, _, _), proposed in zip(groups, proposals):
+            leaves += [leaf] * len(proposed)
+            latent_samples += list(proposed)
         samples = self.sample_latent_converter.decode(latent_samples)
-        return self.leaf, latent_samples, samples
+        return leaves, latent_samples, samples
 
     # def suggest(self, suggest_num=1):
     #     if self.iterations_since_treeify % self.treeify_freq == 0:
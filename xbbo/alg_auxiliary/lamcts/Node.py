@@ -72,6 +72,7 @@ class Node:
         self.true_X = np.array([])
         self.fX = np.array([])
         self.is_svm_splittable = False
+        self.bag_idx = None  # indices of the bag in the samples of the MCTS
 
         if reset_id:
             Node.obj_counter = 0
@@ -115,7 +116,17 @@ class Node:
         print("BAG" + "#" * 10)
         print('\n')
 
-    def update_bag(self, latent_samples, split_vectors, true_samples, returns):
+    def update_bag(self,
+                   latent_samples,
+                   split_vectors,
+                   true_samples,
+                   returns,
+                   retrain=True):
+        '''
+        retrain: bool
+            Retrain the classifier to decide whether the node is splittable. Otherwise only the
+            data and the statistics are reset and the previous split is kept (unchanged bag).
+        '''
         assert len(latent_samples) > 0
         assert len(latent_samples) == len(split_vectors) == len(
             true_samples) == len(returns)
@@ -129,14 +140,21 @@ class Node:
         self.fX = np.asarray(returns, dtype=np.float32).reshape(-1)
         assert self.sample_X.shape[0] == self.split_X.shape[
             0] == self.true_X.shape[0] == self.fX.shape[0]
+        svm_label = self.classifier.svm_label
         self.classifier.update_samples(latent_samples, split_vectors,
                                        true_samples, returns)
+        if retrain:
+            self.train_classifier()
+        else:
+            self.classifier.svm_label = svm_label
+        self.x_bar = self.classifier.get_metric()
+        self.n = len(self.sample_X)
+
+    def train_classifier(self):
         if len(self.sample_X) <= 2:
             self.is_svm_splittable = False
         else:
             self.is_svm_splittable = self.classifier.is_splittable_svm()
-        self.x_bar = self.classifier.get_metric()
-        self.n = len(self.sample_X)
 
     def clear_data(self):
         self.sample_X = np.array([])
@@ -0,0 +1,129 @@
+'''
+Index of a finite configuration space.
+
+Every configuration of a space of categorical, ordinal, constant and
+integer hyperparameters without conditions or forbidden clauses is mapped
+to an integer in ``[0, size)`` (mixed radix over the levels of each
+hyperparameter, the last one varying fastest). The evaluated integers are
+kept in a bitset together with a swap-remove list of the unevaluated ones,
+so drawing a new configuration uniformly at random never needs rejection
+and enumerating what is left of the space is a single slice.
+'''
+import typing
+import numpy as np
+import ConfigSpace.hyperparameters as CSH
+
+from xbbo.configspace.space import DenseConfiguration
+
+
+class FiniteSpaceIndex():
+    def __init__(self, levels: typing.List[np.ndarray]):
+        '''
+        levels: list of np.ndarray
+            Sorted vector values (``Configuration.get_array()``) of every
+            hyperparameter, in the order of the space.
+        '''
+        self.levels = [np.asarray(l, dtype=np.float64) for l in levels]
+        self.radix = np.array([len(l) for l in self.levels], dtype=np.int64)
+        self.size = int(np.prod(self.radix))
+        # place value of each digit, last hyperparameter fastest
+        self.strides = np.ones(len(self.radix), dtype=np.int64)
+        self.strides[:-1] = np.cumprod(self.radix[::-1])[::-1][1:]
+        self._mids = [(l[1:] + l[:-1]) / 2 for l in self.levels]
+        dtype = np.int32 if self.size < np.iinfo(np.int32).max else np.int64
+        self.evaluated = np.zeros(self.size, dtype=bool)
+        self._free = np.arange(self.size, dtype=dtype)  # [:n_remaining] unevaluated
+        self._pos = np.arange(self.size, dtype=dtype)  # position in _free
+        self.n_remaining = self.size
+
+    @classmethod
+    def from_space(cls, space, max_size: int = 1 << 20):
+        '''
+        Index of `space`, None if it is not finite, has conditions or
+        forbidden clauses, or has more than `max_size` configurations.
+        '''
+        if space.get_conditions() or space.get_forbiddens():
+            return None
+        levels = []
+        size = 1
+        for hp in space.get_hyperparameters():
+            if isinstance(hp, CSH.CategoricalHyperparameter):
+                level = np.arange(hp.num_choices)
+            elif isinstance(hp, CSH.OrdinalHyperparameter):
+                level = np.arange(len(hp.sequence))
+            elif isinstance(hp, CSH.Constant):
+                level = np.zeros(1)
+            elif isinstance(hp, CSH.UniformIntegerHyperparameter) \
+                    and hp.q is None and hp.upper - hp.lower < max_size:
+                level = hp._inverse_transform(
+                    np.arange(hp.lower, hp.upper + 1))
+            else:
+                return None
+            size *= len(level)
+            if size > max_size:
+                return None
+            levels.append(np.sort(level))
+        return cls(levels)
+
+    @property
+    def n_evaluated(self):
+        return self.size - self.n_remaining
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        '''Integers of the configuration vectors (rows of `vectors`).'''
+        vectors = np.asarray(vectors, dtype=np.float64).reshape(
+            -1, len(self.levels))
+        idx = np.zeros(len(vectors), dtype=np.int64)
+        for j, mids in enumerate(self._mids):
+            idx += np.searchsorted(mids, vectors[:, j]) * self.strides[j]
+        return idx
+
+    def decode(self, idx: np.ndarray) -> np.ndarray:
+        '''Configuration vectors of the integers `idx`.'''
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1)
+        vectors = np.empty((len(idx), len(self.levels)))
+        for j, level in enumerate(self.levels):
+            vectors[:, j] = level[idx // self.strides[j] % self.radix[j]]
+        return vectors
+
+    def configs(self, space, idx: np.ndarray) -> typing.List[DenseConfiguration]:
+        return [
+            DenseConfiguration(space, vector=vector)
+            for vector in self.decode(idx)
+        ]
+
+    def mark(self, idx: np.ndarray):
+        '''Mark the integers `idx` as evaluated.'''
+        for i in np.unique(np.asarray(idx, dtype=np.int64).reshape(-1)):
+            if self.evaluated[i]:
+                continue
+            self.evaluated[i] = True
+            # move the last unevaluated integer into the slot of i
+            self.n_remaining -= 1
+            p, last = self._pos[i], self._free[self.n_remaining]
+            self._free[p], self._pos[last] = last, p
+            self._free[self.n_remaining], self._pos[i] = i, self.n_remaining
+
+    def sample(self, n: int, rng: np.random.RandomState) -> np.ndarray:
+        '''`n` distinct unevaluated integers, uniformly at random.'''
+        if n > self.n_remaining:
+            raise ValueError('n {} > {} unevaluated configurations'.format(
+                n, self.n_remaining))
+        # partial Fisher-Yates shuffle of the unevaluated slice
+        for k in range(n):
+            j = rng.randint(k, self.n_remaining)
+            a, b = self._free[k], self._free[j]
+            self._free[k], self._free[j] = b, a
+            self._pos[b], self._pos[a] = k, j
+        return self._free[:n].astype(np.int64)
+
+    def remaining(self) -> np.ndarray:
+        '''All unevaluated integers, in increasing order.'''
+        return np.sort(self._free[:self.n_remaining]).astype(np.int64)
+
+    def copy(self):
+        other = object.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        for attr in ('evaluated', '_free', '_pos'):
+            setattr(other, attr, getattr(self, attr).copy())
+        return other
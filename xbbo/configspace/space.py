@@ -27,7 +27,7 @@ class Bin():
 
     def convert(self, array_dense, array_sparse):
         for i in range(len(self.src)):
-            array_sparse[self.src[i]] = np.searchsorted(self.bins[i], array_dense[self.trg[i]],side="right") - 1
+            array_sparse[..., self.src[i]] = np.searchsorted(self.bins[i], array_dense[..., self.trg[i]],side="right") - 1
         # array_sparse[self.src] = np.round(array_dense[self.trg]*(self.sizes-1))
         return array_sparse
     def invconvert(self, array_dense, array_sparse):
@@ -42,7 +42,7 @@ class Round():
         self.trg = trg
         self.sizes = sizes
     def convert(self, array_dense, array_sparse):
-        array_sparse[self.src] = np.round(array_dense[self.trg])
+        array_sparse[..., self.src] = np.round(array_dense[..., self.trg])
         return array_sparse
     def invconvert(self, array_dense, array_sparse):
         array_dense[self.trg] = array_sparse[self.src]
@@ -58,10 +58,10 @@ class OneHot():
         self.cats = list(zip(self.src.tolist(),self.trg.tolist(),self.sizes.tolist()))
     def convert(self, array_dense, array_sparse):
         for src_ind, trg_ind, size in self.cats:
-            tmp = array_dense[trg_ind:trg_ind + size]
+            tmp = array_dense[..., trg_ind:trg_ind + size]
             # ind_max = np.argmax(tmp) if tmp.any() else np.nan
-            ind_max = np.argmax(tmp)
-            array_sparse[src_ind] = ind_max
+            ind_max = np.argmax(tmp, axis=-1)
+            array_sparse[..., src_ind] = ind_max
         return array_sparse
     def invconvert(self,array_dense, array_sparse):
         choice = array_sparse[self.src] # conditional=>nan
@@ -77,7 +77,7 @@ class Num():
         self.src = src
         self.trg = trg
     def convert(self, array_dense, array_sparse):
-        array_sparse[self.src] = array_dense[self.trg]
+        array_sparse[..., self.src] = array_dense[..., self.trg]
         return array_sparse
     def invconvert(self, array_dense, array_sparse):
         array_dense[self.trg] = array_sparse[self.src]
@@ -87,11 +87,11 @@ class Num():
 
 class Const():
     def __init__(self, src, values) -> None:
-        self.src = src
+        self.src = np.array(src, dtype=np.uintp)
         # self.trg = trg
         self.values = np.array(values)
     def convert(self, array_dense, array_sparse):
-        array_sparse[self.src] = self.values
+        array_sparse[..., self.src] = self.values
         return array_sparse
     def invconvert(self, array_dense, array_sparse):
         # array_dense[self.trg] = array_sparse[self.src]
@@ -135,6 +135,17 @@ class DenseConfigurationSpace(CS.ConfigurationSpace):
 
         return [DenseConfiguration(self, values=config.get_dictionary()) for config in configs]
 
+    def dense_to_sparse(self, arrays_dense: np.ndarray) -> np.ndarray:
+        '''
+        Vectors (sparse arrays) of the rows of `arrays_dense`, i.e. a batched
+        ``DenseConfiguration.from_array``.
+        '''
+        arrays_dense = np.asarray(arrays_dense)
+        arrays_sparse = np.zeros(arrays_dense.shape[:-1] + (self.size_sparse, ))
+        for v in self.map.values():
+            arrays_sparse = v.convert(arrays_dense, arrays_sparse)
+        return arrays_sparse
+
     def get_bounds(self):
         dim = self.get_dimensions()
         lower = np.zeros(dim)
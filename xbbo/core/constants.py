@@ -13,5 +13,7 @@ class Key():
     BUDGET = "budget"
     EVAL_TIME = "eval_time"
     FUNC_VALUE = "function_value"
+    SURROGATE = "surrogate"
 
-    SUGGEST_INFO = "suggest_info"
\ No newline at end of file
+    SUGGEST_INFO = "suggest_info"
+    TRACE = "trace"
\ No newline at end of file
@@ -0,0 +1,156 @@
+'''
+Duplicate detection over encoded points.
+
+A point is a duplicate of a stored one if its discrete coordinates are
+equal and its continuous coordinates are close in the sense of
+``np.allclose(stored, point, rtol, atol)``. Points are hashed on a grid:
+discrete coordinates by their exact value, continuous ones by the cell of
+width `width` they fall in. A batch of candidates is hashed at once and
+tested against the sorted stored hashes with one ``searchsorted``; only
+hash hits (and the rare candidates whose tolerance box crosses a cell
+border, which probe the neighbouring cells) are compared coordinatewise.
+
+The stored points and their hashes are flat arrays. ``add`` only copies
+the points; they are hashed in one batch by the next lookup. Points added
+since the last sort are kept in an unsorted tail that is scanned directly
+and merged by a full re-sort once it outgrows an eighth of the index, so
+``add`` costs O(log n) amortized.
+'''
+import itertools
+import numpy as np
+
+_NAN_CELL = np.iinfo(np.int64).min
+
+
+class DuplicateIndex():
+    def __init__(self,
+                 dim: int,
+                 discrete: np.ndarray = None,
+                 rtol: float = 1e-5,
+                 atol: float = 1e-8,
+                 width: float = 2.**-7):
+        '''
+        discrete: bool array of length `dim`
+            Coordinates compared exactly, e.g. category indices. All others
+            are continuous.
+        width: float
+            Cell width of the continuous coordinates, much larger than the
+            tolerance so that few candidates fall near a cell border.
+        '''
+        self.dim = dim
+        self.discrete = np.zeros(dim, dtype=bool) if discrete is None \
+            else np.asarray(discrete, dtype=bool)
+        self.rtol = rtol
+        self.atol = atol
+        self.width = width
+        self._mult = np.random.RandomState(0).randint(
+            1, np.iinfo(np.int64).max, size=dim,
+            dtype=np.int64).view(np.uint64) | np.uint64(1)
+        self._X = np.empty((0, dim))
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._n = 0
+        self._n_hashed = 0  # points [:_n_hashed] have their hash computed
+        # hashes of the first _n_sorted points, sorted, and their point ids
+        self._n_sorted = 0
+        self._sorted = np.empty(0, dtype=np.uint64)
+        self._order = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return self._n
+
+    def _cells(self, X):
+        '''Cell of every coordinate of X.'''
+        cells = np.empty(X.shape, dtype=np.int64)
+        d, c = self.discrete, ~self.discrete
+        cells[:, d] = (X[:, d] + 0.).view(np.int64)  # exact, -0. == 0.
+        with np.errstate(invalid='ignore'):
+            cells[:, c] = np.floor(X[:, c] / self.width)
+        cells[np.isnan(X)] = _NAN_CELL
+        return cells
+
+    def _hash(self, cells):
+        h = (cells.view(np.uint64) * self._mult).sum(axis=1, dtype=np.uint64)
+        h ^= h >> np.uint64(31)
+        h *= np.uint64(0x9E3779B97F4A7C15)
+        return h ^ (h >> np.uint64(29))
+
+    def add(self, X: np.ndarray):
+        '''Store the rows of X.'''
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.dim)
+        if len(X) == 0:
+            return
+        n = self._n + len(X)
+        if n > len(self._X):
+            size = max(2 * len(self._X), n, 16)
+            X_, hashes_ = np.empty((size, self.dim)), np.empty(size, np.uint64)
+            X_[:self._n], hashes_[:self._n] = self._X[:self._n], self._hashes[:self._n]
+            self._X, self._hashes = X_, hashes_
+        self._X[self._n:n] = X
+        self._n = n
+
+    def _sync(self):
+        '''Hash the points added since the last lookup.'''
+        n = self._n
+        if self._n_hashed < n:
+            self._hashes[self._n_hashed:n] = self._hash(
+                self._cells(self._X[self._n_hashed:n]))
+            self._n_hashed = n
+        if n - self._n_sorted > max(256, n // 8):
+            self._order = np.argsort(self._hashes[:n], kind='stable')
+            self._sorted = self._hashes[self._order]
+            self._n_sorted = n
+
+    def _ids(self, h):
+        '''Ids of the stored points with hash `h`.'''
+        lo = np.searchsorted(self._sorted, h, side='left')
+        hi = np.searchsorted(self._sorted, h, side='right')
+        tail = np.flatnonzero(self._hashes[self._n_sorted:self._n] == h)
+        return np.concatenate([self._order[lo:hi], tail + self._n_sorted])
+
+    def _close(self, x, ids):
+        S = self._X[ids]
+        both_nan = np.isnan(S) & np.isnan(x)
+        close = np.where(self.discrete, S == x,
+                         np.abs(S - x) <= self.atol + self.rtol * np.abs(x))
+        return np.any(np.all(close | both_nan, axis=1))
+
+    def contains(self, X: np.ndarray) -> np.ndarray:
+        '''Whether every row of X is a duplicate of a stored point.'''
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.dim)
+        found = np.zeros(len(X), dtype=bool)
+        if self._n == 0 or len(X) == 0:
+            return found
+        self._sync()
+        tol = np.where(self.discrete, 0., self.atol + self.rtol * np.abs(X))
+        lo, hi = self._cells(X - tol), self._cells(X + tol)
+        single = np.all(lo == hi, axis=1)
+        # candidates whose tolerance box lies in one cell: one hash lookup
+        rows = np.flatnonzero(single)
+        hashes = self._hash(lo[rows])
+        tail = self._hashes[self._n_sorted:self._n]
+        if len(rows) * len(tail) <= 1 << 16:  # isin sorts, slow for few rows
+            hit = np.any(hashes[:, None] == tail, axis=1)
+        else:
+            hit = np.isin(hashes, tail)
+        if self._n_sorted:
+            pos = np.minimum(np.searchsorted(self._sorted, hashes),
+                             self._n_sorted - 1)
+            hit |= self._sorted[pos] == hashes
+        for i, h in zip(rows[hit], hashes[hit]):
+            found[i] = self._close(X[i], self._ids(h))
+        # the others probe every cell their tolerance box overlaps
+        for i in np.flatnonzero(~single):
+            ranges = [range(a, b + 1) for a, b in zip(lo[i], hi[i])]
+            for cell in itertools.product(*ranges):
+                ids = self._ids(self._hash(np.array([cell], dtype=np.int64))[0])
+                if len(ids) and self._close(X[i], ids):
+                    found[i] = True
+                    break
+        return found
+
+    def copy(self):
+        other = object.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other._X = self._X[:self._n].copy()
+        other._hashes = self._hashes[:self._n].copy()
+        return other
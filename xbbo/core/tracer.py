@@ -0,0 +1,165 @@
+'''
+Lightweight span tracer for the optimizer internals.
+
+Disabled by default. When disabled, `span(...)` returns a shared no-op
+context manager, so the instrumented code only pays one lookup.
+
+`span` records into the tracer activated in the current context (an
+optimizer created with ``trace=True`` activates its own tracer during its
+suggest/observe), else into the global `TRACER`.
+
+usage:
+    opt = BO(space, trace=True)
+    ... run the optimizer ...
+    opt.tracer.dump_chrome_trace('trace.json') # open with chrome://tracing or perfetto
+
+or, to trace every optimizer of the process:
+    from xbbo.core.tracer import TRACER
+    TRACER.enable()
+'''
+import collections
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span():
+    __slots__ = ('tracer', 'name', 'rows', 'args', 'start')
+
+    def __init__(self, tracer, name, rows, args):
+        self.tracer = tracer
+        self.name = name
+        self.rows = rows
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.tracer._record(
+            (self.name, self.start, end - self.start, threading.get_ident(),
+             self.rows, self.args))
+        return False
+
+
+class Tracer():
+    '''
+    Collects (name, start, duration, thread, rows, args) span records, the
+    last `max_records` of them.
+    '''
+    def __init__(self, enabled=False, max_records=100000):
+        self.enabled = enabled
+        self.records = collections.deque(maxlen=max_records)
+        self._n_records = 0  # ever recorded, also counts the dropped ones
+        self._t0 = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.records.clear()
+        self._n_records = 0
+        self._t0 = time.perf_counter()
+
+    def _record(self, record):
+        self.records.append(record)
+        self._n_records += 1
+
+    @contextlib.contextmanager
+    def activate(self):
+        '''Make `span` record into this tracer in the enclosed block.'''
+        token = _ACTIVE.set(self)
+        try:
+            yield self
+        finally:
+            _ACTIVE.reset(token)
+
+    def span(self, name, rows=None, **args):
+        '''
+        Time the enclosed block as span `name`. `rows` is the number of
+        items (points, configurations, trials) processed by the block.
+        '''
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, rows, args)
+
+    def mark(self):
+        '''Position to pass to `summary` to only aggregate later spans.'''
+        return self._n_records
+
+    def summary(self, since=0):
+        '''
+        Aggregate the spans recorded after `since` per name.
+
+        Returns
+        -------
+        dict: name -> {'calls': int, 'rows': int, 'time': float(s)}
+        '''
+        res = {}
+        start = max(0, len(self.records) - (self._n_records - since))
+        for name, _, dur, _, rows, _ in itertools.islice(
+                self.records, start, None):
+            s = res.get(name)
+            if s is None:
+                s = res[name] = {'calls': 0, 'rows': 0, 'time': 0.}
+            s['calls'] += 1
+            s['rows'] += rows or 0
+            s['time'] += dur
+        return res
+
+    def to_chrome_trace(self):
+        events = []
+        pid = os.getpid()
+        for name, start, dur, tid, rows, args in self.records:
+            event_args = dict(args)
+            if rows is not None:
+                event_args['rows'] = rows
+            events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': (start - self._t0) * 1e6,
+                'dur': dur * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': event_args
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump_chrome_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+TRACER = Tracer()
+_ACTIVE = contextvars.ContextVar('xbbo_tracer', default=TRACER)
+
+
+def current_tracer() -> Tracer:
+    return _ACTIVE.get()
+
+
+def span(name, rows=None, **args):
+    '''`Tracer.span` of the tracer active in the current context.'''
+    return _ACTIVE.get().span(name, rows, **args)
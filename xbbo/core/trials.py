@@ -1,11 +1,37 @@
+import copy
+import operator
+import weakref
+from collections.abc import Sequence
 from typing import Iterable
 import numpy as np
 import ConfigSpace as CS
 from xbbo.configspace.space import DenseConfiguration
+from xbbo.configspace.finite_index import FiniteSpaceIndex
+from xbbo.core.duplicate_index import DuplicateIndex
 from xbbo.core.constants import Key
 
 
+class _InStore():
+    '''Marks a field of a bound Trial that is stored in its Trials.'''
+    def __reduce__(self):
+        return '_IN_STORE'  # unpickles to the same singleton
+
+
+_IN_STORE = _InStore()
+
+
 class Trial:
+    '''
+    Once added to a ``Trials`` a trial is a handle onto its row there: the
+    configuration, its dict and the array are no longer held by the trial
+    but rebuilt from the columns of ``Trials`` when accessed. The array is
+    then a read-only view of the stored row.
+    '''
+    # __dict__ only for the optimizer-specific extra attributes (kwargs)
+    __slots__ = ('_configuration', '_config_dict', '_array', '_trials', '_row',
+                 'observe_value', 'time', 'origin', 'marker', 'info',
+                 '__dict__')
+
     def __init__(self,
                  configuration,
                  config_dict,
@@ -17,10 +43,12 @@ class Trial:
                  marker=None,
                  info: dict=None,
                  **kwargs) -> None:
-        self.config_dict = config_dict
-        self.array = array
+        self._config_dict = config_dict
+        self._array = array
         # self.sparse_array = sparse_array
-        self.configuration = configuration
+        self._configuration = configuration
+        self._trials = None
+        self._row = None
         self.observe_value = observe_value
         self.time = time
         self.origin = origin
@@ -29,6 +57,44 @@ class Trial:
         for k in kwargs:
             setattr(self, k, kwargs[k])
 
+    @property
+    def configuration(self):
+        if self._configuration is _IN_STORE:
+            return self._trials._config(self._row)
+        return self._configuration
+
+    @configuration.setter
+    def configuration(self, configuration):
+        self._configuration = configuration
+
+    @property
+    def config_dict(self):
+        if self._config_dict is _IN_STORE:
+            return self._trials._config(self._row).get_dictionary()
+        return self._config_dict
+
+    @config_dict.setter
+    def config_dict(self, config_dict):
+        self._config_dict = config_dict
+
+    @property
+    def array(self):
+        if self._array is _IN_STORE:
+            return _read_only(self._trials._his_array[self._row])
+        return self._array
+
+    @array.setter
+    def array(self, array):
+        self._array = array
+
+    def _bind(self, trials, row, array_stored):
+        self._trials = trials
+        self._row = row
+        self._configuration = _IN_STORE
+        self._config_dict = _IN_STORE
+        if array_stored:
+            self._array = _IN_STORE
+
     def add_observe_value(self, observe_value=None, obs_info=None):
         if obs_info is None:
             obs_info = {}
@@ -40,7 +106,52 @@ class Trial:
         self.observe_value = observe_value
 
 
+def _read_only(view):
+    view.setflags(write=False)  # a view, the stored rows stay writable
+    return view
+
+
+def _append_row(buf, n, row):
+    '''Write `row` at index `n` of the growable 2-d buffer `buf`.'''
+    row = np.ravel(row)
+    if buf is None:
+        buf = np.empty((16, len(row)))
+    elif n == len(buf):
+        grown = np.empty((2 * n, buf.shape[1]))
+        grown[:n] = buf[:n]
+        buf = grown
+    buf[n] = row
+    return buf
+
+
+class _Rows(Sequence):
+    '''Read-only list of `n` items, each built by `get(i)` on access.'''
+    def __init__(self, get, n):
+        self._get = get
+        self._n = n
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._get(j) for j in range(*i.indices(self._n))]
+        i = operator.index(i)
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError('trial index out of range')
+        return self._get(i)
+
+
 class Trials:
+    '''
+    History of the evaluated trials, stored by column: the configuration
+    vectors and the arrays are rows of growable matrices, the observed
+    values, markers and infos are lists. Configurations and their dicts
+    are rebuilt from the vectors on access; a configuration is shared
+    while referenced and released after.
+    '''
     def __init__(self, cs, dim):
         self.cs = cs
         # self._non_const_idx = []
@@ -48,13 +159,26 @@ class Trials:
         #     if not isinstance(hp, CS.Constant):
         #         self._non_const_idx.append(i)
         # self._non_const_idx = np.array(self._non_const_idx)
-        self._his_hash_configs_set = set()
-        self._his_configs_set = set()
-        self._his_configs = []
+        hps = cs.get_hyperparameters()
+        # integer vectors are canonicalized before hashing (many vectors map
+        # to one value); only floats are compared with a tolerance
+        self._int_hps = [(i, hp) for i, hp in enumerate(hps) if isinstance(
+            hp, CS.hyperparameters.IntegerHyperparameter)]
+        self._dup_index = DuplicateIndex(
+            len(hps),
+            discrete=[not isinstance(hp, CS.hyperparameters.FloatHyperparameter)
+                      for hp in hps])
+        self._his_vectors = None  # configuration vectors, rows [:trials_num]
         self._his_array = None #np.empty((0, dim))
+        self._n_array = 0  # rows of _his_array in use
+        # class and space the configurations are rebuilt with (of the first
+        # trial); configurations of another one are kept in _pinned
+        self._config_type = None
+        self._config_space = None
+        self._config_cache = weakref.WeakValueDictionary()
+        self._pinned = {}
         self.dim = dim
         self._his_observe_value = []
-        self._his_configs_dict = []
         self.best_observe_value = np.inf
         self.best_id = None
         self.trials_num = 0
@@ -63,32 +187,43 @@ class Trials:
         # self.run_id = 0
         # self.run_history = {}
         self.traj_history = []
+        self._space_index = None  # built by get_space_index, False if none
         # self.use_dense = use_dense
 
     def add_a_trial(self, trial: Trial, permit_duplicate=True):
-        hash_config = str(trial.configuration)+str(trial.info.get(Key.BUDGET, 'max_budget'))
+        row = self.trials_num
+        config = trial.configuration
+        vector = config.get_array()
+        canonical = self._canonical(vector)
         if not permit_duplicate:
-            assert hash_config not in self._his_hash_configs_set
+            assert not self._dup_index.contains(canonical)[0]
         self.infos.append(trial.info)
-        self._his_hash_configs_set.add(hash_config)
-        self._his_configs_set.add(trial.configuration)
-        self._his_configs.append(trial.configuration)
+        self._dup_index.add(canonical)
+        self._his_vectors = _append_row(self._his_vectors, row, vector)
+        if self._config_type is None:
+            self._config_type = type(config)
+            self._config_space = config.configuration_space
+        if type(config) is not self._config_type or \
+                config.configuration_space is not self._config_space:
+            self._pinned[row] = config
         self.traj_history.append(trial)
-        self._his_configs_dict.append(trial.config_dict)
         self._his_observe_value.append(trial.observe_value)
         self.markers.append(trial.marker)
+        if self._space_index:
+            self._space_index.mark(self._space_index.encode(vector))
         # if self.use_dense:
         #     assert trial.dense_array is not None
         # else:
         #     assert trial.sparse_array is not None
+        array_stored = False
         if trial.array is not None:
             # trial.array = np.atleast_2d(trial.array)
             # if self.dim != trial.array.shape[-1]:
             #     trial.array = (trial.array[...,self._non_const_idx])
-            if self._his_array is None:
-                self._his_array = np.empty((0,trial.array.shape[-1]))
-            self._his_array = np.vstack(
-                [self._his_array, trial.array])
+            array_stored = self._n_array == row
+            self._his_array = _append_row(self._his_array, self._n_array,
+                                          trial.array)
+            self._n_array += 1
         # if trial.sparse_array is not None:
         #     self._his_sparse_array = np.vstack(
         #         [self._his_sparse_array, trial.sparse_array])
@@ -97,16 +232,55 @@ class Trials:
             self.best_observe_value = obs
             self.best_id = self.trials_num
         self.trials_num += 1
+        trial._bind(self, row, array_stored)
+
+    def _config(self, row):
+        config = self._pinned.get(row)
+        if config is None:
+            config = self._config_cache.get(row)
+        if config is None:
+            config = self._config_type(self._config_space,
+                                       vector=self._his_vectors[row].copy())
+            self._config_cache[row] = config
+        return config
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_config_cache']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._config_cache = weakref.WeakValueDictionary()
+
+    @property
+    def _his_configs(self):
+        return _Rows(self._config, self.trials_num)
+
+    @property
+    def _his_configs_dict(self):
+        # every access of an item rebuilds the configuration (unless still
+        # referenced) and its dict, use get_vectors/get_array in loops
+        return _Rows(lambda row: self._config(row).get_dictionary(),
+                     self.trials_num)
+
+    def get_vectors(self):
+        '''
+        Read-only matrix of the configuration vectors
+        ``config.get_array()``, one row per trial.
+        '''
+        if self.trials_num == 0:
+            return np.empty((0, self._dup_index.dim))
+        return _read_only(self._his_vectors[:self.trials_num])
 
     def get_array(self):
-        if  self._his_array is not None and len(self._his_array) == self.trials_num:
-            return self._his_array
+        if self.trials_num and self._n_array == self.trials_num:
+            return _read_only(self._his_array[:self._n_array])
         if self.trials_num == 0:
             return None
-        self._his_array = [
+        return [
             config.get_array(sparse=False) for config in self._his_configs
         ]
-        return self._his_array
 
     # def get_sparse_array(self):
     #     if len(self._his_sparse_array) == self.trials_num:
@@ -116,12 +290,84 @@ class Trials:
     #     ]
     #     return self._his_sparse_array
 
+    def snapshot(self):
+        '''
+        Shallow copy that is not affected by later `add_a_trial` calls, so it
+        can be read from another thread.
+        '''
+        other = copy.copy(self)
+        # rows below trials_num of the shared buffers are never rewritten
+        for attr in ('_his_observe_value', 'markers', 'infos',
+                     'traj_history'):
+            setattr(other, attr, list(getattr(self, attr)))
+        other._config_cache = weakref.WeakValueDictionary()
+        other._pinned = dict(self._pinned)
+        other._dup_index = self._dup_index.copy()
+        if self._space_index:
+            other._space_index = self._space_index.copy()
+        return other
+
     def add_trials(self, trials):
         for trial in trials._traj_history:
             self.add_a_trial(trial)
 
+    def _canonical(self, X) -> np.ndarray:
+        X = np.array(X, dtype=np.float64).reshape(-1, self._dup_index.dim)
+        for i, hp in self._int_hps:
+            active = ~np.isnan(X[:, i])
+            X[active, i] = hp._inverse_transform(hp._transform(X[active, i]))
+        return X
+
+    def _vectors(self, configs) -> np.ndarray:
+        return self._canonical([config.get_array() for config in configs])
+
+    def contains(self, configs) -> np.ndarray:
+        '''
+        Whether each of `configs` (configurations, or a matrix of their
+        vectors ``config.get_array()``) was evaluated, at any budget.
+        '''
+        X = self._canonical(configs) if isinstance(
+            configs, np.ndarray) else self._vectors(configs)
+        return self._dup_index.contains(X)
+
     def is_contain(self, config: DenseConfiguration) -> bool:
-        return config in self._his_hash_configs_set
+        return bool(self.contains([config])[0])
+
+    def sample_unseen(self, space, num, exclude=(), max_rounds=1000):
+        '''
+        Up to `num` pairwise different configurations of `space` that were
+        not evaluated and are not in `exclude`. Each round samples only the
+        missing number and filters them with one ``contains`` call; sampling
+        stops early after `max_rounds` rounds in a row that add nothing.
+        '''
+        configs = []
+        keys = {x.tobytes() for x in self._vectors(exclude)} if exclude else set()
+        stale = 0
+        while len(configs) < num and stale < max_rounds:
+            candidates = space.sample_configuration(size=num - len(configs))
+            X = self._vectors(candidates)
+            seen = self._dup_index.contains(X)
+            n_before = len(configs)
+            for config, x, s in zip(candidates, X, seen):
+                key = x.tobytes()
+                if not s and key not in keys:
+                    keys.add(key)
+                    configs.append(config)
+            stale = 0 if len(configs) > n_before else stale + 1
+        return configs
+
+    def get_space_index(self):
+        '''
+        ``FiniteSpaceIndex`` of the space with the evaluated configurations
+        (at any budget) marked, or None if the space is not small and finite.
+        '''
+        if self._space_index is None:
+            self._space_index = FiniteSpaceIndex.from_space(self.cs) or False
+            if self._space_index and self.trials_num:
+                self._space_index.mark(
+                    self._space_index.encode(
+                        self._his_vectors[:self.trials_num]))
+        return self._space_index or None
 
     def is_empty(self, ):
         return self.trials_num == 0
@@ -133,6 +379,10 @@ class Trials:
         return self.best_observe_value, self._his_configs_dict[self.best_id]
 
     def get_history(self):
+        '''
+        Observed values and the lazy sequence of configuration dicts, each
+        dict is rebuilt when indexed.
+        '''
         return self._his_observe_value, self._his_configs_dict
     
     # def get_array(self):
@@ -1,4 +1,5 @@
 from collections import OrderedDict
+import hashlib
 import typing
 import numpy as np
 from ConfigSpace.hyperparameters import NumericalHyperparameter, \
@@ -7,10 +8,36 @@ from ConfigSpace.hyperparameters import NumericalHyperparameter, \
 from xbbo.configspace.space import DenseConfiguration, DenseConfigurationSpace, deactivate_inactive_hyperparameters
 
 
+_DESIGN_CACHE = OrderedDict()
+_DESIGN_CACHE_SIZE = 64
+
+
+def _unique_rows(vectors: np.ndarray) -> np.ndarray:
+    '''Rows of `vectors` without (bitwise) duplicates, in order of first occurrence.'''
+    vectors = np.ascontiguousarray(vectors, dtype=np.float64)
+    if len(vectors) == 0:
+        return vectors
+    rows = vectors.view(np.dtype((np.void, vectors.dtype.itemsize * vectors.shape[1])))
+    _, idx = np.unique(rows.ravel(), return_index=True)
+    return vectors[np.sort(idx)]
+
+
+def space_fingerprint(cs: DenseConfigurationSpace) -> str:
+    '''Hash of the hyperparameters, conditions and encodings of `cs`.'''
+    return hashlib.sha1('{}|{}|{}'.format(cs, cs.encoding_cat,
+                                          cs.encoding_ord).encode()).hexdigest()
+
+
 class InitialDesign:
     '''
     reference: https://github.com/automl/SMAC3/blob/master/xbbo/initial_design/initial_design.py
+
+    Designs generate the vectors (sparse arrays) of their configurations with
+    `_select_vectors`, which are deduplicated as arrays before any configuration is built.
+    Random designs are memoized per (space fingerprint, design, size, seed) in a
+    process-wide cache, so repeats of an optimizer do not recompute them.
     '''
+    origin = None
     def __init__(self,
                  cs: DenseConfigurationSpace,
                  rng: np.random.RandomState,
@@ -33,47 +60,63 @@ class InitialDesign:
                         (max_config_fracs * ta_run_limit))))
 
     def select_configurations(self) -> typing.List[DenseConfiguration]:
-        self.configs = self._select_configurations()
-        self.configs = list(OrderedDict.fromkeys(self.configs))
+        try:
+            vectors = self._select_vectors()
+        except NotImplementedError:  # design without an array form
+            self.configs = list(OrderedDict.fromkeys(
+                self._select_configurations()))
+        else:
+            self.configs = self._vectors_to_configs(vectors)
         return self.configs
 
+    def iter_configurations(self, batch_size: int = 1024
+                            ) -> typing.Iterator[DenseConfiguration]:
+        '''Lazily yield the (deduplicated) configurations of the full design.'''
+        seen = set()
+        for vectors in self._iter_vectors(batch_size):
+            for vector in _unique_rows(vectors):
+                key = vector.tobytes()
+                if key not in seen:
+                    seen.add(key)
+                    yield self._vector_to_config(vector)
+
     def _select_configurations(self, num=None) -> typing.List[DenseConfiguration]:
+        return self._vectors_to_configs(self._select_vectors(num))
+
+    def _select_vectors(self, num=None) -> np.ndarray:
+        '''Vectors (rows, possibly with duplicates) of the design.'''
         raise NotImplementedError
 
+    def _iter_vectors(self, batch_size: int) -> typing.Iterator[np.ndarray]:
+        yield self._select_vectors()
+
+    def _cached(self, key: tuple, fn):
+        '''Memoized `fn()` for this design on this space, `key` holds size and seed.'''
+        key = (space_fingerprint(self.cs), type(self).__name__) + key
+        if key in _DESIGN_CACHE:
+            _DESIGN_CACHE.move_to_end(key)
+            return _DESIGN_CACHE[key]
+        value = fn()
+        _DESIGN_CACHE[key] = value
+        if len(_DESIGN_CACHE) > _DESIGN_CACHE_SIZE:
+            _DESIGN_CACHE.popitem(last=False)
+        return value
+
+    def _vector_to_config(self, vector: np.ndarray) -> DenseConfiguration:
+        conf = DenseConfiguration(self.cs, vector=vector)
+        conf.origin = self.origin
+        return conf
+
+    def _vectors_to_configs(
+            self, vectors: np.ndarray) -> typing.List[DenseConfiguration]:
+        return [self._vector_to_config(v) for v in _unique_rows(vectors)]
+
     def _transform_continuous_designs(
             self, design: np.ndarray, origin: str,
             cs: DenseConfigurationSpace) -> typing.List[DenseConfiguration]:
-
-        # params = cs.get_hyperparameters()
-        # for idx, param in enumerate(params):
-        #     if isinstance(param, NumericalHyperparameter):
-        #         continue
-        #     elif isinstance(param, Constant):
-        #         # add a vector with zeros
-        #         design_ = np.zeros(np.array(design.shape) + np.array((0, 1)))
-        #         design_[:, :idx] = design[:, :idx]
-        #         design_[:, idx + 1:] = design[:, idx:]
-        #         design = design_
-        #     elif isinstance(param, CategoricalHyperparameter):
-        #         v_design = design[:, idx]
-        #         v_design[v_design == 1] = 1 - 10**-10
-        #         design[:, idx] = np.array(v_design * len(param.choices),
-        #                                   dtype=np.int)
-        #     elif isinstance(param, OrdinalHyperparameter):
-        #         v_design = design[:, idx]
-        #         v_design[v_design == 1] = 1 - 10**-10
-        #         design[:, idx] = np.array(v_design * len(param.sequence),
-        #                                   dtype=np.int)
-        #     else:
-        #         raise ValueError("Hyperparameter not supported in LHD")
-
         configs = []
-        for vector in design:
-            conf = DenseConfiguration.from_array(cs, vector)
-            # conf = deactivate_inactive_hyperparameters(configuration=None,
-            #                                            configuration_space=cs,
-            #                                            vector=vector)
+        for vector in _unique_rows(cs.dense_to_sparse(design)):
+            conf = DenseConfiguration(cs, vector=vector)
             conf.origin = origin
             configs.append(conf)
-
         return configs
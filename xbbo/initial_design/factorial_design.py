@@ -1,20 +1,28 @@
 # License: 3-clause BSD
 # Copyright (c) 2016-2018, Ml4AAD Group (http://www.ml4aad.org/)
 
-import itertools
+import logging
+import typing
 
 from ConfigSpace.hyperparameters import Constant, NumericalHyperparameter, \
     CategoricalHyperparameter, OrdinalHyperparameter
 import numpy as np
 
 
-from xbbo.configspace.space import DenseConfiguration, deactivate_inactive_hyperparameters
-from xbbo.initial_design.base import InitialDesign
+from xbbo.configspace.space import deactivate_inactive_hyperparameters
+from xbbo.initial_design.base import InitialDesign, _unique_rows
+
+logger = logging.getLogger(__name__)
 
 
 class FactorialInitialDesign(InitialDesign):
     """Factorial initial design
 
+    The default configuration, the middle of the space and the corners of the
+    (bounds / choices) grid. The corners are enumerated lazily in blocks of
+    vectors, so `select_configurations` only builds the first `init_budget`
+    of them and `iter_configurations` streams the full design.
+
     Attributes
     ----------
     configs : typing.List[Configuration]
@@ -22,16 +30,10 @@ class FactorialInitialDesign(InitialDesign):
         Don't pass configs to the constructor;
         otherwise factorial design is overwritten
     """
-    def _select_configurations(self, num=None) -> DenseConfiguration:
-        """Selects a single configuration to run
+    origin = "Factorial Design"
 
-        Returns
-        -------
-        config: Configuration
-            initial incumbent configuration
-        """
+    def _levels(self):
         params = self.cs.get_hyperparameters()
-
         values = []
         mid = []
         for param in params:
@@ -49,24 +51,67 @@ class FactorialInitialDesign(InitialDesign):
                 length = len(param.sequence)
                 mid.append(param.sequence[int(length / 2)])
             values.append(v)
+        # vector value of every level
+        levels = [
+            np.array([param._inverse_transform(x) for x in v], dtype=float)
+            for param, v in zip(params, values)
+        ]
+        middle = np.array(
+            [param._inverse_transform(x) for param, x in zip(params, mid)],
+            dtype=float)
+        return levels, middle
 
-        factorial_design = itertools.product(*values)
+    def _deactivate(self, vectors: np.ndarray) -> np.ndarray:
+        if not self.cs.get_conditions():
+            return vectors
+        params = self.cs.get_hyperparameters()
+        return np.array([
+            deactivate_inactive_hyperparameters(
+                dict([(p.name, p._transform(x))
+                      for p, x in zip(params, vector)]), self.cs).get_array()
+            for vector in vectors
+        ])
 
-        self.logger.debug("Initial Design")
-        configs = [self.cs.get_default_configuration()]
-        # add middle point in space
-        conf_dict = dict([(p.name, v) for p, v in zip(params, mid)])
-        middle_conf = deactivate_inactive_hyperparameters(conf_dict, self.cs)
-        configs.append(middle_conf)
+    def _corners(self, levels, start, stop) -> np.ndarray:
+        # mixed-radix digits of the corner index, last parameter fastest
+        # (the order of itertools.product)
+        idx = np.arange(start, stop)
+        vectors = np.empty((len(idx), len(levels)))
+        for j in range(len(levels) - 1, -1, -1):
+            idx, digit = np.divmod(idx, len(levels[j]))
+            vectors[:, j] = levels[j][digit]
+        return self._deactivate(vectors)
 
+    def _iter_vectors(self, batch_size: int,
+                      num=None) -> typing.Iterator[np.ndarray]:
+        levels, middle = self._levels()
+        # default and middle point in space
+        yield np.concatenate([
+            self.cs.get_default_configuration().get_array()[None],
+            self._deactivate(middle[None])
+        ])
         # add corner points
-        for design in factorial_design:
-            conf_dict = dict([(p.name, v) for p, v in zip(params, design)])
-            conf = deactivate_inactive_hyperparameters(conf_dict, self.cs)
-            conf.origin = "Factorial Design"
-            configs.append(conf)
-            self.logger.debug(conf)
-        size = len(configs)
-        self.logger.debug("Size of factorial design: %d" % (size))
-        self.init_budget = size
-        return configs
+        size = int(np.prod([len(l) for l in levels], dtype=object))
+        size = size if num is None else min(size, num)
+        for start in range(0, size, batch_size):
+            yield self._corners(levels, start, min(start + batch_size, size))
+
+    def _select_vectors(self, num=None) -> np.ndarray:
+        """Vectors of the first `num` (or `init_budget`) configurations
+
+        Returns
+        -------
+        vectors: np.ndarray
+            sparse arrays of the configurations
+        """
+        design_num = num if num else self.init_budget
+
+        def design():
+            vectors = np.concatenate(
+                list(self._iter_vectors(1024, num=design_num)))
+            return _unique_rows(vectors)[:design_num]
+
+        vectors = self._cached((design_num, ), design)
+        logger.debug("Size of factorial design: %d" % (len(vectors)))
+        self.init_budget = len(vectors)
+        return vectors
@@ -3,12 +3,12 @@
 
 import typing
 
+import numpy as np
 from scipy.stats.qmc import LatinHypercube
 
 from ConfigSpace.hyperparameters import Constant
 
 
-from xbbo.configspace.space import DenseConfiguration
 from xbbo.initial_design.base import InitialDesign
 from xbbo.core.constants import MAXINT
 
@@ -23,24 +23,21 @@ class LHDesign(InitialDesign):
         otherwise factorial design is overwritten
     """
 
-    def _select_configurations(self, num=None) -> typing.List[DenseConfiguration]:
-        """Selects a single configuration to run
+    origin = 'LHD'
+
+    def _select_vectors(self, num=None) -> np.ndarray:
+        """Vectors of the design
 
         Returns
         -------
-        config: Configuration
-            initial incumbent configuration
+        vectors: np.ndarray
+            sparse arrays of the configurations
         """
         design_num = num if num else self.init_budget
-        dim = self.cs.get_dimensions(sparse=True)
-
-        # constants = 0
-        # for p in params:
-        #     if isinstance(p, Constant):
-        #         constants += 1
+        seed = self.rng.randint(0, MAXINT)
 
-        lhd = LatinHypercube(d=dim, seed=self.rng.randint(0, MAXINT)).random(n=design_num)
+        def design():
+            lhd = LatinHypercube(d=self.dim, seed=seed).random(n=design_num)
+            return self.cs.dense_to_sparse(lhd)
 
-        return self._transform_continuous_designs(design=lhd,
-                                                  origin='LHD',
-                                                  cs=self.cs)
+        return self._cached((design_num, seed), design)
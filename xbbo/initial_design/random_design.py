@@ -1,26 +1,37 @@
 # License: 3-clause BSD
 # Copyright (c) 2016-2018, Ml4AAD Group (http://www.ml4aad.org/)
 
-from typing import List
+import hashlib
+
+import numpy as np
 
 from xbbo.initial_design.base import InitialDesign
-from xbbo.configspace.space import DenseConfiguration
 
 class RandomDesign(InitialDesign):
     """Initial design that evaluates random configurations."""
+    origin = 'Random initial design.'
+
+    def _select_vectors(self, num=None) -> np.ndarray:
+        """Vectors of random configurations.
 
-    def _select_configurations(self, num=None) -> List[DenseConfiguration]:
-        """Select a random configuration.
+        They are sampled from (and cached per state of) the space's own random
+        stream, which is left in the same state on a cache hit.
 
         Returns
         -------
-        config: Configuration()
-            Initial incumbent configuration
+        vectors: np.ndarray
+            sparse arrays of the configurations
         """
         design_num = num if num else self.init_budget
-        configs = self.cs.sample_configuration(size=design_num)
-        if design_num == 1:
-            configs = [configs]
-        for config in configs:
-            config.origin = 'Random initial design.'
-        return configs
+        state = self.cs.random.get_state()
+        seed = hashlib.sha1(state[1].tobytes() +
+                            repr(state[2:]).encode()).hexdigest()
+
+        def design():
+            configs = self.cs.sample_configuration(size=design_num)
+            return np.array([config.get_array() for config in configs
+                             ]), self.cs.random.get_state()
+
+        vectors, state = self._cached((design_num, seed), design)
+        self.cs.random.set_state(state)
+        return vectors
@@ -5,7 +5,6 @@ import typing
 from scipy.stats.qmc import Sobol
 import numpy as np
 
-from xbbo.configspace.space import DenseConfiguration
 from xbbo.initial_design.base import InitialDesign
 from xbbo.core.constants import MAXINT
 
@@ -27,19 +26,21 @@ class SobolDesign(InitialDesign):
         if self.init_budget:
             self.init_budget = 2**int(np.log2(self.init_budget))
 
-    def _select_configurations(self, num=None) -> typing.List[DenseConfiguration]:
-        """Selects a single configuration to run
+    origin = 'Sobol'
+
+    def _select_vectors(self, num=None) -> np.ndarray:
+        """Vectors of the design
 
         Returns
         -------
-        config: Configuration
-            initial incumbent configuration
+        vectors: np.ndarray
+            sparse arrays of the configurations
         """
         design_num = num if num else self.init_budget
-        sobol_gen = Sobol(d=self.dim,
-                          scramble=True,
-                          seed=self.rng.randint(low=0, high=MAXINT))
-        sobol = sobol_gen.random(design_num)
-        return self._transform_continuous_designs(design=sobol,
-                                                  origin='Sobol',
-                                                  cs=self.cs)
\ No newline at end of file
+        seed = self.rng.randint(low=0, high=MAXINT)
+
+        def design():
+            sobol_gen = Sobol(d=self.dim, scramble=True, seed=seed)
+            return self.cs.dense_to_sparse(sobol_gen.random(design_num))
+
+        return self._cached((design_num, seed), design)
\ No newline at end of file
@@ -1,5 +1,9 @@
 from abc import abstractmethod
+import json
 import os
+import shutil
+import tempfile
+from collections import OrderedDict
 from enum import Enum
 from typing import Tuple, List, Callable
 import numpy as np
@@ -12,6 +16,7 @@ from ConfigSpace.hyperparameters import \
     CategoricalHyperparameter, UniformFloatHyperparameter, UniformIntegerHyperparameter
 from xbbo.core.constants import MAXINT, Key
 from xbbo.problem.base import AbstractBenchmark
+from xbbo.utils.util import create_rng
 
 class BenchName(Enum):
     TST = 0
@@ -21,24 +26,150 @@ class BenchName(Enum):
     Table_xgboost = 3
     Table_nas102 = 4
 
+class TaskStore():
+    '''
+    Memory-mappable binary layout of a meta-dataset.
+
+    The rows of all tasks are concatenated into ``X.npy`` and ``y.npy``;
+    ``index.json`` holds the task names, their row offsets, a signature of
+    the source files and loader-specific metadata. Opening maps the arrays
+    copy-on-write, so only the pages of the tasks that are sliced are read.
+    '''
+    def __init__(self, names: List[str], X: np.ndarray, y: np.ndarray,
+                 offsets: List[int], meta: dict, signature=None):
+        self.names = list(names)
+        self.X = X
+        self.y = y
+        self.meta = meta
+        self.signature = signature
+        self._offsets = dict(zip(self.names, zip(offsets[:-1], offsets[1:])))
+
+    @classmethod
+    def open(cls, path: str) -> 'TaskStore':
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        return cls(index['tasks'],
+                   np.load(os.path.join(path, 'X.npy'), mmap_mode='c'),
+                   np.load(os.path.join(path, 'y.npy'), mmap_mode='c'),
+                   index['offsets'], index['meta'], index['signature'])
+
+    def __getitem__(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self._offsets[name]
+        return self.X[start:end], self.y[start:end]
+
+    def write(self, path: str):
+        offsets = [0]
+        for name in self.names:
+            offsets.append(self._offsets[name][1])
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+        np.save(os.path.join(tmp, 'X.npy'), np.asarray(self.X, dtype=np.float64))
+        np.save(os.path.join(tmp, 'y.npy'), np.asarray(self.y, dtype=np.float64))
+        with open(os.path.join(tmp, 'index.json'), 'w') as f:
+            json.dump({'signature': self.signature, 'tasks': self.names,
+                       'offsets': offsets, 'meta': self.meta}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.rename(tmp, path)
+        except OSError:  # written concurrently by another process
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @staticmethod
+    def source_signature(source: str, settings: dict):
+        '''Sizes and modification times of the source file(s) + settings.'''
+        if os.path.isdir(source):
+            files = []
+            for name in sorted(os.listdir(source)):
+                st = os.stat(os.path.join(source, name))
+                files.append([name, st.st_size, st.st_mtime_ns])
+        else:
+            st = os.stat(source)
+            files = [st.st_size, st.st_mtime_ns]
+        return {'source': files, 'settings': settings}
+
+
 class TransferData():
-    def __init__(self, bench_name:int, data_path_root:str, data_base_name:str, target_task_name:str) -> None:
+    def __init__(self, bench_name:int, data_path_root:str, data_base_name:str, target_task_name:str, binary_cache=True, source_task_names=None) -> None:
+        '''
+        binary_cache: bool
+            Preprocess the meta-dataset once into a `TaskStore` next to it
+            ("<data_path>.npcache") and load it from there afterwards.
+        source_task_names: list
+            Only load these source tasks. None loads all but the target.
+        '''
         self.bench_name = bench_name
         self.data_base_name = data_base_name
         self.data_path_root = data_path_root
         self.target_task_name = target_task_name
-    
+        self.binary_cache = binary_cache
+        self.source_task_names = source_task_names
+
     def load_data(self,):
-        key = str(self.__class__) + "_" + self.target_task_name
-        res = CACHE_DATA.get(key, False)
-        if res:
+        key = (str(self.__class__), self.data_path, self.target_task_name,
+               tuple(self.source_task_names or ()),
+               json.dumps(self._store_settings(), sort_keys=True),
+               self.min_max_features)
+        res = CACHE_DATA.get(key)
+        if res is not None:
             return res
-        CACHE_DATA[key] = self._load_data()
-        return CACHE_DATA[key]
+        res = self._load_data()
+        CACHE_DATA.put(key, res)
+        return res
 
     def _load_data(self):
         pass
-    
+
+    def _store_settings(self):
+        '''Loader arguments the preprocessed tasks depend on.'''
+        return {}
+
+    def _build_tasks(self):
+        '''Parse the raw meta-dataset: (names, [X], [y], meta).'''
+        raise NotImplementedError()
+
+    def _open_tasks(self) -> TaskStore:
+        if not os.path.exists(self.data_path):
+            assert self.download, 'ERROR: "{}" not exits.'.format(self.data_path)
+            self.download_data()
+        path = self.data_path.rstrip('/\\') + '.npcache'
+        signature = TaskStore.source_signature(self.data_path, self._store_settings())
+        if self.binary_cache and os.path.exists(
+                os.path.join(path, 'index.json')):
+            store = TaskStore.open(path)
+            if store.signature == signature:
+                return store
+        names, Xs, ys, meta = self._build_tasks()
+        X_all = np.vstack(Xs)
+        meta['x_min'] = X_all.min(axis=0).tolist()
+        meta['x_max'] = X_all.max(axis=0).tolist()
+        offsets = np.cumsum([0] + [len(X) for X in Xs]).tolist()
+        store = TaskStore(names, X_all, np.vstack(ys), offsets, meta,
+                          signature)
+        if self.binary_cache:
+            store.write(path)
+            return TaskStore.open(path)
+        return store
+
+    def _split_tasks(self, store: TaskStore):
+        '''Source tasks and target task, min-max scaled over all tasks.'''
+        assert self.target_task_name in store.names
+        sources = self.source_task_names or [
+            name for name in store.names if name != self.target_task_name
+        ]
+        if self.min_max_features:
+            x_min = np.asarray(store.meta['x_min'])
+            scale = np.asarray(store.meta['x_max']) - x_min
+            scale[scale == 0] = 1
+            transform = lambda X: (X - x_min) / scale
+        else:
+            transform = lambda X: X
+        Xs, ys = [], []
+        for name in sources:
+            X, y = store[name]
+            Xs.append(transform(X))
+            ys.append(y)
+        X, y = store[self.target_task_name]
+        return Xs, ys, transform(X), y
+
     def get_configuration_space(self,):
         pass
     
@@ -50,13 +181,38 @@ class TransferData():
     def hp_names(self,):
         return None
 
-# prevent duplicate load data
-CACHE_DATA = {}
+
+class _LRUCache():
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# prevent duplicate load data (least recently used loads are dropped)
+CACHE_DATA = _LRUCache(max_size=8)
 
 
 class TST_Data(TransferData):
-    def __init__(self, bench_name:int,data_path_root:str, data_base_name:str,target_task_name:str, download=True, sparse=False, hp_num=3,min_max_features=False, rng=np.random.RandomState(), **kwargs) -> None:
-        super().__init__(bench_name,data_path_root, data_base_name, target_task_name)
+    def __init__(self, bench_name:int,data_path_root:str, data_base_name:str,target_task_name:str, download=True, sparse=False, hp_num=3,min_max_features=False, rng=np.random.RandomState(), binary_cache=True, source_task_names=None, **kwargs) -> None:
+        super().__init__(bench_name,data_path_root, data_base_name, target_task_name, binary_cache=binary_cache, source_task_names=source_task_names)
         self.data_path = os.path.join(self.data_path_root, data_base_name)
         self.min_max_features = min_max_features
         self.sparse = sparse
@@ -67,9 +223,12 @@ class TST_Data(TransferData):
         self.hp_keys = ['C', 'gamma', 'd']
         
     def _load_data(self):
-        if not os.path.exists(self.data_path):
-            assert self.download, 'ERROR: "{}" not exits.'.format(self.data_path)
-            self.download_data()
+        return tuple(self._split_tasks(self._open_tasks()))
+
+    def _store_settings(self):
+        return {'sparse': self.sparse, 'hp_num': self.hp_num}
+
+    def _build_tasks(self):
         file_lists = os.listdir(self.data_path)
         file_lists = list(map(lambda x: os.path.join(self.data_path,x), file_lists))
         datasets_hp = []
@@ -107,16 +266,7 @@ class TST_Data(TransferData):
             datasets_label[-1] = datasets_label[-1][mask]
             # if True:
             #     datasets_label[-1] = datasets_label[-1]
-        if self.min_max_features:
-            # min-max scaling of input features
-            from sklearn.preprocessing import MinMaxScaler
-            scaler = MinMaxScaler().fit(np.vstack(datasets_hp))
-            datasets_hp = [scaler.transform(X) for X in datasets_hp]
-        test_idx = filenames.index(self.target_task_name)
-        test_task = datasets_hp.pop(test_idx)
-        test_task_label = datasets_label.pop(test_idx)
-        
-        return (datasets_hp, datasets_label, test_task, test_task_label)
+        return filenames, datasets_hp, datasets_label, {}
 
     def get_configuration_space(self):
         if hasattr(self, "configuration_space"):
@@ -181,8 +331,8 @@ class Table_Data(TransferData):
         BenchName.Table_xgboost: 'metric_error',
     }
     
-    def __init__(self, bench_name:int,data_path_root:str, data_base_name:str, target_task_name:str, download=True, sparse=False, hp_num=3,min_max_features=False, rng=np.random.RandomState(), **kwargs) -> None:
-        super().__init__(bench_name,data_path_root, data_base_name, target_task_name)
+    def __init__(self, bench_name:int,data_path_root:str, data_base_name:str, target_task_name:str, download=True, sparse=False, hp_num=3,min_max_features=False, rng=np.random.RandomState(), binary_cache=True, source_task_names=None, **kwargs) -> None:
+        super().__init__(bench_name,data_path_root, data_base_name, target_task_name, binary_cache=binary_cache, source_task_names=source_task_names)
         self.data_base_name = data_base_name
         self.data_path = os.path.join(data_path_root, data_base_name)
         self.min_max_features = min_max_features
@@ -194,12 +344,23 @@ class Table_Data(TransferData):
         self._metric_col = self.error_metric[bench_name]
         
     def _load_data(self):
-        if not os.path.exists(self.data_path):
-            assert self.download, 'ERROR: "{}" not exits.'.format(self.data_path)
-            self.download_data()
+        Xs, ys, X, y = self._split_tasks(self._open_tasks())
+        L = [Xs, ys]
+        L.extend((X, y))
+        return L
+
+    def load_data(self):
+        res = super().load_data()
+        # also set when the result comes from CACHE_DATA
+        self.hp_keys = [f'hp_{i}' for i in range(res[2].shape[1])]
+        return res
+
+    def _store_settings(self):
+        return {'bench_name': self.bench_name.name}
+
+    def _build_tasks(self):
         df = pd.read_csv(self.data_path)
 
-        assert self.target_task_name in df.task.unique()
         assert self._metric_col in df.columns
 
         Xy_dict = {}
@@ -224,19 +385,9 @@ class Table_Data(TransferData):
                 X_features = enc.transform(X)
                 Xy_dict[task] = X_features, y
 
-        if self.min_max_features:
-            # min-max scaling of input features
-            from sklearn.preprocessing import MinMaxScaler
-            X = np.vstack([X for (X, y) in Xy_dict.values()])
-            scaler = MinMaxScaler().fit(X)
-            Xy_dict = {t: (scaler.transform(X), y) for (t, (X, y)) in Xy_dict.items()}
-
-        Xys_train = [Xy_dict[t] for t in df.task.unique() if t != self.target_task_name]
-        Xy_test = Xy_dict[self.target_task_name]
-        self.hp_keys = [f'hp_{i}' for i in range(Xy_test[0].shape[1])]
-        L = list(zip(*Xys_train))
-        L.extend(Xy_test)
-        return L
+        names = list(df.task.unique())
+        Xs, ys = zip(*[Xy_dict[t] for t in names])
+        return names, list(Xs), list(ys), {}
 
     def get_configuration_space(self):
         if hasattr(self, "configuration_space"):
@@ -263,8 +414,9 @@ class TransferBenchmark(AbstractBenchmark):
         self.target_task_name = target_task_name
         self.normalize_y = normalize_y
         self.data_path_root = data_path_root
-        super().__init__(rng)
-        
+        # the configuration space is only known after loading the data
+        self.rng = create_rng(rng)
+
         if bench_name == BenchName.TST:
             self.data_loader = TST_Data(bench_name=bench_name,data_path_root=data_path_root, data_base_name=data_base_name,target_task_name=target_task_name, rng=self.rng,**kwargs)
             # self.old_D_x, self.old_D_y, self.new_D_x, self.new_D_y, self.hp_config = 
@@ -277,6 +429,7 @@ class TransferBenchmark(AbstractBenchmark):
             self.old_D_y = [(y - y.min())/(y.max()-y.min()) for y in self.old_D_y]
 
         self._old_D_x, self._old_D_y, _new_D_x, _new_D_y = self.data_loader.load_data()
+        super().__init__(self.rng)
         self._bbfunc = BlackboxOffline(_new_D_x, _new_D_y)
         self._best_f = min(_new_D_y).item()
         self._f_range = max(_new_D_y).item() - self._best_f
@@ -293,7 +446,32 @@ class TransferBenchmark(AbstractBenchmark):
         y = (f - self._best_f) / self._f_range if self.normalize_y else f
 
         return {Key.FUNC_VALUE: y}
-    
+
+    def objective_function_batch(self, configs, **kwargs):
+        '''
+        Evaluate many configurations at once.
+
+        Parameters
+        ----------
+        configs : np.ndarray (N, D) or list of dict-like
+            Either an array whose columns follow `data_loader.hp_names` or
+            configurations. They are not validated against the
+            configuration space.
+
+        Returns
+        -------
+        dict
+            `function_value` holds an np.ndarray (N,).
+        '''
+        if not isinstance(configs, np.ndarray):
+            configs = np.asarray(
+                [[config[k] for k in self.data_loader.hp_names]
+                 for config in configs],
+                dtype=np.float64)
+        f = self._bbfunc.predict(configs)[:, 0]
+        y = (f - self._best_f) / self._f_range if self.normalize_y else f
+        return {Key.FUNC_VALUE: y}
+
     @AbstractBenchmark._check_configuration
     def objective_function_test(self, config, **kwargs):
         return self.objective_function(config, **kwargs)
@@ -345,6 +523,8 @@ class BlackboxOffline(Blackbox):
         """
         A blackbox whose evaluations are already known.
         To evaluate a new point, we return the value of the closest known point.
+        Queries that hit a known point exactly are answered from a hash index,
+        the others from a KD-tree built once.
         :param input_dim:
         :param output_dim:
         :param X: list of arguments evaluated, shape (n, input_dim)
@@ -354,16 +534,35 @@ class BlackboxOffline(Blackbox):
         n, input_dim = X.shape
         n, output_dim = y.shape
 
-        from sklearn.neighbors import KNeighborsRegressor
-        proj = KNeighborsRegressor(n_neighbors=1).fit(X, y)
+        from scipy.spatial import cKDTree
+        self.X = np.ascontiguousarray(X, dtype=np.float64)
+        self.y = np.asarray(y)
+        self._tree = cKDTree(self.X)
+        self._index = {}
+        for i, row in enumerate(self.X):
+            self._index.setdefault(row.tobytes(), i)
 
         super().__init__(
             input_dim=input_dim,
             output_dim=output_dim,
-            eval_fun=lambda x: proj.predict(x.reshape(1, -1))[0]
+            eval_fun=lambda x: self.predict(x.reshape(1, -1))[0]
         )
-        
-        
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        :param X: shape (N, input_dim)
+        :return: shape (N, output_dim)
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64).reshape(-1, self.input_dim)
+        idx = np.fromiter((self._index.get(row.tobytes(), -1) for row in X),
+                          dtype=np.intp,
+                          count=X.shape[0])
+        miss = idx < 0
+        if miss.any():
+            idx[miss] = self._tree.query(X[miss], k=1)[1]
+        return self.y[idx]
+
+
 if __name__ == "__main__":
     bench = TransferBenchmark(BenchName.Table_deepar, 'DeepAR.csv.zip', target_task_name="m4-Hourly", data_path_root='./data/offline_evaluations')
     cs = bench.get_configuration_space()
@@ -59,9 +59,7 @@ class Anneal(AbstractOptimizer):
         if (self.trials.trials_num) < self.init_budget:
             assert self.trials.trials_num % n_suggestions == 0
             configs = self.initial_design_configs[
-                int(n_suggestions *
-                    self.trials.trials_num):int(n_suggestions *
-                                                (self.trials.trials_num + 1))]
+                self.trials.trials_num:self.trials.trials_num + n_suggestions]
             for config in configs:
                 trial_list.append(
                     Trial(configuration=config,
@@ -6,6 +6,7 @@ import ConfigSpace as CS
 from xbbo.configspace.space import DenseConfigurationSpace
 from xbbo.core.trials import Trials
 from xbbo.core.constants import Key
+from xbbo.core.tracer import TRACER, Tracer
 # from xbbo.configspace.space import Configurations
 
 
@@ -27,6 +28,7 @@ class AbstractOptimizer(ABC):
                  learner_time_limit: float = np.inf,
                  budget_limit: float= np.inf,
                  objective_function=None,
+                 trace: bool = False,
                  **kwargs):
         """Build wrapper class to use an optimizer in benchmark.
 
@@ -34,6 +36,10 @@ class AbstractOptimizer(ABC):
         ----------
         api_config : dict-like of dict-like
             Configuration of the optimization variables. See API description.
+        trace : bool
+            Record the spans of this optimizer in its own tracer
+            `self.tracer`, see `xbbo.core.tracer`. The per-phase records
+            of each suggest/observe are stored in `trial.info[Key.TRACE]`.
         """
         assert isinstance(space, CS.ConfigurationSpace)
         if not isinstance(space, DenseConfigurationSpace):
@@ -55,6 +61,7 @@ class AbstractOptimizer(ABC):
         self.budget_recoder = 0
         self.cost_recoder = 0
         self.objective_function = objective_function
+        self.tracer = Tracer(enabled=True) if trace else TRACER
 
     def fix_boundary(self, individual):
         if self.fix_type == 'random':
@@ -68,11 +75,21 @@ class AbstractOptimizer(ABC):
 
     def suggest(self, n_suggestions=1):
         st = time.time()
-        ret = self._suggest(n_suggestions)
+        mark = self.tracer.mark()
+        with self.tracer.activate(), self.tracer.span('suggest',
+                                                       rows=n_suggestions):
+            ret = self._suggest(n_suggestions)
         self.total_time_recoder += time.time() - st
         self.suggest_counter += 1
+        if self.tracer.enabled and ret is not None:
+            self._attach_trace(ret, 'suggest', mark)
         return ret
 
+    def _attach_trace(self, trial_list, phase, mark):
+        summary = self.tracer.summary(mark)
+        for trial in trial_list:
+            trial.info.setdefault(Key.TRACE, {})[phase] = summary
+
     @abstractmethod
     def _suggest(self, n_suggestions):  # output [meta param]
         """Get a suggestion from the optimizer.
@@ -116,11 +133,31 @@ class AbstractOptimizer(ABC):
             self.budget_recoder += job_info.get(Key.BUDGET, 0)
 
         st = time.time()
-        ret = self._observe(trial_list)
+        mark = self.tracer.mark()
+        with self.tracer.activate(), self.tracer.span('observe',
+                                                       rows=len(trial_list)):
+            ret = self._observe(trial_list)
         self.total_time_recoder += time.time() - st + learner_train_time
         self.learner_time_recoder += learner_train_time
+        if self.tracer.enabled:
+            self._attach_trace(trial_list, 'observe', mark)
         return ret
 
+    def close(self):
+        '''
+        Release the threads and processes of the optimizer and stop its
+        tracer. Also called when leaving a ``with`` block.
+        '''
+        if self.tracer is not TRACER:
+            self.tracer.disable()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
     def check_stop(self, ):
         if self.learner_time_recoder >= self.learner_time_limit or self.total_time_recoder >= self.total_time_limit or self.suggest_counter >= self.suggest_limit or self.budget_recoder >= self.budget_limit:
             return True
@@ -2,7 +2,7 @@ import logging
 import typing
 import numpy as np
 
-from xbbo.acquisition_function.acq_optimizer import InterleavedLocalAndRandomSearch, LocalSearch, RandomScipyOptimizer, RandomSearch, ScipyGlobalOptimizer, ScipyOptimizer
+from xbbo.acquisition_function.acq_optimizer import FiniteSpaceSearch, InterleavedLocalAndRandomSearch, LocalSearch, RandomScipyOptimizer, RandomSearch, ScipyGlobalOptimizer, ScipyOptimizer
 
 from xbbo.search_algorithm.base import AbstractOptimizer
 # from xbbo.configspace.space import DenseConfiguration, DenseConfigurationSpace
@@ -10,12 +10,18 @@ from xbbo.search_algorithm.base import AbstractOptimizer
 # from xbbo.core import trials
 # from xbbo.core.stochastic import Category, Uniform
 from . import alg_register
+from xbbo.configspace.space import convert_denseConfigurations_to_array
 from xbbo.core.trials import Trial, Trials
+from xbbo.core.tracer import span
+from xbbo.utils.prefetch import SuggestionPrefetcher
 from xbbo.initial_design import ALL_avaliable_design
 from xbbo.surrogate.gaussian_process import GPR_sklearn
 from xbbo.acquisition_function.acq_func import EI_AcqFunc
 from xbbo.surrogate.sk_prf import skRandomForestWithInstances
 from xbbo.surrogate.skrf import RandomForestSurrogate
+from xbbo.surrogate.incremental_rf import IncrementalRandomForest
+from xbbo.surrogate.adaptive import AdaptiveSurrogate
+from xbbo.core.constants import Key
 
 logger = logging.getLogger(__name__)
 
@@ -37,10 +43,43 @@ class BO(AbstractOptimizer):
             #  min_sample=1,
             suggest_limit: int = np.inf,
             predict_x_best: bool = True,
+            prefetch: bool = False,
+            prefetch_deadline: float = 10.,
+            acq_time_budget: float = None,
+            batch_strategy: str = 'kb',
+            surrogate_candidates: typing.Sequence[str] = ('gp', 'irf'),
+            surrogate_latency_budget: float = 1.,
+            enumerate_limit: int = 10000,
             **kwargs):
         '''
         predict_x_best: bool
             Choose x_best for computing the acquisition function via the model instead of via the observations.
+        prefetch: bool
+            Refit the surrogate and maximize the acquisition function in a background thread right after
+            each observation, so that `suggest` returns the prefetched candidate immediately.
+        prefetch_deadline: float
+            Seconds `suggest` waits for the prefetched candidate before falling back to a random one.
+            The background thread works on its own copy of the model and rng.
+        acq_time_budget: float
+            Seconds per acquisition maximization, after which the best candidates found so far are used.
+            None for no limit.
+        batch_strategy: str
+            How to pick n_suggestions > 1 points with a GP surrogate: greedily from the candidates of
+            one acquisition maximization, re-scoring them after conditioning the GP on the pending
+            points with their predicted mean ('kb', kriging believer) or with the min/max/mean
+            observed value ('cl_min', 'cl_max', 'cl_mean', constant liar). None takes the top of the
+            acquisition ranking, as BO did before this option; the default 'kb' therefore suggests
+            different batches than earlier versions.
+        surrogate_candidates: sequence of str
+            With surrogate='auto', the surrogates to choose from, most accurate first.
+        surrogate_latency_budget: float
+            With surrogate='auto', seconds of model fitting and acquisition prediction per suggest
+            above which the next candidate is used. The active model is recorded in the suggest
+            info of each trial under `Key.SURROGATE`.
+        enumerate_limit: int
+            In a finite space (categorical, ordinal and integer hyperparameters without conditions),
+            evaluate the acquisition function on every unevaluated configuration instead of running
+            `acq_opt` once at most this many are left.
         '''
         AbstractOptimizer.__init__(self,
                                    space,
@@ -61,6 +100,8 @@ class BO(AbstractOptimizer):
             self.init_budget = self.initial_design.init_budget
         self.initial_design_configs = self.initial_design.select_configurations(
         )[:self.init_budget]
+        # a small discrete space may have fewer distinct design points
+        self.init_budget = len(self.initial_design_configs)
 
         self.trials = Trials(space, self.dimension)
         if surrogate == 'gp':
@@ -75,9 +116,18 @@ class BO(AbstractOptimizer):
         elif surrogate == 'sk_prf':
             self.surrogate_model = skRandomForestWithInstances(self.space,
                                                                rng=self.rng)
+        elif surrogate == 'irf':
+            self.surrogate_model = IncrementalRandomForest(self.space,
+                                                           rng=self.rng)
+        elif surrogate == 'auto':
+            self.surrogate_model = AdaptiveSurrogate(
+                self.space,
+                candidates=surrogate_candidates,
+                latency_budget=surrogate_latency_budget,
+                rng=self.rng)
         else:
             raise ValueError('surrogate {} not in {}'.format(
-                surrogate, ['gp', 'rf', 'prf', 'sk_prf']))
+                surrogate, ['gp', 'rf', 'prf', 'sk_prf', 'irf', 'auto']))
 
         if acq_func == 'ei':
             self.acquisition_func = EI_AcqFunc(self.surrogate_model, self.rng)
@@ -107,6 +157,18 @@ class BO(AbstractOptimizer):
             raise ValueError('acq_opt {} not in {}'.format(
                 acq_opt,
                 ['ls', 'rs', 'rs_ls', 'scipy', 'scipy_global', 'r_scipy']))
+        self.acq_time_budget = acq_time_budget
+        self.enumerate_limit = enumerate_limit
+        self.acq_enumerator = FiniteSpaceSearch(self.acquisition_func,
+                                                self.space, self.rng)
+        if batch_strategy not in [None, 'kb', 'cl_min', 'cl_max', 'cl_mean']:
+            raise ValueError('batch_strategy {} not in {}'.format(
+                batch_strategy, [None, 'kb', 'cl_min', 'cl_max', 'cl_mean']))
+        self.batch_strategy = batch_strategy
+        self.prefetcher = SuggestionPrefetcher(
+            self, ('surrogate_model', 'acquisition_func', 'acq_maximizer',
+                   'acq_enumerator'),
+            prefetch_deadline) if prefetch else None
         logger.info(
             "Execute Bayesian optimization...\n [Using ({})surrogate, ({})acquisition function, ({})acquisition optmizer]"
             .format(surrogate, acq_func, acq_opt))
@@ -117,9 +179,7 @@ class BO(AbstractOptimizer):
         if (self.trials.trials_num) < self.init_budget:
             assert self.trials.trials_num % n_suggestions == 0
             configs = self.initial_design_configs[
-                int(n_suggestions *
-                    self.trials.trials_num):int(n_suggestions *
-                                                (self.trials.trials_num + 1))]
+                self.trials.trials_num:self.trials.trials_num + n_suggestions]
             for config in configs:
                 trial_list.append(
                     Trial(configuration=config,
@@ -127,32 +187,64 @@ class BO(AbstractOptimizer):
                           array=config.get_array()))
         else:
             if (self.trials.trials_num) < self.min_sample:
-                while len(
-                        trial_list) < n_suggestions:  # remove history suggest
-                    config = self.space.sample_configuration(size=1)[0]
-                    if not self.trials.is_contain(config):
-                        trial_list.append(
-                            Trial(configuration=config,
-                                  config_dict=config.get_dictionary(),
-                                  array=config.get_array()))
-                return trial_list
+                return self._random_suggest(n_suggestions, self.trials)
+            if self.prefetcher is None:
+                return self._model_suggest(n_suggestions, self.trials)
+            return self.prefetcher.get(n_suggestions, self.trials)
+
+        return trial_list
+
+    def _random_suggest(self, n_suggestions, trials):
+        trial_list = []
+        index = trials.get_space_index()
+        if index is not None and index.n_remaining >= n_suggestions:
+            for config in index.configs(self.space,
+                                        index.sample(n_suggestions, self.rng)):
+                trial_list.append(
+                    Trial(configuration=config,
+                          config_dict=config.get_dictionary(),
+                          array=config.get_array()))
+            return trial_list
+        # remove history suggest
+        configs = trials.sample_unseen(self.space, n_suggestions)
+        assert len(configs) == n_suggestions, "no more configs can be suggest"
+        for config in configs:
+            trial_list.append(
+                Trial(configuration=config,
+                      config_dict=config.get_dictionary(),
+                      array=config.get_array()))
+        return trial_list
 
-            self.surrogate_model.train(
-                np.asarray(self.trials.get_array()),
-                np.asarray(self.trials.get_history()[0]))
-            configs = []
-            _, best_val = self._get_x_best(self.predict_x_best)
-            self.acquisition_func.update(surrogate_model=self.surrogate_model,
-                                         y_best=best_val)
-            configs = self.acq_maximizer.maximize(self.trials,
-                                                  1000,
-                                                  drop_self_duplicate=True)
-            _idx = 0
+    def _model_suggest(self, n_suggestions, trials):
+        self.surrogate_model.train(np.asarray(trials.get_array()),
+                                   np.asarray(trials.get_history()[0]))
+        configs = []
+        _, best_val = self._get_x_best(self.predict_x_best, trials)
+        self.acquisition_func.update(surrogate_model=self.surrogate_model,
+                                     y_best=best_val)
+        configs = self._maximize_acq(trials)
+        if n_suggestions > 1 and self.batch_strategy and hasattr(
+                self.surrogate_model, 'fantasize'):
+            trial_list = self._batch_suggest(n_suggestions, trials, configs)
+        else:
+            trial_list = self._top_suggest(n_suggestions, trials, configs)
+        if isinstance(self.surrogate_model, AdaptiveSurrogate):
+            state = self.surrogate_model.state()
+            for trial in trial_list:
+                trial.info[Key.SURROGATE] = state
+        return trial_list
+
+    def _top_suggest(self, n_suggestions, trials, configs):
+        trial_list = []
+        _idx = 0
+        with span('dedup', rows=len(configs)):
+            seen = list(trials.contains(configs))
             for n in range(n_suggestions):
                 while _idx < len(configs):  # remove history suggest
-                    if not self.trials.is_contain(configs[_idx]):
+                    if not seen[_idx]:
                         config = configs[_idx]
                         configs.append(config)
+                        seen.append(False)
                         trial_list.append(
                             Trial(configuration=config,
                                   config_dict=config.get_dictionary(),
@@ -166,11 +258,63 @@ class BO(AbstractOptimizer):
 
         return trial_list
 
+    def _batch_suggest(self, n_suggestions, trials, configs):
+        '''
+        Sequential greedy batch selection over the candidates `configs` of
+        one acquisition maximization: after each pick the GP is conditioned
+        on the pending point (rank-1 Cholesky update, no hyperparameter
+        refit) and the candidates are scored again.
+        '''
+        lie = None
+        if self.batch_strategy != 'kb':
+            y = np.asarray(trials.get_history()[0])
+            lie = {'cl_min': np.min, 'cl_max': np.max, 'cl_mean': np.mean}[self.batch_strategy](y)
+        with span('dedup', rows=len(configs)):
+            # history and pending suggest are excluded
+            taken = trials.contains(configs)
+        assert not np.all(taken), "no more configs can be suggest"
+        X = convert_denseConfigurations_to_array(configs)
+        pick = np.argmin(taken)  # configs are sorted by acquisition value
+        trial_list = []
+        while True:
+            config = configs[pick]
+            taken[pick] = True
+            trial_list.append(
+                Trial(configuration=config,
+                      config_dict=config.get_dictionary(),
+                      array=config.get_array()))
+            if len(trial_list) == n_suggestions:
+                return trial_list
+            assert not np.all(taken), "no more configs can be suggest"
+            with span('surrogate.fantasize', rows=1):
+                self.surrogate_model.fantasize(
+                    X[pick][None], None if lie is None else np.array([lie]))
+            acq = self.acquisition_func(X, convert=False).ravel()
+            acq[taken] = -np.inf
+            pick = np.argmax(acq)
+
+    def _maximize_acq(self, trials):
+        index = trials.get_space_index()
+        if index is not None and index.n_remaining <= self.enumerate_limit:
+            return self.acq_enumerator.maximize(trials, 1000)
+        return self.acq_maximizer.maximize(trials,
+                                           1000,
+                                           drop_self_duplicate=True,
+                                           time_budget=self.acq_time_budget)
+
     def _observe(self, trial_list):
         for trial in trial_list:
             self.trials.add_a_trial(trial)
+        if self.prefetcher is not None and self.trials.trials_num >= max(
+                self.init_budget, self.min_sample):
+            self.prefetcher.schedule(self.trials)
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        AbstractOptimizer.close(self)
 
-    def _get_x_best(self, predict: bool) -> typing.Tuple[float, np.ndarray]:
+    def _get_x_best(self, predict: bool, trials: Trials) -> typing.Tuple[float, np.ndarray]:
         """Get value, configuration, and array representation of the "best" configuration.
 
         The definition of best varies depending on the argument ``predict``. If set to ``True``,
@@ -181,6 +325,8 @@ class BO(AbstractOptimizer):
         ----------
         predict : bool
             Whether to use the predicted or observed best.
+        trials : Trials
+            History to pick the best from.
 
         Returns
         -------
@@ -189,7 +335,7 @@ class BO(AbstractOptimizer):
         Configuration
         """
         if predict:
-            X = self.trials.get_array()
+            X = trials.get_array()
             costs = list(
                 map(
                     lambda x: (
@@ -203,9 +349,9 @@ class BO(AbstractOptimizer):
             best_observation = costs[0][0]
             # won't need log(y) if EPM was already trained on log(y)
         else:
-            best_idx = self.trials.best_id
-            x_best_array = self.trials.get_array()[best_idx]
-            best_observation = self.trials.best_observe_value
+            best_idx = trials.best_id
+            x_best_array = trials.get_array()[best_idx]
+            best_observation = trials.best_observe_value
 
         return x_best_array, best_observation
 
@@ -1,11 +1,10 @@
 import logging
 import numpy as np
 from scipy.optimize import Bounds
-from scipy.optimize import minimize, OptimizeResult
 from sklearn.ensemble import RandomForestClassifier
 from xbbo.core.trials import Trial, Trials
 from xbbo.initial_design import ALL_avaliable_design
-from xbbo.search_algorithm.lfbo_optimizer import Classfify
+from xbbo.search_algorithm.lfbo_optimizer import Classfify, ClassifierMaximizer
 
 from . import alg_register
 from xbbo.search_algorithm.base import AbstractOptimizer
@@ -37,12 +36,17 @@ class BORE(AbstractOptimizer):
                                    **kwargs)
 
         # self.multi_start = multi_start(minimizer_fn=minimize)
-        self.classifier = Classfify(classify=classify)
         if self.space.get_conditions():
             raise NotImplementedError(
                 "BORE optimizer currently does not support conditional space!")
 
         self.dimension = self.space.get_dimensions()
+        self.classifier = Classfify(classify=classify,
+                                    dim=self.dimension,
+                                    rng=self.rng,
+                                    warm_start=kwargs.get('warm_start', False),
+                                    refit_every=kwargs.get('refit_every', 10))
+        self._n_fitted = 0  # trials seen by the last classifier fit
         bounds = self.space.get_bounds()
         self.bounds = Bounds(bounds.lb, bounds.ub)  #(bounds.lb, bounds.ub)
         self.init_budget = kwargs.get('init_budget')
@@ -59,8 +63,14 @@ class BORE(AbstractOptimizer):
         self.random_rate = random_rate
         self.num_starts = kwargs.get("num_starts", 5)
         self.num_samples = kwargs.get("num_samples", 1024)
-        self.method = kwargs.get("method", "L-BFGS-B")
+        self.method = kwargs.get("method", "evolution")
         self.options = kwargs.get('options', dict(maxiter=1000, ftol=1e-9))
+        self.maximizer = ClassifierMaximizer(self.bounds,
+                                             self.rng,
+                                             num_samples=self.num_samples,
+                                             num_starts=self.num_starts,
+                                             method=self.method,
+                                             options=self.options)
         self.quantile = kwargs.get("quantile", 0.33)
 
     def _suggest(self, n_suggestions=1):
@@ -104,7 +114,10 @@ class BORE(AbstractOptimizer):
         # classify historical y-values
         z = np.less(targets, tau)
         # update classifier
-        self.classifier.fit(self.trials.get_array(), z)
+        self.classifier.fit(self.trials.get_array(),
+                            z,
+                            new=np.arange(dataset_size) >= self._n_fitted)
+        self._n_fitted = dataset_size
         
         # # Create classifier (if retraining from scratch every iteration)
         # self._maybe_create_classifier()
@@ -112,56 +125,32 @@ class BORE(AbstractOptimizer):
         # # Train classifier
         # self._update_classifier()
 
-        # Scipy optimization using random x-values
-        # (The best point obtained with the historical x value is still around the historical value)
-        # (historical x-values can be supplemented as random)
-        X_init = self.rng.uniform(low=self.bounds.lb,
-                                  high=self.bounds.ub,
-                                  size=(self.num_samples,
-                                        self.dimension))
-        f_init = self.classifier.predict(X_init)  # to minimize
-
-        #Calculate the minimum value of the fitted function
+        X_cand = self.maximizer.maximize(self.classifier.predict,
+                                         n_suggestions + self.num_starts,
+                                         model=self.classifier.model)
         trial_list = []
-        for n_ in range(n_suggestions):
-            results = []
-            if self.num_starts > 0:
-                ind = np.argpartition(f_init,
-                                      kth=self.num_starts - 1,
-                                      axis=None)
-                for i in range(self.num_starts):
-                    x0 = X_init[ind[i]]
-                    result = minimize(self.classifier.predict,
-                                      x0=x0,
-                                      method=self.method,
-                                      jac=False,
-                                      bounds=self.bounds,
-                                      options=self.options)
-                    results.append(result)
-                    # # TODO(LT): Make this message a customizable option.
-                    # print(f"[Maximum {i+1:02d}: value={result.fun:.3f}] "
-                    #         f"success: {result.success}, "
-                    #         f"iterations: {result.nit:02d}, "
-                    #         f"status: {result.status} ({result.message})")
-            else:
-                i = np.argmin(f_init, axis=None)
-                result = OptimizeResult(x=X_init[i],
-                                        fun=f_init[i],
-                                        success=True)
-                results.append(result)
-            best_v = np.inf
-            best_config = None
-            for res in results:
-                if (res.success or res.status == 1) and res.fun < best_v:
-                    config = DenseConfiguration.from_array(
-                        self.space, res.x)
-                    if not self.trials.is_contain(config):
-                        best_config = config
-            assert best_config is not None
+        chosen = set()
+        seen = self.trials.contains(self.space.dense_to_sparse(X_cand))
+        for x, x_seen in zip(X_cand, seen):
+            if len(trial_list) >= n_suggestions:
+                break
+            if x_seen:
+                continue
+            config = DenseConfiguration.from_array(self.space, x)
+            if config in chosen:
+                continue
+            chosen.add(config)
             trial_list.append(
                 Trial(configuration=config,
                       config_dict=config.get_dictionary(),
                       array=config.get_array(sparse=False)))
+        for config in self.trials.sample_unseen(
+                self.space, n_suggestions - len(trial_list), exclude=chosen):
+            trial_list.append(
+                Trial(configuration=config,
+                      config_dict=config.get_dictionary(),
+                      array=config.get_array(sparse=False),
+                      origin='Random'))
 
         return trial_list
 
@@ -170,14 +159,6 @@ class BORE(AbstractOptimizer):
         for trial in trial_list:
             self.trials.add_a_trial(trial)
 
-    def _is_unique(self, res, rtol=1e-5, atol=1e-8):
-        is_duplicate = any(
-            np.allclose(x_prev, res.x, rtol=rtol, atol=atol)
-            for x_prev in self.trials.get_array())
-        if is_duplicate:
-            logger.warn("Duplicate detected! Skipping...")
-        return not is_duplicate
-
 
 
 
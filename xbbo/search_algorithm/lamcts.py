@@ -42,6 +42,10 @@ class LaMCTS(AbstractOptimizer):
         splitter_type="kmeans",
         normalize=True,
         split_use_predict=True,  # False->kmeans result; True->svm
+        incremental_treeify=False,
+        batch_paths=False,
+        n_workers=1,
+        parallel_min_samples=500,
         **kwargs):
         AbstractOptimizer.__init__(self,
                                    space,
@@ -134,20 +138,26 @@ class LaMCTS(AbstractOptimizer):
             normalize=normalize,
             rng=self.rng,
             split_use_predict=split_use_predict,
+            incremental_treeify=incremental_treeify,
+            batch_paths=batch_paths,
+            n_workers=n_workers,
+            parallel_min_samples=parallel_min_samples,
             **kwargs)
         # best_x, best_fx = agent.search(iterations = args.iterations, samples_per_iteration=args.samples_per_iteration, treeify_freq=args.treeify_freq)
         # assert func.counter == args.iterations
         # return best_x.reshape(args.horizon, env_info['action_dims']), agent
 
+    def close(self):
+        self.agent.close()
+        AbstractOptimizer.close(self)
+
     def _suggest(self, n_suggestions=1):
         trial_list = []
         # currently only suggest one
         if (self.trials.trials_num) < self.init_budget:
             assert self.trials.trials_num % n_suggestions == 0
             configs = self.initial_design_configs[
-                int(n_suggestions *
-                    self.trials.trials_num):int(n_suggestions *
-                                                (self.trials.trials_num + 1))]
+                self.trials.trials_num:self.trials.trials_num + n_suggestions]
             for config in configs:
                 trial_list.append(
                     Trial(configuration=config,
@@ -165,7 +175,7 @@ class LaMCTS(AbstractOptimizer):
             #                     config_dict=config.get_dictionary(),
             #                     array=config.get_array()))
             #     return trial_list
-            leaf, latent_samples, samples = self.agent.suggest(n_suggestions)
+            leaves, latent_samples, samples = self.agent.suggest(n_suggestions)
             for n in range(n_suggestions):
                 array = samples[n]
                 config = DenseConfiguration.from_array(self.space, array)
@@ -174,7 +184,7 @@ class LaMCTS(AbstractOptimizer):
                           config_dict=config.get_dictionary(),
                           array=array,
                           _latent_sample=latent_samples[n],
-                          _leaf=leaf))
+                          _leaf=leaves[n]))
 
         return trial_list
 
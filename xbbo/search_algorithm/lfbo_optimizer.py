@@ -1,7 +1,7 @@
 import logging
 import numpy as np
 from scipy.optimize import Bounds
-from scipy.optimize import minimize, OptimizeResult
+from scipy.optimize import minimize
 from sklearn.ensemble import RandomForestClassifier
 from xbbo.core.constants import MAXINT
 
@@ -44,7 +44,12 @@ class LFBO(AbstractOptimizer):
                 "BORE optimizer currently does not support conditional space!")
 
         self.dimension = self.space.get_dimensions()
-        self.classifier = Classfify(classify=classify, dim=self.dimension,rng=self.rng)
+        self.classifier = Classfify(classify=classify,
+                                    dim=self.dimension,
+                                    rng=self.rng,
+                                    warm_start=kwargs.get('warm_start', False),
+                                    refit_every=kwargs.get('refit_every', 10))
+        self._n_fitted = 0  # trials seen by the last classifier fit
         bounds = self.space.get_bounds()
         self.bounds = Bounds(bounds.lb, bounds.ub)  #(bounds.lb, bounds.ub)
         self.initial_design = ALL_avaliable_design[initial_design](
@@ -61,8 +66,14 @@ class LFBO(AbstractOptimizer):
         self.random_rate = random_rate
         self.num_starts = kwargs.get("num_starts", 5)
         self.num_samples = kwargs.get("num_samples", 1024)
-        self.method = kwargs.get("method", "L-BFGS-B")
+        self.method = kwargs.get("method", "evolution")
         self.options = kwargs.get('options', dict(maxiter=1000, ftol=1e-9))
+        self.maximizer = ClassifierMaximizer(self.bounds,
+                                             self.rng,
+                                             num_samples=self.num_samples,
+                                             num_starts=self.num_starts,
+                                             method=self.method,
+                                             options=self.options)
         self.quantile = kwargs.get("quantile", 0.33)
 
     def _suggest(self, n_suggestions=1):
@@ -84,56 +95,40 @@ class LFBO(AbstractOptimizer):
         # targets: historical y-values
         targets = self.trials.get_history()[0]
 
-        X, Y, W = self._make_clf_data(self.trials.get_array(), targets)
+        X, Y, W, idx = self._make_clf_data(self.trials.get_array(),
+                                           targets,
+                                           return_index=True)
 
         # update classifier
-        self.classifier.fit(X, Y, W)
+        self.classifier.fit(X, Y, W, new=idx >= self._n_fitted)
+        self._n_fitted = dataset_size
 
-        X_init = self.rng.uniform(low=self.bounds.lb,
-                                  high=self.bounds.ub,
-                                  size=(self.num_samples, self.dimension))
-        f_init = self.classifier.predict(X_init)  # to minimize
-
-        #Calculate the minimum value of the fitted function
+        X_cand = self.maximizer.maximize(self.classifier.predict,
+                                         n_suggestions + self.num_starts,
+                                         model=self.classifier.model)
         trial_list = []
-        for n_ in range(n_suggestions):
-            results = []
-            if self.num_starts > 0:
-                ind = np.argpartition(f_init,
-                                      kth=self.num_starts - 1,
-                                      axis=None)
-                for i in range(self.num_starts):
-                    x0 = X_init[ind[i]]
-                    result = minimize(self.classifier.predict,
-                                      x0=x0,
-                                      method=self.method,
-                                      jac=False,
-                                      bounds=self.bounds,
-                                      options=self.options)
-                    results.append(result)
-                    # # TODO(LT): Make this message a customizable option.
-                    # print(f"[Maximum {i+1:02d}: value={result.fun:.3f}] "
-                    #         f"success: {result.success}, "
-                    #         f"iterations: {result.nit:02d}, "
-                    #         f"status: {result.status} ({result.message})")
-            else:
-                i = np.argmin(f_init, axis=None)
-                result = OptimizeResult(x=X_init[i],
-                                        fun=f_init[i],
-                                        success=True)
-                results.append(result)
-            best_v = np.inf
-            best_config = None
-            for res in results:
-                if (res.success or res.status == 1) and res.fun < best_v:
-                    config = DenseConfiguration.from_array(self.space, res.x)
-                    if not self.trials.is_contain(config):
-                        best_config = config
-            assert best_config is not None
+        chosen = set()
+        seen = self.trials.contains(self.space.dense_to_sparse(X_cand))
+        for x, x_seen in zip(X_cand, seen):
+            if len(trial_list) >= n_suggestions:
+                break
+            if x_seen:
+                continue
+            config = DenseConfiguration.from_array(self.space, x)
+            if config in chosen:
+                continue
+            chosen.add(config)
             trial_list.append(
                 Trial(configuration=config,
                       config_dict=config.get_dictionary(),
                       array=config.get_array(sparse=False)))
+        for config in self.trials.sample_unseen(
+                self.space, n_suggestions - len(trial_list), exclude=chosen):
+            trial_list.append(
+                Trial(configuration=config,
+                      config_dict=config.get_dictionary(),
+                      array=config.get_array(sparse=False),
+                      origin='Random'))
 
         return trial_list
 
@@ -142,18 +137,12 @@ class LFBO(AbstractOptimizer):
         for trial in trial_list:
             self.trials.add_a_trial(trial)
 
-    def _is_unique(self, res, rtol=1e-5, atol=1e-8):
-        is_duplicate = any(
-            np.allclose(x_prev, res.x, rtol=rtol, atol=atol)
-            for x_prev in self.trials.get_array())
-        if is_duplicate:
-            logger.warn("Duplicate detected! Skipping...")
-        return not is_duplicate
-
-    def _make_clf_data(self, X, Y, eta=1.0):
+    def _make_clf_data(self, X, Y, eta=1.0, return_index=False):
         '''
         Uility default use EI version(eta = 1.0)
         when eta == 0, i.e. PI version
+
+        return_index: also return the row of `X` each sample comes from
         '''
         X = np.asarray(X)
         Y = np.asarray(Y)
@@ -173,12 +162,32 @@ class LFBO(AbstractOptimizer):
         W = np.concatenate([w1 * (s1 + s0) / s1, w0 * (s1 + s0) / s0],
                            axis=0)  # 正负样本数量均衡
         W = W / W.mean()
+        if return_index:
+            idx = np.concatenate([np.flatnonzero(z), np.arange(s0)])
+            return X, Y, W, idx
         return X, Y, W
 
 
 class Classfify():
-    def __init__(self, classify: str = 'rf', dim=0, rng=np.random.RandomState()):
+    '''
+    warm_start: bool
+        Update the fitted model with ``partial_fit`` instead of retraining it: the forest
+        replaces its oldest trees, XGBoost adds boosting rounds and the MLP trains a few
+        epochs on the new rows (plus as many replayed old ones). The labels move with the
+        quantile, so every `refit_every`-th fit (or one where the set of classes changes)
+        retrains from scratch.
+    '''
+    def __init__(self,
+                 classify: str = 'rf',
+                 dim=0,
+                 rng=np.random.RandomState(),
+                 warm_start: bool = False,
+                 refit_every: int = 10):
         self.classify = classify
+        self.warm_start = warm_start
+        self.refit_every = refit_every
+        self._n_warm = 0  # warm fits since the last full fit
+        self._classes = None
         if classify == 'rf':
             self.model = RFClassify(n_estimators=1000,
                                                 min_samples_split=2,random_state=rng)
@@ -195,11 +204,25 @@ class Classfify():
         else:
             raise NotImplementedError()
 
-    def fit(self, X, z, w=None):
+    def fit(self, X, z, w=None, new=None):
+        '''
+        new: np.ndarray of bool, optional
+            Rows added since the previous fit (all rows if None).
+        '''
         z = z.ravel()
         if w is None:
             w = np.ones_like(z, dtype='float')
-        self.model.fit(X, z, sample_weight=w)
+        classes = np.unique(z)
+        if self.warm_start and self._n_warm + 1 < self.refit_every and \
+                np.array_equal(classes, self._classes):
+            if new is None:
+                new = np.ones(len(z), dtype=bool)
+            self.model.partial_fit(X, z, sample_weight=w, new=new)
+            self._n_warm += 1
+        else:
+            self.model.fit(X, z, sample_weight=w)
+            self._n_warm = 0
+        self._classes = classes
 
     def predict(self, x):
         if x.ndim == 1:
@@ -207,6 +230,149 @@ class Classfify():
         return 1 - self.model.predict_proba(x)
 
 
+class ClassifierMaximizer():
+    '''
+    Minimize `predict` (e.g. ``Classfify.predict``, one minus the class probability) over
+    the box `bounds` with batched, derivative-free search.
+
+    Forest and boosting classifiers are piecewise constant, so the finite difference
+    gradients of L-BFGS-B are zero and every iteration spends D + 1 single-point
+    predictions for nothing. Here each step scores a whole population in one `predict`
+    call: the `num_starts` best of `num_samples` uniform points (plus, for sklearn
+    forests, points drawn inside the best leaf of random trees) are evolved by Gaussian
+    perturbations of a few coordinates, a start halves its step size after a generation
+    without improvement and moves along plateaus otherwise.
+
+    method: str
+        'evolution', or a ``scipy.optimize.minimize`` method that is run from each start
+        (the previous behaviour).
+    '''
+    def __init__(self,
+                 bounds: Bounds,
+                 rng: np.random.RandomState,
+                 num_samples: int = 1024,
+                 num_starts: int = 5,
+                 method: str = 'evolution',
+                 options: dict = None,
+                 n_offspring: int = 32,
+                 max_iter: int = 50,
+                 sigma_init: float = 0.1,
+                 sigma_min: float = 1e-3,
+                 n_leaf_samples: int = 256):
+        self.lb, self.ub = np.asarray(bounds.lb), np.asarray(bounds.ub)
+        self.bounds = bounds
+        self.rng = rng
+        self.num_samples = num_samples
+        self.num_starts = num_starts
+        self.method = method
+        self.options = options or dict(maxiter=1000, ftol=1e-9)
+        self.n_offspring = n_offspring
+        self.max_iter = max_iter
+        self.sigma_init = sigma_init
+        self.sigma_min = sigma_min
+        self.n_leaf_samples = n_leaf_samples
+
+    def _leaf_samples(self, model):
+        '''Uniform points in the leaf with the highest class-1 probability of random trees.'''
+        trees = getattr(model, 'estimators_', None)
+        if not self.n_leaf_samples or not trees or not hasattr(
+                trees[0], 'tree_') or len(model.classes_) < 2:
+            return np.empty((0, len(self.lb)))
+        X = []
+        for i in self.rng.randint(len(trees), size=self.n_leaf_samples):
+            tree = trees[i].tree_
+            value = tree.value[:, 0, :]
+            proba = value[:, -1] / value.sum(axis=1)
+            lb, ub = self.lb.copy(), self.ub.copy()
+            leaves = np.flatnonzero(tree.children_left == -1)
+            node = self.rng.choice(leaves[proba[leaves] == proba[leaves].max()])
+            # walk up to the root, intersecting the split half-spaces
+            parent = np.full(tree.node_count, -1)
+            parent[tree.children_left[tree.children_left >= 0]] = np.flatnonzero(
+                tree.children_left >= 0)
+            parent[tree.children_right[tree.children_right >= 0]] = np.flatnonzero(
+                tree.children_right >= 0)
+            while parent[node] >= 0:
+                p = parent[node]
+                f, t = tree.feature[p], tree.threshold[p]
+                if tree.children_left[p] == node:
+                    ub[f] = min(ub[f], t)
+                else:
+                    lb[f] = max(lb[f], t)
+                node = p
+            X.append(self.rng.uniform(lb, np.maximum(lb, ub)))
+        return np.asarray(X)
+
+    def _scipy(self, predict, X):
+        results = [
+            minimize(predict,
+                     x0=x0,
+                     method=self.method,
+                     jac=False,
+                     bounds=self.bounds,
+                     options=self.options) for x0 in X
+        ]
+        results = [res for res in results if res.success or res.status == 1]
+        return np.asarray([res.x for res in results]).reshape(
+            -1, len(self.lb)), np.asarray([res.fun for res in results],
+                                          dtype=float).reshape(-1)
+
+    def _evolve(self, predict, X, f):
+        n, d = X.shape
+        span = self.ub - self.lb
+        sigma = np.full(n, self.sigma_init)
+        archive_X, archive_f = [X], [f]
+        prob = min(1., 3. / d)
+        for _ in range(self.max_iter):
+            active = sigma >= self.sigma_min
+            if not active.any():
+                break
+            P = X[active]
+            mask = self.rng.rand(len(P), self.n_offspring, d) < prob
+            mask[np.arange(len(P))[:, None],
+                 np.arange(self.n_offspring)[None, :],
+                 self.rng.randint(d, size=(len(P), self.n_offspring))] = True
+            children = P[:, None, :] + mask * self.rng.randn(
+                len(P), self.n_offspring, d) * (sigma[active, None, None] * span)
+            children = np.clip(children, self.lb, self.ub)
+            f_children = np.asarray(predict(children.reshape(-1, d)),
+                                    dtype=float).reshape(len(P), -1)
+            archive_X.append(children.reshape(-1, d))
+            archive_f.append(f_children.reshape(-1))
+            best = f_children.argmin(axis=1)
+            f_best = f_children[np.arange(len(P)), best]
+            idx = np.flatnonzero(active)
+            improved = f_best < f[idx]
+            moved = f_best <= f[idx]
+            X[idx[moved]] = children[moved, best[moved]]
+            f[idx[moved]] = f_best[moved]
+            sigma[idx[~improved]] /= 2
+        return np.concatenate(archive_X), np.concatenate(archive_f)
+
+    def maximize(self, predict, num_points: int = 1, model=None):
+        '''
+        Returns
+        -------
+        np.ndarray (<=num_points, D), distinct points sorted by `predict` (lowest first)
+        '''
+        X = self.rng.uniform(self.lb, self.ub,
+                             size=(self.num_samples, len(self.lb)))
+        if model is not None:
+            X = np.concatenate([X, self._leaf_samples(model)])
+        f = np.asarray(predict(X), dtype=float).reshape(-1)
+        if self.num_starts > 0:
+            starts = np.argsort(f, kind='stable')[:self.num_starts]
+            if self.method == 'evolution':
+                X_opt, f_opt = self._evolve(predict, X[starts].copy(),
+                                            f[starts].copy())
+            else:
+                X_opt, f_opt = self._scipy(predict, X[starts])
+            X, f = np.concatenate([X, X_opt]), np.concatenate([f, f_opt])
+        X, idx = np.unique(X, axis=0, return_index=True)
+        order = np.argsort(f[idx], kind='stable')[:num_points]
+        return X[order]
+
+
 def from_bounds(bounds):
 
     if isinstance(bounds, Bounds):
@@ -226,6 +392,19 @@ class RFClassify(RandomForestClassifier):
     def predict_proba(self,*args, **kwargs):
         return super().predict_proba(*args, **kwargs)[:,-1]
 
+    def partial_fit(self, X, z, sample_weight=None, new=None, n_trees=None):
+        '''Replace the `n_trees` oldest trees by trees fitted on (X, z).'''
+        n_estimators = self.n_estimators
+        n_trees = n_trees or max(1, n_estimators // 10)
+        self.set_params(warm_start=True,
+                        n_estimators=len(self.estimators_) + n_trees)
+        try:
+            self.fit(X, z, sample_weight=sample_weight)
+        finally:
+            self.set_params(warm_start=False, n_estimators=n_estimators)
+        self.estimators_ = self.estimators_[-n_estimators:]
+        return self
+
 def _load_class(classname='XGBClassify'):
     if classname == 'XGBClassify':
         from xgboost import XGBClassifier
@@ -234,6 +413,17 @@ def _load_class(classname='XGBClassify'):
                 return super().fit(*args, eval_metric='logloss', callbacks=[], verbose=False, **kwargs)
             def predict_proba(self,*args, **kwargs):
                 return super().predict_proba(*args, **kwargs)[:,-1]
+            def partial_fit(self, X, z, sample_weight=None, new=None, n_rounds=None):
+                '''Add `n_rounds` boosting rounds fitted on (X, z) to the current booster.'''
+                n_estimators = self.n_estimators
+                n_rounds = n_rounds or max(1, n_estimators // 10)
+                booster = self.get_booster()
+                self.set_params(n_estimators=n_rounds)
+                try:
+                    self.fit(X, z, sample_weight=sample_weight, xgb_model=booster)
+                finally:
+                    self.set_params(n_estimators=n_estimators)
+                return self
         return XGBClassify
     elif classname == 'SequentialNN':
         import torch.nn as nn
@@ -270,6 +460,8 @@ def _load_class(classname='XGBClassify'):
                 self.output_dim = output_dim
                 self.num_layers = num_layers
                 self.num_units = num_units
+                self.batch_size = 64
+                self.rng = random_state
                 seed = random_state.randint(MAXINT)
                 torch.manual_seed(seed)
                 self.net = Network(self.input_dim,self.output_dim, self.num_layers, self.num_units)
@@ -277,16 +469,35 @@ def _load_class(classname='XGBClassify'):
 
 
             def fit(self, X, z, sample_weight):
-                batch_size = 64
-
+                n_batches = int(np.ceil(len(X) / self.batch_size))
+                self._train(X, z, sample_weight, 100 // n_batches)
+
+            def partial_fit(self, X, z, sample_weight, new=None, n_epochs=5):
+                '''
+                Continue from the current weights for `n_epochs` epochs over the new rows
+                and as many old rows replayed at random (their labels may have changed).
+                '''
+                new = np.ones(len(X), dtype=bool) if new is None else np.asarray(new)
+                idx_new, idx_old = np.flatnonzero(new), np.flatnonzero(~new)
+                if not len(idx_new):
+                    return self
+                idx = np.concatenate([
+                    idx_new,
+                    self.rng.choice(idx_old, min(len(idx_new), len(idx_old)),
+                                    replace=False)
+                ])
+                self._train(X[idx], z[idx], sample_weight[idx], n_epochs)
+                return self
+
+            def _train(self, X, z, sample_weight, n_epochs):
                 X = torch.tensor(X, dtype=torch.float)
                 z = torch.tensor(z, dtype=torch.float).unsqueeze(-1)
                 sample_weight = torch.tensor(sample_weight, dtype=torch.float).unsqueeze(-1)
 
                 dataset = TensorDataset(X, z, sample_weight)
-                loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=0, drop_last=False)
+                loader = DataLoader(dataset, batch_size=self.batch_size, shuffle=True, num_workers=0, drop_last=False)
 
-                for i in range(100//len(loader)):
+                for i in range(n_epochs):
                     for x, y, w in loader:
                         self.optimizer.zero_grad()
                         y_ = self.net(x)
@@ -16,6 +16,7 @@ try:
     from xbbo.surrogate.prf import RandomForestWithInstances
 except:
     print("If your want to use probability random foreset, make sure 'pyrfr' is installed!")
+from xbbo.surrogate.incremental_rf import IncrementalRandomForest
 from xbbo.core.constants import MAXINT, Key
 from xbbo.utils.util import get_types
 from .. import alg_register
@@ -73,10 +74,13 @@ class SMBO(AbstractOptimizer):
         self.logger.info("Initialize weight to %s" %
                          init_weight)    
         self.trials = Trials(space,dim=self.dimension)
-        if surrogate == 'rf':
+        if surrogate in ('rf', 'irf'):
+            # 'irf': per-budget forests updated incrementally instead of refitted
             from xbbo.surrogate.transfer.rf_ensemble import RandomForestEnsemble
-            self.weighted_surrogate = RandomForestEnsemble(space, all_budgets, init_weight, fusion_method,types=self.types, bounds=self.bounds,rng=self.rng,**kwargs
+            self.weighted_surrogate = RandomForestEnsemble(space, all_budgets, init_weight, fusion_method,types=self.types, bounds=self.bounds,rng=self.rng,
+                rf_type='prf' if surrogate == 'rf' else 'irf',**kwargs
         )
+        self.surrogate = surrogate
         self.weight_srategy = weight_srategy
         if weight_srategy == 'rank_loss_p_norm':
                 self.power_num = kwargs.get("power_num", 3)
@@ -123,6 +127,11 @@ class SMBO(AbstractOptimizer):
                 total_pair_num += 1
         return order_preserving_num, total_pair_num
 
+    def _get_cv_surrogate(self):
+        if self.surrogate == 'irf':
+            return IncrementalRandomForest(self.space, rng=self.rng)
+        return RandomForestWithInstances(self.space, rng=self.rng)
+
     def update_weight(self):
 
         max_budget = self.all_budgets[-1]
@@ -159,7 +168,7 @@ class SMBO(AbstractOptimizer):
                             for train_idx, valid_idx in kfold.split(test_x):
                                 train_configs, train_y = test_x[train_idx], test_y[train_idx]
                                 valid_configs, valid_y = test_x[valid_idx], test_y[valid_idx]
-                                _surrogate = RandomForestWithInstances(self.space,rng=self.rng)
+                                _surrogate = self._get_cv_surrogate()
                                 _surrogate.train(train_configs, train_y)
                                 pred, _ = _surrogate.predict(valid_configs)
                                 cv_pred[valid_idx] = pred.reshape(-1)
@@ -207,7 +216,7 @@ class SMBO(AbstractOptimizer):
                         for train_idx, valid_idx in kfold.split(test_x):
                             train_configs, train_y = test_x[train_idx], test_y[train_idx]
                             valid_configs, valid_y = test_x[valid_idx], test_y[valid_idx]
-                            _surrogate = RandomForestWithInstances(self.space, rng=self.rng)
+                            _surrogate = self._get_cv_surrogate()
                             _surrogate.train(train_configs, train_y)
                             _pred, _var = _surrogate.predict(valid_configs)
                             sampled_pred = self.rng.normal(_pred.reshape(-1), _var.reshape(-1))
@@ -250,9 +259,7 @@ class SMBO(AbstractOptimizer):
         if (self.trials.trials_num) < self.init_budget :
             assert self.trials.trials_num % n_suggestions == 0
             configs = self.initial_design_configs[
-                int(n_suggestions *
-                    self.trials.trials_num):int(n_suggestions *
-                                                (self.trials.trials_num + 1))]
+                self.trials.trials_num:self.trials.trials_num + n_suggestions]
             for config in configs:
                 trial_list.append(
                     Trial(configuration=config,
@@ -290,11 +297,13 @@ class SMBO(AbstractOptimizer):
                                                   drop_self_duplicate=True,
                                                   _sorted=True)
             _idx = 0
+            seen = list(self.trials.contains(configs))
             for n in range(n_suggestions):
                 while _idx < len(configs):  # remove history suggest
-                    if not self.trials.is_contain(configs[_idx]):
+                    if not seen[_idx]:
                         config = configs[_idx]
                         configs.append(config)
+                        seen.append(False)
                         trial_list.append(
                             Trial(configuration=config,
                                   config_dict=config.get_dictionary(),
@@ -404,10 +413,11 @@ class MFES_BOHB(BOHB):
         self.cg = {}
         # types, bounds = get_types(self.space)
 
+        kwargs.setdefault('surrogate', 'rf')
         sub_opt = SMBO(space=self.space,
                                 all_budgets=self.budgets.tolist(),
                                 weight_srategy='rank_loss_p_norm',
-                                surrogate='rf',init_budget=0,
+                                init_budget=0,
                                 **kwargs)
 
         for i, b in enumerate(self._max_pop_size.keys()):
@@ -489,22 +499,18 @@ class MFES_BOHB(BOHB):
         self._clean_inactive_brackets()
 
     def _sample_nonduplicate_config(self, num_configs=1):
-        configs = list()
-        sample_cnt = 0
+        index = self.trials.get_space_index()
+        if index is not None and index.n_remaining >= num_configs:
+            return index.configs(self.space, index.sample(num_configs, self.rng))
         max_sample_cnt = 1000
-        while len(configs) < num_configs:
-            config = self.space.sample_configuration()[0]
-            sample_cnt += 1
-            if (not self.trials.is_contain(config)) and config not in configs:
-                configs.append(config)
-                sample_cnt = 0
-                continue
-            if sample_cnt >= max_sample_cnt:
-                logger.warning(
-                    'Cannot sample non duplicate configuration after %d iterations.'
-                    % max_sample_cnt)
-                configs.append(config)
-                sample_cnt = 0
+        configs = self.trials.sample_unseen(
+            self.space, num_configs, max_rounds=max_sample_cnt)
+        if len(configs) < num_configs:
+            logger.warning(
+                'Cannot sample non duplicate configuration after %d iterations.'
+                % max_sample_cnt)
+            configs += self.space.sample_configuration(
+                size=num_configs - len(configs))
         return configs
 
 opt_class = BOHB
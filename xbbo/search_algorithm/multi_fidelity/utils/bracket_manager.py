@@ -652,23 +652,20 @@ class BOHB_ConfigGenerator(ConfigGenerator):
         # self.population_fitness = np.array([np.inf] * pop_size)
         # self.batch_sample_num = int(self.reject_rate * self.pop_size)
     def _sample_nonduplicate_config(self, num_configs=1):
-        configs = list()
-        sample_cnt = 0
+        index = None if self.trials is None else self.trials.get_space_index()
+        if index is not None and index.n_remaining >= num_configs:
+            return index.configs(self.cs, index.sample(num_configs, self.rng))
+        if self.trials is None:
+            return self.cs.sample_configuration(size=num_configs)
         max_sample_cnt = 1000
-        while len(configs) < num_configs:
-            config = self.cs.sample_configuration()[0]
-            sample_cnt += 1
-            if (self.trials is None or not self.trials.is_contain(config)
-                ) and config not in configs:
-                configs.append(config)
-                sample_cnt = 0
-                continue
-            if sample_cnt >= max_sample_cnt:
-                logger.warning(
-                    'Cannot sample non duplicate configuration after %d iterations.'
-                    % max_sample_cnt)
-                configs.append(config)
-                sample_cnt = 0
+        configs = self.trials.sample_unseen(
+            self.cs, num_configs, max_rounds=max_sample_cnt)
+        if len(configs) < num_configs:
+            logger.warning(
+                'Cannot sample non duplicate configuration after %d iterations.'
+                % max_sample_cnt)
+            configs += self.cs.sample_configuration(
+                size=num_configs - len(configs))
         return configs
 
     def get_config(self):
@@ -1,4 +1,5 @@
 from abc import abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 import copy
 import math
 from typing import Optional, List, Tuple, cast
@@ -9,6 +10,7 @@ from xbbo.configspace.space import DenseConfiguration, DenseConfigurationSpace,
 from xbbo.search_algorithm.base import AbstractOptimizer
 from xbbo.core.trials import Trials
 from xbbo.initial_design import ALL_avaliable_design
+from xbbo.utils.checkpoint_store import CheckpointStore, DedupCheckpointStore
 from xbbo.utils.util import create_rng
 # from . import alg_register
 
@@ -60,6 +62,21 @@ class Abstract_PBT_Model():
 
 
 
+def _run_member(model, n_steps, params, load_key, store, save_key):
+    '''
+    One interval of a member (in a worker process): exploit the checkpoint `load_key`
+    and switch to `params` if given, train, evaluate and publish the checkpoint.
+    '''
+    if load_key is not None:
+        model.load_checkpoint(store.get(load_key))
+    if params is not None:
+        model.update_hp(params)
+    model.step(n_steps)
+    loss = model.evaluate()
+    store.put(save_key, model.save_checkpoint())
+    return model, loss
+
+
 # @alg_register.register('pbt')
 class PBT(AbstractOptimizer):
     def __init__(
@@ -143,5 +160,116 @@ class PBT(AbstractOptimizer):
                 self.exploit_and_explore(population_model, losses)
         return losses
 
+    def exploit(self, member: int, losses: np.ndarray) -> Optional[int]:
+        '''
+        Member whose weights `member` should copy, or None to keep training it
+        (truncation selection on the latest losses).
+        '''
+        s_id = np.argsort(losses, kind='stable')
+        top_num = max(int(self.fraction * len(s_id)), 1)
+        if member in s_id[-top_num:] and member not in s_id[:top_num]:
+            return self.rng.choice(s_id[:top_num])
+        return None
+
+    def explore(self, member: int, parent: int) -> DenseConfiguration:
+        '''New config of `member` after copying `parent`: perturb the parent's.'''
+        return DenseConfiguration.from_array(
+            self.space,
+            np.clip(
+                self.population_hp_array[parent] +
+                self.rng.normal(0, 0.1, size=self.dimension), 0, 1))
+
+    def optimize_async(self,
+                       population_model: List[Abstract_PBT_Model],
+                       epoch_num,
+                       interval,
+                       n_workers: int = 1,
+                       store: CheckpointStore = None):
+        '''
+        Asynchronous PBT: members train concurrently on `n_workers` processes. Whenever
+        one finishes an interval it is compared with the latest losses of the others and,
+        if it is in the bottom `fraction`, resumes from the checkpoint of a top member with
+        an explored config (`exploit`/`explore`); nobody waits for the slowest member.
+
+        Checkpoints are exchanged through `store` (a temporary ``DedupCheckpointStore`` by
+        default): exploiting links the parent's checkpoint to the member, and checkpoints
+        no member refers to any more are deleted and evicted with ``store.collect``. The
+        models must be picklable when `n_workers` > 1. The trained models replace the
+        entries of `population_model`.
+
+        Returns
+        -------
+        losses: np.ndarray, final loss of every member
+        '''
+        own_store = store is None
+        store = DedupCheckpointStore() if own_store else store
+        n_members = len(population_model)
+        total_steps = [int(len(model) * epoch_num) for model in population_model]
+        interval_steps = [
+            max(int(interval * len(model)), 1) for model in population_model
+        ]
+        losses = np.array(
+            [getattr(model, 'loss', np.inf) for model in population_model],
+            dtype=float)
+        version = [0] * n_members
+        latest = [None] * n_members  # published checkpoint of every member
+        pending = {}
+        pool = ProcessPoolExecutor(
+            max_workers=n_workers) if n_workers > 1 else None
+
+        def submit(i, params=None, load_key=None):
+            version[i] += 1
+            args = (population_model[i],
+                    min(interval_steps[i],
+                        total_steps[i] - population_model[i].step_num), params,
+                    load_key, store, '{}-{}'.format(i, version[i]))
+            if pool is None:
+                future = Future()
+                future.set_result(_run_member(*args))
+            else:
+                future = pool.submit(_run_member, *args)
+            pending[future] = (i, load_key)
+
+        try:
+            for i in range(n_members):
+                if population_model[i].step_num < total_steps[i]:
+                    submit(i)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda f: pending[f][0]):
+                    i, load_key = pending.pop(future)
+                    population_model[i], losses[i] = future.result()
+                    previous, latest[i] = latest[i], '{}-{}'.format(
+                        i, version[i])
+                    for key in (previous, load_key):
+                        if key is not None:
+                            store.delete(key)
+                    if previous is not None:
+                        store.collect()
+                    self.population_losses_his.append(losses.tolist())
+                    if population_model[i].step_num >= total_steps[i]:
+                        continue
+                    parent = self.exploit(i, losses)
+                    if parent is None or latest[parent] is None:
+                        submit(i)
+                        continue
+                    config = self.explore(i, parent)
+                    self.population_configs[i] = config
+                    self.population_hp_array[i] = config.get_array()
+                    # pointer copy: the parent may publish (and drop) newer checkpoints
+                    load_key = '{}-exploit'.format(i)
+                    store.link(load_key, latest[parent])
+                    submit(i, config.get_dictionary(), load_key)
+        finally:
+            if pool is not None:
+                # shutdown(cancel_futures=True) needs python 3.9
+                for future in pending:
+                    future.cancel()
+                pool.shutdown()
+            if own_store:
+                store.close()
+        assert np.any(np.isfinite(losses)), "ERROR: At Least 1 loss is finite"
+        return losses
+
 
 opt_class = PBT
@@ -38,29 +38,25 @@ class RandomOptimizer(AbstractOptimizer):
 
     def _suggest(self, n_suggestions=1):
         trial_list = []
-        for n in range(n_suggestions):
-            if self.initial_design_configs:
-                config = self.initial_design_configs.pop(0)
-                trial_list.append(
-                    Trial(
-                        configuration=config,
-                        config_dict=config.get_dictionary(),
-                        #   array=config.get_array(sparse=False))
-                    ))
-                continue
-            iter_ = 0
-            while iter_ < 1000:  # remove history suggest
-                config = self.space.sample_configuration()[0]
-                if not self.trials.is_contain(config):
-                    trial_list.append(
-                        Trial(configuration=config,
-                              config_dict=config.get_dictionary(),
-                              array=config.get_array(sparse=False)))
-
-                    break
-                iter_ += 1
-            else:
-                assert False, "no more configs can be suggest"
+        while self.initial_design_configs and len(trial_list) < n_suggestions:
+            config = self.initial_design_configs.pop(0)
+            trial_list.append(
+                Trial(
+                    configuration=config,
+                    config_dict=config.get_dictionary(),
+                    #   array=config.get_array(sparse=False))
+                ))
+        n_random = n_suggestions - len(trial_list)
+        # remove history suggest
+        configs = self.trials.sample_unseen(
+            self.space, n_random,
+            exclude=[trial.configuration for trial in trial_list])
+        assert len(configs) == n_random, "no more configs can be suggest"
+        for config in configs:
+            trial_list.append(
+                Trial(configuration=config,
+                      config_dict=config.get_dictionary(),
+                      array=config.get_array(sparse=False)))
 
         return trial_list
 
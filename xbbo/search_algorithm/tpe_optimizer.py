@@ -11,6 +11,7 @@ from xbbo.core.trials import Trial, Trials
 from xbbo.core.constants import MAXINT
 from . import alg_register
 from xbbo.initial_design import ALL_avaliable_design
+from xbbo.utils.prefetch import SuggestionPrefetcher
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +34,17 @@ class TPE(AbstractOptimizer):
             bandwidth_factor=3,
             min_points_in_model=None,
             random_fraction=1 / 3,
+            prefetch: bool = False,
+            prefetch_deadline: float = 10.,
             **kwargs):
+        '''
+        prefetch: bool
+            Refit the KDEs and sample the next candidate in a background thread right after each
+            observation, so that `suggest` returns the prefetched candidate immediately.
+        prefetch_deadline: float
+            Seconds `suggest` waits for the prefetched candidate before falling back to a random one.
+            The background thread works on its own copy of the model and rng.
+        '''
         AbstractOptimizer.__init__(self,
                                    space,
                                    encoding_cat='round',
@@ -82,167 +93,183 @@ class TPE(AbstractOptimizer):
                 self.vartypes += [0]
 
         self.vartypes = np.array(self.vartypes, dtype=int)
+        self.prefetcher = SuggestionPrefetcher(
+            self, ('kde_models', ), prefetch_deadline) if prefetch else None
 
     def _suggest(self, n_suggestions=1):
         trial_list = []
         if (self.trials.trials_num) < self.init_budget:
             assert self.trials.trials_num % n_suggestions == 0
             configs = self.initial_design_configs[
-                int(n_suggestions *
-                    self.trials.trials_num):int(n_suggestions *
-                                                (self.trials.trials_num + 1))]
+                self.trials.trials_num:self.trials.trials_num + n_suggestions]
             for config in configs:
                 trial_list.append(
                     Trial(configuration=config,
                           config_dict=config.get_dictionary(),
                           array=config.get_array()))
         else:
-            self._fit_kde_models()
-            if len(self.kde_models.keys()
-                   ) == 0 or self.rng.rand() < self.random_fraction:
-                configs = self._sample_nonduplicate_config(n_suggestions)
-                for config in configs:
-                    trial_list.append(
-                        Trial(configuration=config,
-                              config_dict=config.get_dictionary(),
-                              array=config.get_array()))
-            else:
-                for n in range(n_suggestions):
-                    try:
-                        best = np.inf
-                        best_vector = None
-                        l = self.kde_models['good'].pdf
-                        g = self.kde_models['bad'].pdf
-
-                        minimize_me = lambda x: max(1e-32, g(x)) / max(l(x), 1e-32)
-
-                        kde_good = self.kde_models['good']
-                        kde_bad = self.kde_models['bad']
-
-                        for i in range(self.candidates_num):
-                            idx = self.rng.randint(0, len(kde_good.data))
-                            datum = kde_good.data[idx]
-                            vector = []
-
-                            for m, bw, t in zip(datum, kde_good.bw, self.vartypes):
-
-                                bw = max(bw, self.min_bandwidth)
-                                if t == 0:
-                                    bw = self.bw_factor * bw
-                                    try:
-                                        vector.append(
-                                            sps.truncnorm.rvs(-m / bw,
-                                                            (1 - m) / bw,
-                                                            loc=m,
-                                                            scale=bw))
-                                    except:
-                                        logger.warning(
-                                            "Truncated Normal failed for:\ndatum=%s\nbandwidth=%s\nfor entry with value %s"
-                                            % (datum, kde_good.bw, m))
-                                        logger.warning("data in the KDE:\n%s" %
-                                                    kde_good.data)
-                                else:
+            if self.prefetcher is None:
+                return self._model_suggest(n_suggestions, self.trials)
+            return self.prefetcher.get(n_suggestions, self.trials)
+        return trial_list
 
-                                    if self.rng.rand() < (1 - bw):
-                                        vector.append(int(m))
-                                    else:
-                                        vector.append(self.rng.randint(t))
-                            val = minimize_me(vector)
-
-                            if not np.isfinite(val):
-                                logger.warning(
-                                    'sampled vector: %s has EI value %s' %
-                                    (vector, val))
-                                logger.warning("data in the KDEs:\n%s\n%s" %
-                                            (kde_good.data, kde_bad.data))
-                                logger.warning("bandwidth of the KDEs:\n%s\n%s" %
-                                            (kde_good.bw, kde_bad.bw))
-                                logger.warning("l(x) = %s" % (l(vector)))
-                                logger.warning("g(x) = %s" % (g(vector)))
-
-                                # right now, this happens because a KDE does not contain all values for a categorical parameter
-                                # this cannot be fixed with the statsmodels KDE, so for now, we are just going to evaluate this one
-                                # if the good_kde has a finite value, i.e. there is no config with that value in the bad kde, so it shouldn't be terrible.
-                                if np.isfinite(l(vector)):
-                                    best_vector = vector
-                                    break
-
-                            if val < best:
-                                best = val
+    def _random_suggest(self, n_suggestions, trials):
+        return [
+            Trial(configuration=config,
+                  config_dict=config.get_dictionary(),
+                  array=config.get_array())
+            for config in self._sample_nonduplicate_config(
+                n_suggestions, trials)
+        ]
+
+    def _model_suggest(self, n_suggestions, trials):
+        trial_list = []
+        self._fit_kde_models(trials)
+        if len(self.kde_models.keys()
+               ) == 0 or self.rng.rand() < self.random_fraction:
+            configs = self._sample_nonduplicate_config(n_suggestions, trials)
+            for config in configs:
+                trial_list.append(
+                    Trial(configuration=config,
+                          config_dict=config.get_dictionary(),
+                          array=config.get_array()))
+        else:
+            for n in range(n_suggestions):
+                try:
+                    best = np.inf
+                    best_vector = None
+                    l = self.kde_models['good'].pdf
+                    g = self.kde_models['bad'].pdf
+
+                    minimize_me = lambda x: max(1e-32, g(x)) / max(l(x), 1e-32)
+
+                    kde_good = self.kde_models['good']
+                    kde_bad = self.kde_models['bad']
+
+                    for i in range(self.candidates_num):
+                        idx = self.rng.randint(0, len(kde_good.data))
+                        datum = kde_good.data[idx]
+                        vector = []
+
+                        for m, bw, t in zip(datum, kde_good.bw, self.vartypes):
+
+                            bw = max(bw, self.min_bandwidth)
+                            if t == 0:
+                                bw = self.bw_factor * bw
+                                try:
+                                    vector.append(
+                                        sps.truncnorm.rvs(-m / bw,
+                                                        (1 - m) / bw,
+                                                        loc=m,
+                                                        scale=bw))
+                                except:
+                                    logger.warning(
+                                        "Truncated Normal failed for:\ndatum=%s\nbandwidth=%s\nfor entry with value %s"
+                                        % (datum, kde_good.bw, m))
+                                    logger.warning("data in the KDE:\n%s" %
+                                                kde_good.data)
+                            else:
+
+                                if self.rng.rand() < (1 - bw):
+                                    vector.append(int(m))
+                                else:
+                                    vector.append(self.rng.randint(t))
+                        val = minimize_me(vector)
+
+                        if not np.isfinite(val):
+                            logger.warning(
+                                'sampled vector: %s has EI value %s' %
+                                (vector, val))
+                            logger.warning("data in the KDEs:\n%s\n%s" %
+                                        (kde_good.data, kde_bad.data))
+                            logger.warning("bandwidth of the KDEs:\n%s\n%s" %
+                                        (kde_good.bw, kde_bad.bw))
+                            logger.warning("l(x) = %s" % (l(vector)))
+                            logger.warning("g(x) = %s" % (g(vector)))
+
+                            # right now, this happens because a KDE does not contain all values for a categorical parameter
+                            # this cannot be fixed with the statsmodels KDE, so for now, we are just going to evaluate this one
+                            # if the good_kde has a finite value, i.e. there is no config with that value in the bad kde, so it shouldn't be terrible.
+                            if np.isfinite(l(vector)):
                                 best_vector = vector
+                                break
+
+                        if val < best:
+                            best = val
+                            best_vector = vector
 
-                        if best_vector is None:
-                            logger.debug(
-                                "Sampling based optimization with %i samples failed -> using random configuration"
-                                % self.candidates_num)
-                            config = self._sample_nonduplicate_config()[0]
-                        else:
-                            logger.debug('best_vector: {}, {}, {}, {}'.format(
-                                best_vector, best, l(best_vector), g(best_vector)))
-                            for i, hp_value in enumerate(best_vector):
-                                if isinstance(
-                                        self.space.get_hyperparameter(
-                                            self.space.get_hyperparameter_by_idx(
-                                                i)), ConfigSpace.hyperparameters.
-                                        CategoricalHyperparameter):
-                                    best_vector[i] = int(np.rint(best_vector[i]))
-                            config = DenseConfiguration.from_array(
-                            self.space, np.asarray(best_vector))
-                        try:
-                            config = deactivate_inactive_hyperparameters(
-                                        configuration_space=self.space,
-                                        configuration=config.get_dictionary()
-                                        )
-
-                        except Exception as e:
-                            logger.warning(("="*50 + "\n")*3 +\
-                                    "Error converting configuration:\n%s"%config+\
-                                    "\n here is a traceback:" +\
-                                    traceback.format_exc())
-                            raise(e)
-
-
-                    except:
-                        logger.warning("Sampling based optimization with %i samples failed\n %s \nUsing random configuration"%(self.num_samples, traceback.format_exc()))
-                        # config = self._sample_nonduplicate_config()[0]
-                        config = self.space.sample_configuration()[0]
-                    trial_list.append(
-                            Trial(configuration=config,
-                                config_dict=config.get_dictionary(),
-                                array=config.get_array()))
+                    if best_vector is None:
+                        logger.debug(
+                            "Sampling based optimization with %i samples failed -> using random configuration"
+                            % self.candidates_num)
+                        config = self._sample_nonduplicate_config(1, trials)[0]
+                    else:
+                        logger.debug('best_vector: {}, {}, {}, {}'.format(
+                            best_vector, best, l(best_vector), g(best_vector)))
+                        for i, hp_value in enumerate(best_vector):
+                            if isinstance(
+                                    self.space.get_hyperparameter(
+                                        self.space.get_hyperparameter_by_idx(
+                                            i)), ConfigSpace.hyperparameters.
+                                    CategoricalHyperparameter):
+                                best_vector[i] = int(np.rint(best_vector[i]))
+                        config = DenseConfiguration.from_array(
+                        self.space, np.asarray(best_vector))
+                    try:
+                        config = deactivate_inactive_hyperparameters(
+                                    configuration_space=self.space,
+                                    configuration=config.get_dictionary()
+                                    )
+
+                    except Exception as e:
+                        logger.warning(("="*50 + "\n")*3 +\
+                                "Error converting configuration:\n%s"%config+\
+                                "\n here is a traceback:" +\
+                                traceback.format_exc())
+                        raise(e)
+
+
+                except:
+                    logger.warning("Sampling based optimization with %i samples failed\n %s \nUsing random configuration"%(self.num_samples, traceback.format_exc()))
+                    # config = self._sample_nonduplicate_config()[0]
+                    config = self.space.sample_configuration()[0]
+                trial_list.append(
+                        Trial(configuration=config,
+                            config_dict=config.get_dictionary(),
+                            array=config.get_array()))
         return trial_list
 
-    def _sample_nonduplicate_config(self, num_configs=1):
-        configs = list()
-        sample_cnt = 0
+    def _sample_nonduplicate_config(self, num_configs=1, trials=None):
+        if trials is None:
+            trials = self.trials
+        index = trials.get_space_index()
+        if index is not None and index.n_remaining >= num_configs:
+            return index.configs(self.space, index.sample(num_configs, self.rng))
         max_sample_cnt = 1000
-        while len(configs) < num_configs:
-            config = self.space.sample_configuration()[0]
-            sample_cnt += 1
-            if (not self.trials.is_contain(config)) and config not in configs:
-                configs.append(config)
-                sample_cnt = 0
-                continue
-            if sample_cnt >= max_sample_cnt:
-                logger.warning(
-                    'Cannot sample non duplicate configuration after %d iterations.'
-                    % max_sample_cnt)
-                configs.append(config)
-                sample_cnt = 0
+        configs = trials.sample_unseen(
+            self.space, num_configs, max_rounds=max_sample_cnt)
+        if len(configs) < num_configs:
+            logger.warning(
+                'Cannot sample non duplicate configuration after %d iterations.'
+                % max_sample_cnt)
+            configs += self.space.sample_configuration(
+                size=num_configs - len(configs))
         return configs
 
-    def _fit_kde_models(self, ):
-        train_configs = self.trials.get_array()
+    def _fit_kde_models(self, trials=None):
+        if trials is None:
+            trials = self.trials
+        train_configs = trials.get_array()
         if train_configs is None:
             return
         n_good = max(self.min_points_in_model,
-                     int(self.gamma * self.trials.trials_num) // 100)
+                     int(self.gamma * trials.trials_num) // 100)
         # n_bad = min(max(self.min_points_in_model, ((100-self.top_n_percent)*train_configs.shape[0])//100), 10)
         n_bad = max(self.min_points_in_model,
-                    int((1 - self.gamma) * self.trials.trials_num))
+                    int((1 - self.gamma) * trials.trials_num))
 
         # Refit KDE for the current budget
-        idx = np.argsort(self.trials._his_observe_value)
+        idx = np.argsort(trials._his_observe_value)
 
         train_data_good = self.impute_conditional_data(
             train_configs[idx[:n_good]])
@@ -271,6 +298,13 @@ class TPE(AbstractOptimizer):
     def _observe(self, trial_list):
         for trial in trial_list:
             self.trials.add_a_trial(trial, permit_duplicate=True)
+        if self.prefetcher is not None and self.trials.trials_num >= self.init_budget:
+            self.prefetcher.schedule(self.trials)
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        AbstractOptimizer.close(self)
 
     def impute_conditional_data(self, array):
 
@@ -9,9 +9,12 @@ from xbbo.surrogate.gaussian_process import GPR_sklearn
 from . import alg_register
 from xbbo.core.trials import Trial, Trials
 from xbbo.initial_design import ALL_avaliable_design
+from xbbo.utils.prefetch import SuggestionPrefetcher
 from xbbo.acquisition_function.acq_optimizer import InterleavedLocalAndRandomSearch, LocalSearch, RandomScipyOptimizer, RandomSearch, ScipyGlobalOptimizer, ScipyOptimizer
 from xbbo.surrogate.transfer.weight_stategy import KernelRegress, RankingWeight, ZeroWeight
 from xbbo.surrogate.transfer.tst import BaseModel, TST_surrogate
+from xbbo.surrogate.transfer.model_cache import BaseModelCache
+from xbbo.surrogate.transfer.task_selection import SourceTaskSelector
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +32,28 @@ class TransferBO(AbstractOptimizer):
                  acq_opt: str = 'rs_ls',
                  predict_x_best: bool = False,
                  weight_srategy: str = 'kernel',
+                 prefetch: bool = False,
+                 prefetch_deadline: float = 10.,
+                 base_model_cache: str = None,
+                 n_active_tasks: int = None,
+                 n_probe: int = 256,
                  **kwargs):
+        '''
+        prefetch: bool
+            Refit the target surrogate, the source weights and maximize the acquisition function in a
+            background thread right after each observation, so that `suggest` returns the prefetched
+            candidate immediately.
+        prefetch_deadline: float
+            Seconds `suggest` waits for the prefetched candidate before falling back to a random one.
+            The background thread works on its own copy of the model and rng.
+        base_model_cache: str
+            Directory of an on-disk cache of fitted source-task GPs shared across runs (see
+            `BaseModelCache`). None fits the base models in every run.
+        n_active_tasks: int
+            Only use this many source tasks whose response surfaces on a shared probe set of
+            `n_probe` points rank most like the target model's (see `SourceTaskSelector`); refreshed
+            on every suggest. None uses all source tasks.
+        '''
         AbstractOptimizer.__init__(self,
                                    space,
                                    encoding_cat='bin',
@@ -61,6 +85,17 @@ class TransferBO(AbstractOptimizer):
         self._weight_srategy = weight_srategy
         self._acq_opt = acq_opt
         self._suggest_limit = suggest_limit
+        # the model attributes are set by get_transfer_knowledge, before
+        # the first prefetch copies them
+        self.prefetcher = SuggestionPrefetcher(
+            self, ('surrogate_model', 'acquisition_func', 'acq_maximizer',
+                   'weight_sratety', 'base_models', 'task_selector'),
+            prefetch_deadline) if prefetch else None
+        self.base_model_cache = BaseModelCache(
+            base_model_cache) if base_model_cache else None
+        self.n_active_tasks = n_active_tasks
+        self.n_probe = n_probe
+        self.task_selector = None
 
     def _suggest(self, n_suggestions=1):
         trial_list = []
@@ -68,56 +103,80 @@ class TransferBO(AbstractOptimizer):
         if (self.trials.trials_num) < self.init_budget:
             assert self.trials.trials_num % n_suggestions == 0
             configs = self.initial_design_configs[
-                int(n_suggestions *
-                    self.trials.trials_num):int(n_suggestions *
-                                                (self.trials.trials_num + 1))]
+                self.trials.trials_num:self.trials.trials_num + n_suggestions]
             for config in configs:
                 trial_list.append(
                     Trial(configuration=config,
                           config_dict=config.get_dictionary(),
                           array=config.get_array(sparse=True)))
         else:
-            # update target surrogate model
-            self.surrogate_model.train(
-                np.asarray(self.trials.get_array()),
-                np.asarray(self.trials.get_history()[0]))
-            # calculate base incuments (only use for acq base EI)
-            observed_X = self.trials.get_array()
-            base_incuments = []
-            for model in self.base_models:  # TODO make sure untransform ?
-                base_incuments.append(model.predict(observed_X, None)[0].min())
-            _, best_val = self._get_x_best(self.predict_x_best)
-            self.acquisition_func.update(surrogate_model=self.surrogate_model,
-                                         y_best=best_val,
-                                         _base_incuments=base_incuments)
-            # caculate weight for base+target model
-            weight = self.weight_sratety.get_weight(self.trials)
-            self.surrogate_model.update_weight(weight)
-            self.acquisition_func.update_weight(weight)
-            # acq maximize
-            configs = []
-            configs = self.acq_maximizer.maximize(self.trials,
-                                                  1000,
-                                                  drop_self_duplicate=True,
-                                                  _sorted=True)
-            _idx = 0
-            for n in range(n_suggestions):
-                while _idx < len(configs):  # remove history suggest
-                    if not self.trials.is_contain(configs[_idx]):
-                        config = configs[_idx]
-                        configs.append(config)
-                        trial_list.append(
-                            Trial(configuration=config,
-                                  config_dict=config.get_dictionary(),
-                                  array=config.get_array(sparse=True)))
-                        _idx += 1
-
-                        break
+            if self.prefetcher is None:
+                return self._model_suggest(n_suggestions, self.trials)
+            return self.prefetcher.get(n_suggestions, self.trials)
+
+        return trial_list
+
+    def _random_suggest(self, n_suggestions, trials):
+        trial_list = []
+        # remove history suggest
+        configs = trials.sample_unseen(self.space, n_suggestions)
+        assert len(configs) == n_suggestions, "no more configs can be suggest"
+        for config in configs:
+            trial_list.append(
+                Trial(configuration=config,
+                      config_dict=config.get_dictionary(),
+                      array=config.get_array(sparse=True)))
+        return trial_list
+
+    def _model_suggest(self, n_suggestions, trials):
+        trial_list = []
+        # update target surrogate model
+        self.surrogate_model.train(
+            np.asarray(trials.get_array()),
+            np.asarray(trials.get_history()[0]))
+        if self.task_selector is not None:
+            # shared with the weight strategy, surrogate and acquisition function
+            self.base_models[:] = self.task_selector.select(
+                self.surrogate_model)
+        # calculate base incuments (only use for acq base EI)
+        observed_X = trials.get_array()
+        base_incuments = []
+        for model in self.base_models:  # TODO make sure untransform ?
+            base_incuments.append(model.predict(observed_X, None)[0].min())
+        _, best_val = self._get_x_best(self.predict_x_best, trials)
+        self.acquisition_func.update(surrogate_model=self.surrogate_model,
+                                     y_best=best_val,
+                                     _base_incuments=base_incuments)
+        # caculate weight for base+target model
+        weight = self.weight_sratety.get_weight(trials)
+        self.surrogate_model.update_weight(weight)
+        self.acquisition_func.update_weight(weight)
+        # acq maximize
+        configs = []
+        configs = self.acq_maximizer.maximize(trials,
+                                              1000,
+                                              drop_self_duplicate=True,
+                                              _sorted=True)
+        _idx = 0
+        seen = list(trials.contains(configs))
+        for n in range(n_suggestions):
+            while _idx < len(configs):  # remove history suggest
+                if not seen[_idx]:
+                    config = configs[_idx]
+                    configs.append(config)
+                    seen.append(False)
+                    trial_list.append(
+                        Trial(configuration=config,
+                              config_dict=config.get_dictionary(),
+                              array=config.get_array(sparse=True)))
                     _idx += 1
-                else:
-                    assert False, "no more configs can be suggest"
-                # surrogate = TST_surrogate(self.gps, self.target_model,
-                #   self.similarity, self.rho)
+
+                    break
+                _idx += 1
+            else:
+                assert False, "no more configs can be suggest"
+            # surrogate = TST_surrogate(self.gps, self.target_model,
+            #   self.similarity, self.rho)
 
         return trial_list
 
@@ -125,8 +184,15 @@ class TransferBO(AbstractOptimizer):
         # print(y)
         for trial in trial_list:
             self.trials.add_a_trial(trial)
+        if self.prefetcher is not None and self.trials.trials_num >= self.init_budget:
+            self.prefetcher.schedule(self.trials)
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        AbstractOptimizer.close(self)
 
-    def _get_x_best(self, predict: bool) -> typing.Tuple[float, np.ndarray]:
+    def _get_x_best(self, predict: bool, trials: Trials) -> typing.Tuple[float, np.ndarray]:
         """Get value, configuration, and array representation of the "best" configuration.
 
         The definition of best varies depending on the argument ``predict``. If set to ``True``,
@@ -137,6 +203,8 @@ class TransferBO(AbstractOptimizer):
         ----------
         predict : bool
             Whether to use the predicted or observed best.
+        trials : Trials
+            History to pick the best from.
 
         Returns
         -------
@@ -145,7 +213,7 @@ class TransferBO(AbstractOptimizer):
         Configuration
         """
         if predict:
-            X = self.trials.get_array()
+            X = trials.get_array()
             costs = list(
                 map(
                     lambda x: (
@@ -159,9 +227,9 @@ class TransferBO(AbstractOptimizer):
             best_observation = costs[0][0]
             # won't need log(y) if EPM was already trained on log(y)
         else:
-            best_idx = self.trials.best_id
-            x_best_array = self.trials.get_array()[best_idx]
-            best_observation = self.trials.best_observe_value
+            best_idx = trials.best_id
+            x_best_array = trials.get_array()[best_idx]
+            best_observation = trials.best_observe_value
 
         return x_best_array, best_observation
 
@@ -169,7 +237,18 @@ class TransferBO(AbstractOptimizer):
         self.base_models = []
         for i in range(len(old_D_X)):
             self.base_models.append(BaseModel(self.space, rng=self.rng, do_optimize=False))
-            self.base_models[-1].train(old_D_X[i], old_D_y[i])
+            if self.base_model_cache is None:
+                self.base_models[-1].train(old_D_X[i], old_D_y[i])
+            else:
+                self.base_model_cache.train(self.base_models[-1], old_D_X[i],
+                                            old_D_y[i])
+        if self.n_active_tasks and self.n_active_tasks < len(self.base_models):
+            self.task_selector = SourceTaskSelector(self.space,
+                                                    self.base_models,
+                                                    self.n_active_tasks,
+                                                    self.rng,
+                                                    n_probe=self.n_probe)
+            self.base_models = self.task_selector.active
         # self.base_models = kwargs.get("base_models")
         if self.base_models:
             assert isinstance(self.base_models[0], BaseModel)
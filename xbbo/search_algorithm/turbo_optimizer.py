@@ -1,8 +1,8 @@
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import math
 from copy import deepcopy
-import warnings
 from scipy.stats.qmc import Sobol
 
 import numpy as np
@@ -13,6 +13,7 @@ from xbbo.configspace.space import DenseConfiguration, DenseConfigurationSpace
 from xbbo.core.trials import Trial, Trials
 from xbbo.initial_design import ALL_avaliable_design
 from xbbo.surrogate.gaussian_process import GPR_sklearn
+from xbbo.surrogate.posterior_sampling import sample_blocks, sample_exact, sample_pathwise
 
 
 from xbbo.core.constants import MAXINT
@@ -46,8 +47,39 @@ class TuRBO_state():
                  length_max=1.6,
                  length_min=0.5**7,
                  length_init=0.8,
+                 sampler='auto',
+                 max_cholesky_size=2000,
+                 n_features=1024,
+                 warm_start=False,
+                 n_warm_restarts=1,
                  **kwargs) -> None:
+        '''
+        sampler: str
+            Thompson sampling backend: 'exact' (Cholesky of the full posterior covariance),
+            'pathwise' (random Fourier feature prior + exact data update, linear in the number
+            of candidates), 'block' (exact within blocks of candidates) or 'auto' ('exact' up to
+            `max_cholesky_size` candidates, 'pathwise' above).
+        n_features: int
+            Number of random Fourier features of the 'pathwise' sampler.
+        warm_start: bool
+            Keep the kernel hyperparameters of the region across restarts and, once the region
+            has been fitted, start the likelihood optimization from them with only
+            `n_warm_restarts` random restarts. Otherwise a restarted region starts from the
+            initial hyperparameters.
+        '''
+        if sampler not in ('auto', 'exact', 'pathwise', 'block'):
+            raise ValueError('sampler {} not in {}'.format(
+                sampler, ['auto', 'exact', 'pathwise', 'block']))
+        self.sampler = sampler
+        self.max_cholesky_size = max_cholesky_size
+        self.n_features = n_features
+        self.warm_start = warm_start
+        self.n_warm_restarts = n_warm_restarts
         self.surrogate_model = surrogate_model
+        self.init_hypers = surrogate_model.kernel.theta.copy()
+        self.n_opt_restarts = surrogate_model.n_opt_restarts
+        self._train_idx = None  # trials the model was last trained on
+        self._stale = False
         # self.hyper = self.surrogate_models.hypers
         self.dim = dim
         self.marker = marker
@@ -70,27 +102,64 @@ class TuRBO_state():
         self.fail_count = 0
         self.center = None
         self.center_value = np.inf
+        if not self.warm_start:
+            self.surrogate_model.kernel.theta = self.init_hypers
+            self.surrogate_model.n_opt_restarts = self.n_opt_restarts
 
     def _train(self, X, Y):
         # self.surrogate_model.do_optimize = self.do_optimize
         self.surrogate_model.train(X, Y)
+        if self.warm_start:
+            self.surrogate_model.n_opt_restarts = min(self.n_warm_restarts,
+                                                      self.n_opt_restarts)
         # self.do_optimize = False
 
+    def fit(self, trials: Trials):
+        '''
+        Retrain the model if `update` marked it stale and the trials of the region changed.
+
+        Returns
+        -------
+        bool, whether the model was retrained
+        '''
+        if not self._stale:
+            return False
+        self._stale = False
+        idx = np.flatnonzero(np.array(trials.markers) == self.marker)
+        if len(idx) < self.n_min_sample or (
+                self._train_idx is not None
+                and np.array_equal(idx, self._train_idx)):
+            return False
+        X = self.to_unit_cube(trials.get_array()[idx])
+        Y = np.array(trials._his_observe_value)[idx]
+        self._train(X, Y)
+        self._train_idx = idx
+        return True
+
     def sample_y(self, X, size=1):
-        mean, var = self.surrogate_model.predict_marginalized_over_instances(
-            X, 'full_cov')
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            try:
-                sample = self.rng.multivariate_normal(mean.ravel(), var,
-                                            size=size).T  # (sample, N)
-            except:
-                sample = self.rng.multivariate_normal(mean.ravel(), np.diag(np.diag(var)),
-                                            size=size).T # TODO
-                
-        return sample
+        '''
+        Returns
+        -------
+        np.ndarray (N, size)
+        '''
+        sampler = self.sampler
+        if sampler == 'auto':
+            sampler = 'exact' if X.shape[0] <= self.max_cholesky_size else 'pathwise'
+        if sampler == 'exact':
+            return sample_exact(self.surrogate_model, X, size, self.rng)
+        elif sampler == 'block':
+            return sample_blocks(self.surrogate_model, X, size, self.rng)
+        return sample_pathwise(self.surrogate_model,
+                               X,
+                               size,
+                               self.rng,
+                               n_features=self.n_features)
 
     def update(self, trial: Trial, trials: Trials, obs_num: int):
+        '''
+        Adapt the trust region to the best new `trial` of this region. The
+        model is retrained by the following `fit`.
+        '''
         markers = np.array(trials.markers)
         idx = markers == self.marker
         if idx.sum() < self.n_min_sample:
@@ -132,10 +201,7 @@ class TuRBO_state():
             # Remove points from trust region
             markers[idx] = -1
             trials.markers = list(markers)
-
-        X = self.to_unit_cube((trials.get_array())[idx])
-        Y = np.array(trials._his_observe_value)[idx]
-        self._train(X, Y)
+        self._stale = True
     
     def _get_length_scale(self):
         ks = self.surrogate_model.kernel
@@ -225,17 +291,26 @@ class TuRBO(AbstractOptimizer):
         self.n_training_steps = kwargs.get("n_training_steps", 50)
         self.max_cholesky_size = kwargs.get("max_cholesky_size", 2000)
         self.dim = self.dimension
-        self.n_candidates = 2**int(np.log2(min(100 * self.dim, 5000)))
+        self.n_candidates = kwargs.get(
+            "n_candidates", 2**int(np.log2(min(100 * self.dim, 5000))))
         self.use_ard = kwargs.get("use_ard", True)
         self.num_tr = num_tr
         self.candidates = []
+        # trust regions are fitted and sampled concurrently on `n_workers` threads
+        self.n_workers = min(kwargs.get("n_workers", 1), num_tr)
+        self._executor = None
 
         if surrogate == 'gp':
+            # one random stream per region, independent of the scheduling
+            rngs = [
+                np.random.RandomState(self.rng.randint(MAXINT))
+                for _ in range(num_tr)
+            ]
             self.turbo_states = [
-                TuRBO_state(GPR_sklearn(self.space, types=self.space._types, bounds=self.space._bounds,rng=self.rng),
+                TuRBO_state(GPR_sklearn(self.space, types=self.space._types, bounds=self.space._bounds,rng=rngs[i]),
                             i,
                             self.bounds,
-                            self.rng,
+                            rngs[i],
                             self.dim,
                             n_min_sample=self.n_min_sample,
                             **kwargs) for i in range(num_tr)
@@ -247,6 +322,20 @@ class TuRBO(AbstractOptimizer):
             raise ValueError('surrogate {} not in {}'.format(
                 surrogate, ['gp']))
 
+    def _map_states(self, fn, states):
+        if self.n_workers <= 1 or len(states) <= 1:
+            return [fn(state) for state in states]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.n_workers, thread_name_prefix='xbbo-turbo')
+        return list(self._executor.map(fn, states))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        AbstractOptimizer.close(self)
+
     def _suggest(self, n_suggestions=1):
         markers = np.array(self.trials.markers)
 
@@ -260,10 +349,13 @@ class TuRBO(AbstractOptimizer):
         X_cand = np.empty((self.num_tr, self.n_candidates, self.dim))
         y_cand = np.full(
             (self.num_tr, self.n_candidates, n_suggestions), np.inf)
-        for m in range(self.num_tr):
-            cand = self.turbo_states[m].create_candidates(self.n_candidates)
-            cand_y = self.turbo_states[m].sample_y(cand, size=n_suggestions)
 
+        def sample(state):
+            cand = state.create_candidates(self.n_candidates)
+            return cand, state.sample_y(cand, size=n_suggestions)
+
+        for m, (cand, cand_y) in enumerate(
+                self._map_states(sample, self.turbo_states)):
             X_cand[m, :, :], y_cand[m, :, :] = cand, cand_y
 
         X_next = np.empty((n_suggestions, self.dim))
@@ -299,6 +391,9 @@ class TuRBO(AbstractOptimizer):
                                 key=lambda x: x[0])[0][1]
             self.turbo_states[marker].update(best_trial, self.trials,
                                              len(trial_list))
+        # only regions that received new trials are refitted
+        self._map_states(lambda state: state.fit(self.trials),
+                         [self.turbo_states[m] for m in update_markers])
 
         # markers = self.trials.markers
         # for m in update_markers:
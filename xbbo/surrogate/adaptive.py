@@ -0,0 +1,166 @@
+import logging
+import time
+import typing
+import numpy as np
+
+from xbbo.configspace.space import DenseConfigurationSpace
+from xbbo.surrogate.base import SurrogateModel
+from xbbo.utils.util import get_types
+
+logger = logging.getLogger(__name__)
+
+
+def _build_surrogate(name, configspace, rng):
+    if name == 'gp':
+        from xbbo.surrogate.gaussian_process import GPR_sklearn
+        return GPR_sklearn(configspace, rng=rng)
+    elif name == 'rf':
+        from xbbo.surrogate.skrf import RandomForestSurrogate
+        return RandomForestSurrogate(configspace, rng=rng)
+    elif name == 'prf':
+        from xbbo.surrogate.prf import RandomForestWithInstances
+        return RandomForestWithInstances(configspace, rng=rng)
+    elif name == 'sk_prf':
+        from xbbo.surrogate.sk_prf import skRandomForestWithInstances
+        return skRandomForestWithInstances(configspace, rng=rng)
+    elif name == 'irf':
+        from xbbo.surrogate.incremental_rf import IncrementalRandomForest
+        return IncrementalRandomForest(configspace, rng=rng)
+    raise ValueError('surrogate {} not in {}'.format(
+        name, ['gp', 'rf', 'prf', 'sk_prf', 'irf']))
+
+
+class AdaptiveSurrogate(SurrogateModel):
+    """Use the first of `candidates` that fits in a per-suggest latency budget.
+
+    Every ``train`` measures the fit time of the active model and the time
+    spent predicting with it since the previous ``train`` (i.e. by the
+    acquisition maximizer), extrapolates both to the new history size and
+    moves on to the next (cheaper) candidate when the estimate exceeds
+    `latency_budget` seconds. Candidates are ordered from most accurate to
+    cheapest, e.g. ``('gp', 'irf')``; the history only grows, so the switch
+    is never reverted.
+
+    The hold-out rank accuracy of the active model is tracked as well: the
+    rows added since the previous ``train`` are predicted before fitting on
+    them and compared pairwise against all older observations.
+
+    Attributes
+    ----------
+    active : str
+        Name of the current model.
+    switches : list of dict
+        ``{'n_train', 'from', 'to', 'estimated_cost'}`` of every switch.
+    """
+    def __init__(self,
+                 configspace: DenseConfigurationSpace,
+                 candidates: typing.Sequence[str] = ('gp', 'irf'),
+                 latency_budget: float = 1.,
+                 rng: np.random.RandomState = np.random.RandomState(42),
+                 types=None,
+                 bounds=None,
+                 **kwargs):
+        if types is None or bounds is None:
+            types, bounds = get_types(configspace)
+        super().__init__(types=types, bounds=bounds, **kwargs)
+        self.configspace = configspace
+        self.rng = rng
+        self.candidates = list(candidates)
+        self.latency_budget = latency_budget
+        self.switches = []
+        self.rank_accuracy = {}
+        self._active_idx = 0
+        self.model = _build_surrogate(self.active, configspace, rng)
+        self._fit_history = []  # (n_train, fit_time) of the active model
+        self._predict_time = 0.
+        self._X = None
+        self._y = None
+
+    @property
+    def active(self):
+        return self.candidates[self._active_idx]
+
+    def _estimate_cost(self, n):
+        '''Fit + predict seconds of the next suggest with `n` observations.'''
+        if not self._fit_history:
+            return 0.
+        n_last, fit_time = self._fit_history[-1]
+        # empirical complexity of the fit from the last two measurements
+        power = 1.
+        if len(self._fit_history) > 1:
+            n_prev, t_prev = self._fit_history[-2]
+            if n_last > n_prev and t_prev > 0 and fit_time > 0:
+                power = np.clip(
+                    np.log(fit_time / t_prev) / np.log(n_last / n_prev), 1.,
+                    3.)
+        growth = n / max(n_last, 1)
+        return fit_time * growth**power + self._predict_time * growth
+
+    def _update_rank_accuracy(self, X, y):
+        n_old = self._X.shape[0]
+        if X.shape[0] <= n_old or not np.array_equal(X[:n_old], self._X):
+            return
+        pred = self.model.predict(X[n_old:])[0].reshape(-1)
+        y_new, y_old = y[n_old:], y[:n_old]
+        acc = np.mean((pred[:, None] > y_old[None, :]) == (
+            y_new[:, None] > y_old[None, :]))
+        prev = self.rank_accuracy.get(self.active)
+        self.rank_accuracy[self.active] = acc if prev is None else \
+            0.8 * prev + 0.2 * acc
+
+    def _train(self, X: np.ndarray, y: np.ndarray, **kwargs):
+        y = y.reshape(-1)
+        if self._X is not None:
+            self._update_rank_accuracy(X, y)
+        n = X.shape[0]
+        while self._active_idx + 1 < len(self.candidates):
+            cost = self._estimate_cost(n)
+            if cost <= self.latency_budget:
+                break
+            logger.info(
+                'Switch surrogate %s -> %s at %d observations (estimated %.3fs per suggest > %.3fs).',
+                self.active, self.candidates[self._active_idx + 1], n, cost,
+                self.latency_budget)
+            self.switches.append({
+                'n_train': n,
+                'from': self.active,
+                'to': self.candidates[self._active_idx + 1],
+                'estimated_cost': float(cost)
+            })
+            self._active_idx += 1
+            self.model = _build_surrogate(self.active, self.configspace,
+                                          self.rng)
+            self._fit_history = []
+            self._predict_time = 0.
+        st = time.perf_counter()
+        self.model.train(X, y)
+        self._fit_history = self._fit_history[-1:] + [
+            (n, time.perf_counter() - st)
+        ]
+        self._predict_time = 0.
+        self._X, self._y = X, y
+        return self
+
+    def _predict(self, X: np.ndarray, cov_return_type='diagonal_cov', **kwargs):
+        st = time.perf_counter()
+        ret = self.model.predict(X, cov_return_type)
+        self._predict_time += time.perf_counter() - st
+        return ret
+
+    def predict_marginalized_over_instances(self, X: np.ndarray, *args,
+                                            **kwargs):
+        st = time.perf_counter()
+        ret = self.model.predict_marginalized_over_instances(X)
+        self._predict_time += time.perf_counter() - st
+        return ret
+
+    def state(self):
+        '''Summary of the model behind the current suggestion.'''
+        n_train, fit_time = self._fit_history[-1] if self._fit_history else (0, 0.)
+        return {
+            'active': self.active,
+            'n_train': n_train,
+            'fit_time': fit_time,
+            'rank_accuracy': self.rank_accuracy.get(self.active),
+            'switches': list(self.switches)
+        }
@@ -11,6 +11,7 @@ from skopt.learning.gaussian_process.kernels import Kernel
 from skopt.learning.gaussian_process import GaussianProcessRegressor
 
 from xbbo.configspace.space import DenseConfigurationSpace
+from xbbo.core.tracer import span
 from xbbo.surrogate.gp_prior import Prior, SoftTopHatPrior, TophatPrior
 
 
@@ -143,7 +144,9 @@ class SurrogateModel(object):
                     dtype=np.uint,
                 )
 
-        return self._train(X, Y)
+        with span('surrogate.train', rows=X.shape[0],
+                  model=type(self).__name__):
+            return self._train(X, Y)
 
     def _train(self, X: np.ndarray, Y: np.ndarray, **kwargs) -> 'SurrogateModel':
         """Trains the random forest on X and y.
@@ -208,7 +211,9 @@ class SurrogateModel(object):
                     'Rows in X should have %d entries but have %d!' %
                     (len(self.types), X.shape[1]))
 
-            mean, var = self._predict(X, cov_return_type=cov_return_type)
+            with span('surrogate.predict', rows=X.shape[0],
+                      model=type(self).__name__):
+                mean, var = self._predict(X, cov_return_type=cov_return_type)
             if cov_return_type is None:
                 return mean, var
             if len(mean.shape) == 1:
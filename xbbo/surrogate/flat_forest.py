@@ -0,0 +1,180 @@
+import itertools
+import numpy as np
+
+
+class FlatForest():
+    '''
+    Array-backed copy of a fitted sklearn tree ensemble for batch prediction.
+
+    The nodes of all trees are laid out contiguously (feature, threshold,
+    left/right child, leaf mean, leaf variance), so all (tree, point) pairs
+    descend one level per step with a few gathers instead of tree-by-tree
+    python calls. Leaves point to themselves.
+
+    For large batches the gathers get memory bound and the compiled
+    per-tree ``tree_.apply`` is faster; above `vectorize_max_pairs`
+    (tree, point) pairs the leaves are located with it instead.
+    '''
+    def __init__(self, estimators, vectorize_max_pairs: int = 2**14):
+        self.vectorize_max_pairs = vectorize_max_pairs
+        self._trees = [est.tree_ for est in estimators]
+        features, thresholds, lefts, rights, means, vars_, roots = [], [], [], [], [], [], []
+        offset = 0
+        self.max_depth = 0
+        for est in estimators:
+            tree = est.tree_
+            n = tree.node_count
+            idx = np.arange(n)
+            is_leaf = tree.children_left < 0
+            left = np.where(is_leaf, idx, tree.children_left) + offset
+            right = np.where(is_leaf, idx, tree.children_right) + offset
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(left)
+            rights.append(right)
+            means.append(tree.value[:, 0, 0])
+            vars_.append(tree.impurity)
+            roots.append(offset)
+            offset += n
+            self.max_depth = max(self.max_depth, tree.max_depth)
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.leaf_mean = np.concatenate(means)
+        self.leaf_var = np.concatenate(vars_)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.children = np.stack((self.left, self.right), axis=1)
+        self.is_leaf = self.left == np.arange(self.left.shape[0])
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        '''
+        Leaf index of every (tree, point).
+
+        Returns
+        -------
+        np.ndarray (n_trees, N)
+        '''
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, d = X.shape
+        if n * self.n_trees > self.vectorize_max_pairs:
+            return np.stack([
+                tree.apply(X) + root
+                for tree, root in zip(self._trees, self.roots)
+            ])
+        X_flat = X.ravel()
+        node = np.repeat(self.roots, n)
+        row_offset = np.tile(np.arange(n, dtype=np.intp) * d, self.n_trees)
+        # only descend the (tree, point) pairs that are not in a leaf yet
+        active = np.arange(node.shape[0])
+        for _ in range(self.max_depth):
+            cur = node[active]
+            go_right = X_flat[row_offset[active] +
+                              self.feature[cur]] > self.threshold[cur]
+            child = self.children[cur, go_right.view(np.int8)]
+            node[active] = child
+            active = active[~self.is_leaf[child]]
+            if active.shape[0] == 0:
+                break
+        return node.reshape(self.n_trees, n)
+
+    def predict_per_tree(self, X: np.ndarray):
+        '''
+        Returns
+        -------
+        means : np.ndarray (n_trees, N)
+            Leaf means.
+        vars : np.ndarray (n_trees, N)
+            Leaf (within node) variances.
+        '''
+        leaves = self.apply(X)
+        return self.leaf_mean[leaves], self.leaf_var[leaves]
+
+    def predict_mean_var(self, X: np.ndarray, total_variance: bool = False):
+        '''
+        Mean over trees and variance of the tree means; with `total_variance`,
+        the mean leaf variance is added (law of total variance).
+        '''
+        means, vars_ = self.predict_per_tree(X)
+        m = means.mean(axis=0)
+        v = means.var(axis=0)
+        if total_variance:
+            v += vars_.mean(axis=0)
+        return m, v
+
+
+class PredictionCache():
+    '''
+    Row-wise memo of a deterministic `predict_fn(X) -> (mean, var)`.
+
+    Acquisition maximizers re-evaluate the same candidates (local search
+    incumbents, neighbours, history) many times between two trainings. The
+    owner has to call `clear` whenever the model is retrained. Batches of
+    more than `max_batch` rows (fresh random candidates as a rule) bypass
+    the memo.
+
+    Rows are matched by their bytes. The keys of a batch come from one byte
+    view of X and are looked up in a single ``np.fromiter`` over
+    ``dict.get``; the predictions are stored in arrays.
+    '''
+    def __init__(self, max_size: int = 2**16, max_batch: int = 4096):
+        self.max_size = max_size
+        self.max_batch = max_batch
+        self._mean = np.empty(16)
+        self._var = np.empty(16)
+        self.clear()
+
+    def clear(self):
+        self._index = {}  # row bytes -> position in _mean/_var
+        self._n = 0
+
+    @staticmethod
+    def _predict(X, predict_fn):
+        m, v = predict_fn(X)
+        return np.asarray(m).reshape(-1), np.asarray(v).reshape(-1)
+
+    def _add(self, keys, m, v):
+        if self._n + len(keys) > self.max_size:
+            self.clear()
+        keys, m, v = keys[:self.max_size], m[:self.max_size], v[:self.max_size]
+        n = self._n + len(keys)
+        if n > len(self._mean):
+            size = max(2 * len(self._mean), n)
+            self._mean = np.resize(self._mean, size)
+            self._var = np.resize(self._var, size)
+        self._mean[self._n:n], self._var[self._n:n] = m, v
+        self._index.update(zip(keys, range(self._n, n)))
+        self._n = n
+
+    def __call__(self, X: np.ndarray, predict_fn):
+        if len(X) > self.max_batch:
+            return self._predict(X, predict_fn)
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if len(X) == 1:  # local search scores one neighbour at a time
+            key = X.tobytes()
+            p = self._index.get(key)
+            if p is not None:
+                return self._mean[p:p + 1].copy(), self._var[p:p + 1].copy()
+            m, v = self._predict(X, predict_fn)
+            self._add([key], m, v)
+            return m, v
+        keys = X.view(np.dtype((np.void, X.itemsize * X.shape[1]))).ravel().tolist()
+        pos = np.fromiter(map(self._index.get, keys, itertools.repeat(-1)),
+                          dtype=np.int64, count=len(keys))
+        hit = pos >= 0
+        m = np.empty(len(keys))
+        v = np.empty(len(keys))
+        m[hit], v[hit] = self._mean[pos[hit]], self._var[pos[hit]]
+        miss = np.flatnonzero(~hit)
+        if len(miss):
+            m_miss, v_miss = self._predict(
+                X if len(miss) == len(X) else X[miss], predict_fn)
+            m[miss] = m_miss
+            v[miss] = v_miss
+            self._add(list(map(keys.__getitem__, miss.tolist())), m_miss, v_miss)
+        return m, v
@@ -1,6 +1,7 @@
 from typing import List
 import typing
 from scipy import optimize, stats
+from scipy.linalg import cho_solve, cholesky, solve_triangular
 import sklearn
 # from sklearn.gaussian_process import kernels
 from sklearn.gaussian_process.kernels import Kernel, KernelOperator
@@ -303,6 +304,47 @@ class GPR_sklearn(BaseGP):
             self.hypers = self.gp.kernel.theta
         self.is_fited = True
 
+    def fantasize(self, X: np.ndarray, y: typing.Optional[np.ndarray] = None):
+        """Condition the fitted GP on extra (pending) observations.
+
+        The Cholesky factor is extended by the new rows (O(n^2) per point)
+        and the kernel hyperparameters are kept, so no refit is needed. The
+        fantasies are discarded by the next ``train``.
+
+        Parameters
+        ----------
+        X : np.ndarray (N, D)
+            Pending points.
+        y : np.ndarray (N,), optional
+            Their fantasized targets (e.g. a constant liar). If None, the
+            posterior mean is used (kriging believer).
+        """
+        assert self.is_fited
+        X = self._impute_inactive(np.atleast_2d(X))
+        gp = self.gp
+        if y is None:
+            y = gp.predict(X)
+        else:
+            y = np.asarray(y, dtype=float).reshape(-1)
+            if self.normalize_y:
+                y = (y - self.mean_y_) / self.std_y_
+        K_cross = gp.kernel_(gp.X_train_, X)
+        K_new = gp.kernel_(X)
+        L12 = solve_triangular(gp.L_, K_cross, lower=True, check_finite=False)
+        S = K_new - L12.T @ L12
+        S[np.diag_indices_from(S)] += VERY_SMALL_NUMBER
+        L22 = cholesky(S, lower=True, check_finite=False)
+        n, m = gp.L_.shape[0], X.shape[0]
+        L = np.zeros((n + m, n + m))
+        L[:n, :n] = gp.L_
+        L[n:, :n] = L12.T
+        L[n:, n:] = L22
+        gp.L_ = L
+        gp.X_train_ = np.vstack((gp.X_train_, X))
+        gp.y_train_ = np.concatenate((gp.y_train_, y))
+        gp.alpha_ = cho_solve((L, True), gp.y_train_, check_finite=False)
+        return self
+
     # def _get_all_priors(
     #     self,
     #     add_bound_priors: bool = True,
@@ -0,0 +1,210 @@
+import logging
+import typing
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+
+from xbbo.configspace.space import DenseConfigurationSpace
+from xbbo.core.constants import MAXINT
+from xbbo.surrogate.base import BaseRF
+from xbbo.surrogate.flat_forest import FlatForest, PredictionCache
+from xbbo.utils.util import get_types
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalRandomForest(BaseRF):
+    """Random forest that is updated instead of refitted on every ``train``.
+
+    ``train`` still receives the whole history. When it extends the history
+    of the previous call, only the oldest ``ceil(num_trees * n_new / n)``
+    trees are replaced by new trees. A tree is fitted on a bootstrap of the
+    history while it has at most ``max_samples`` rows, and beyond that on the
+    ``n_new`` new rows plus ``max_samples - n_new`` rows drawn from the older
+    ones, so the cost of an update is bounded by ``max_samples`` and does not
+    grow with the history. The targets may
+    be re-standardized between calls (as in MFES): an affine change of the
+    old targets is folded into the output scale instead of refitting. Any
+    other change of the history triggers a full refit.
+
+    Attributes
+    ----------
+    trees : list of DecisionTreeRegressor
+        Oldest first.
+    forest : FlatForest
+        Array-backed copy of ``trees`` used for prediction.
+    """
+    def __init__(self,
+                 configspace: DenseConfigurationSpace,
+                 num_trees: int = 10,
+                 do_bootstrapping: bool = True,
+                 ratio_features: float = 5. / 6.,
+                 min_samples_split: int = 3,
+                 min_samples_leaf: int = 3,
+                 max_depth: int = 2**20,
+                 eps_purity: float = 1e-8,
+                 rng: np.random.RandomState = np.random.RandomState(42),
+                 types=None,
+                 bounds=None,
+                 max_samples: int = 2000,
+                 **kwargs):
+        """
+        Parameters
+        ----------
+        num_trees : int
+            The number of trees in the random forest.
+        do_bootstrapping : bool
+            Turns on / off bootstrapping in the random forest.
+        ratio_features : float
+            The ratio of features that are considered for splitting.
+        min_samples_split : int
+            The minimum number of data points to perform a split.
+        min_samples_leaf : int
+            The minimum number of data points in a leaf.
+        max_depth : int
+            The maximum depth of a single tree.
+        eps_purity : float
+            The minimum difference between two target values to be considered
+            different
+        max_samples : int
+            The maximum number of rows a single tree is fitted on.
+        """
+        if types is None or bounds is None:
+            types, bounds = get_types(configspace)
+        super().__init__(configspace, types, bounds, **kwargs)
+        self.rng = rng
+        self.num_trees = num_trees
+        self.do_bootstrapping = do_bootstrapping
+        self.max_features = None if ratio_features > 1.0 else \
+            int(max(1, types.shape[0] * ratio_features))
+        self.min_samples_split = min_samples_split
+        self.min_samples_leaf = min_samples_leaf
+        self.max_depth = max_depth
+        self.epsilon_purity = eps_purity
+        self.max_samples = max_samples
+
+        self.X = None
+        self.y = None
+        self.trees = []
+        self.forest = None  # type: FlatForest
+        self.cache = PredictionCache()
+        # trees predict z, the surrogate predicts y = scale * z + shift
+        self.scale = 1.
+        self.shift = 0.
+        self.n_refit_trees = 0  # trees fitted by the last train
+
+    def _fit_tree(self, X: np.ndarray, z: np.ndarray,
+                  n_new: int = 0) -> DecisionTreeRegressor:
+        tree = DecisionTreeRegressor(
+            max_depth=self.max_depth,
+            min_samples_split=self.min_samples_split,
+            min_samples_leaf=self.min_samples_leaf,
+            max_features=self.max_features,
+            min_impurity_decrease=self.epsilon_purity,
+            random_state=self.rng.randint(MAXINT))
+        idx = self._sample_rows(X.shape[0], n_new)
+        if idx is not None:
+            X, z = X[idx], z[idx]
+        return tree.fit(X, z)
+
+    def _sample_rows(self, n: int, n_new: int) -> typing.Optional[np.ndarray]:
+        '''
+        Rows a new tree is fitted on (None: all): at most `max_samples`, the
+        last `n_new` rows (the new ones) always included.
+        '''
+        if n <= self.max_samples:
+            if self.do_bootstrapping:
+                return self.rng.randint(0, n, n)
+            return None
+        n_new = min(n_new, self.max_samples)
+        n_old, size = n - n_new, self.max_samples - n_new
+        if self.do_bootstrapping:
+            old = self.rng.randint(0, n_old, size)
+        else:
+            old = self.rng.choice(n_old, size, replace=False)
+        return np.concatenate([old, np.arange(n_old, n)])
+
+    def _n_appended(self, X: np.ndarray, y: np.ndarray) -> typing.Optional[int]:
+        '''
+        Number of rows appended to the previous history, or None if `X` does
+        not extend it. Adapts `scale`/`shift` to re-standardized targets.
+        '''
+        if self.X is None or X.shape[0] < self.X.shape[0] or \
+                not np.array_equal(X[:self.X.shape[0]], self.X):
+            return None
+        y_old, y_prefix = self.y, y[:self.y.shape[0]]
+        if not np.array_equal(y_prefix, y_old):
+            std_old = y_old.std()
+            if std_old == 0:
+                return None
+            # y_prefix = a * y_old + b ?
+            a = np.cov(y_old, y_prefix, bias=True)[0, 1] / std_old**2
+            b = y_prefix.mean() - a * y_old.mean()
+            if a == 0 or not np.allclose(a * y_old + b, y_prefix):
+                return None
+            self.scale, self.shift = a * self.scale, a * self.shift + b
+        return X.shape[0] - self.X.shape[0]
+
+    def _train(self, X: np.ndarray, y: np.ndarray, **kwargs):
+        """Updates (or fits) the random forest on X and y.
+
+        Parameters
+        ----------
+        X : np.ndarray [n_samples, n_features (config + instance features)]
+            Input data points, the previous history first.
+        Y : np.ndarray [n_samples, ]
+            The corresponding target values.
+
+        Returns
+        -------
+        self
+        """
+        X = self._impute_inactive(X)
+        y = y.flatten()
+        n_new = self._n_appended(X, y)
+        if n_new == 0:
+            self.y = y
+            self.n_refit_trees = 0
+            return self
+        if n_new is None:
+            self.scale, self.shift = 1., 0.
+            n_refit = self.num_trees
+            self.trees = []
+            n_new = 0
+        else:
+            n_refit = min(self.num_trees,
+                          int(np.ceil(self.num_trees * n_new / X.shape[0])))
+        z = (y - self.shift) / self.scale
+        self.trees = self.trees[n_refit:] + [
+            self._fit_tree(X, z, n_new) for _ in range(n_refit)
+        ]
+        self.n_refit_trees = n_refit
+        logger.debug('Refitted %d of %d trees.', n_refit, self.num_trees)
+        self.X = X
+        self.y = y
+        self.forest = FlatForest(self.trees)
+        self.cache.clear()
+        return self
+
+    def _predict(self, X: np.ndarray,
+                 **kwargs) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """Predict means and variances for given X.
+
+        Parameters
+        ----------
+        X : np.ndarray of shape = [n_samples,
+                                   n_features (config + instance features)]
+
+        Returns
+        -------
+        means : np.ndarray of shape = [n_samples, 1]
+            Predictive mean
+        vars : np.ndarray  of shape = [n_samples, 1]
+            Predictive variance
+        """
+        if self.forest is None:
+            raise Exception('Model has to be trained first!')
+        X = self._impute_inactive(X)
+        means, vars_ = self.cache(X, self.forest.predict_mean_var)
+        means = self.scale * means + self.shift
+        vars_ = self.scale**2 * vars_
+        return means.reshape((-1, 1)), vars_.reshape((-1, 1))
@@ -0,0 +1,131 @@
+'''
+Joint posterior samples of a fitted ``GPR_sklearn`` on many points.
+
+``sample_exact`` factorizes the full posterior covariance (cubic in the
+number of points). ``sample_pathwise`` uses decoupled pathwise sampling
+(Wilson et al., 2020): a random-Fourier-feature draw from the prior is
+corrected by an exact update on the training data,
+
+    f(x) = phi(x) w + k(x, X) (K + s^2 I)^-1 (y - phi(X) w - eps),
+
+which is linear in the number of points. It needs a stationary kernel of
+the form ``ConstantKernel * (Matern | RBF) [+ WhiteKernel]``; other kernels
+fall back to ``sample_blocks``, which samples exactly within blocks of
+points and independently across blocks.
+'''
+import typing
+import numpy as np
+from scipy.linalg import cho_solve, cholesky
+from sklearn.gaussian_process import kernels
+
+from xbbo.core.constants import VERY_SMALL_NUMBER
+
+
+def _mvn_sample(mean, cov, size, rng):
+    '''(N, size) samples; jittered Cholesky, eigendecomposition as last resort.'''
+    n = cov.shape[0]
+    jitter = VERY_SMALL_NUMBER * max(np.mean(np.diag(cov)), 1)
+    for _ in range(6):
+        try:
+            L = cholesky(cov + jitter * np.eye(n), lower=True,
+                         check_finite=False)
+            break
+        except np.linalg.LinAlgError:
+            jitter *= 100
+    else:
+        w, v = np.linalg.eigh(cov)
+        L = v * np.sqrt(np.clip(w, 0, None))
+    return mean.reshape(-1, 1) + L @ rng.standard_normal((n, size))
+
+
+def _untransform(model, f):
+    if model.normalize_y:
+        return f * model.std_y_ + model.mean_y_
+    return f
+
+
+def sample_exact(model, X: np.ndarray, size: int,
+                 rng: np.random.RandomState) -> np.ndarray:
+    mean, cov = model.gp.predict(model._impute_inactive(X), return_cov=True)
+    return _untransform(model, _mvn_sample(mean, cov, size, rng))
+
+
+def sample_blocks(model, X: np.ndarray, size: int,
+                  rng: np.random.RandomState,
+                  block_size: int = 1024) -> np.ndarray:
+    X = model._impute_inactive(X)
+    samples = np.empty((X.shape[0], size))
+    for start in range(0, X.shape[0], block_size):
+        mean, cov = model.gp.predict(X[start:start + block_size],
+                                     return_cov=True)
+        samples[start:start + block_size] = _mvn_sample(mean, cov, size, rng)
+    return _untransform(model, samples)
+
+
+def _parse_stationary(kernel) -> typing.Optional[dict]:
+    '''amplitude, length scales, nu and active dims of a supported kernel.'''
+    noise = 0.
+    if isinstance(kernel, kernels.Sum):
+        if isinstance(kernel.k2, kernels.WhiteKernel):
+            kernel, noise = kernel.k1, kernel.k2.noise_level
+        elif isinstance(kernel.k1, kernels.WhiteKernel):
+            kernel, noise = kernel.k2, kernel.k1.noise_level
+        else:
+            return None
+    if not isinstance(kernel, kernels.Product):
+        return None
+    amp, base = kernel.k1, kernel.k2
+    if isinstance(base, kernels.ConstantKernel):
+        amp, base = base, amp
+    if not isinstance(amp, kernels.ConstantKernel) or \
+            not isinstance(base, (kernels.Matern, kernels.RBF)) or \
+            getattr(base, 'has_conditions', False):
+        return None
+    nu = getattr(base, 'nu', np.inf)
+    return {
+        'amplitude': amp.constant_value,
+        'length_scale': np.atleast_1d(base.length_scale),
+        'nu': nu,
+        'operate_on': getattr(base, 'operate_on', None),
+        'noise': noise
+    }
+
+
+def sample_pathwise(model,
+                    X: np.ndarray,
+                    size: int,
+                    rng: np.random.RandomState,
+                    n_features: int = 1024,
+                    block_size: int = 4096) -> np.ndarray:
+    gp = model.gp
+    params = _parse_stationary(gp.kernel_)
+    if params is None:
+        return sample_blocks(model, X, size, rng)
+    X = model._impute_inactive(X)
+    X_train = gp.X_train_
+    active = params['operate_on']
+    d = X.shape[1] if active is None else len(active)
+
+    # spectral density of a Matern-nu kernel: student-t with 2 nu dof
+    omega = rng.standard_normal((d, n_features)) / params['length_scale'].reshape(-1, 1)
+    if np.isfinite(params['nu']):
+        omega *= np.sqrt(2 * params['nu'] /
+                         rng.chisquare(2 * params['nu'], n_features))
+    phase = rng.uniform(0, 2 * np.pi, n_features)
+    weights = rng.standard_normal((n_features, size))
+    scale = np.sqrt(2 * params['amplitude'] / n_features)
+
+    def prior(Z):
+        Z = Z if active is None else Z[:, active]
+        return scale * np.cos(Z @ omega + phase) @ weights
+
+    eps = np.sqrt(params['noise']) * rng.standard_normal(
+        (X_train.shape[0], size))
+    v = cho_solve((gp.L_, True),
+                  gp.y_train_.reshape(-1, 1) - prior(X_train) - eps,
+                  check_finite=False)
+    samples = np.empty((X.shape[0], size))
+    for start in range(0, X.shape[0], block_size):
+        Z = X[start:start + block_size]
+        samples[start:start + block_size] = prior(Z) + gp.kernel_(Z, X_train) @ v
+    return _untransform(model, samples)
@@ -8,6 +8,7 @@ import numpy as np
 from pyrfr import regression
 from xbbo.configspace.space import DenseConfigurationSpace
 from xbbo.surrogate.base import BaseRF
+from xbbo.surrogate.flat_forest import PredictionCache
 from xbbo.core.constants import MAXINT
 from xbbo.utils.util import get_types
 
@@ -106,6 +107,9 @@ class RandomForestWithInstances(BaseRF):
 
         self.n_points_per_tree = n_points_per_tree
         self.rf = None  # type: regression.binary_rss_forest
+        # pyrfr does not expose its node arrays, so rows are still predicted
+        # one by one; repeated candidates are served from the cache
+        self.cache = PredictionCache()
 
         # This list well be read out by save_iteration() in the solver
         self.hypers = [
@@ -144,6 +148,7 @@ class RandomForestWithInstances(BaseRF):
         self.rf.options = self.rf_opts
         data = self._init_data_container(self.X, self.y)
         self.rf.fit(data, rng=self.rng)
+        self.cache.clear()
         return self
 
     def _init_data_container(self, X: np.ndarray, y: np.ndarray):
@@ -197,6 +202,11 @@ class RandomForestWithInstances(BaseRF):
             raise ValueError('Rows in X should have %d entries but have %d!' %
                              (self.types.shape[0], X.shape[1]))
         X = self._impute_inactive(X)
+        means, vars_ = self.cache(X, self._predict_rows)
+
+        return means.reshape((-1, 1)), vars_.reshape((-1, 1))
+
+    def _predict_rows(self, X: np.ndarray):
         means, vars_ = [], []
         for row_X in X:
             if self.log_y:
@@ -213,10 +223,7 @@ class RandomForestWithInstances(BaseRF):
                 mean, var = self.rf.predict_mean_var(row_X)
             means.append(mean)
             vars_.append(var)
-        means = np.array(means)
-        vars_ = np.array(vars_)
-
-        return means.reshape((-1, 1)), vars_.reshape((-1, 1))
+        return np.array(means), np.array(vars_)
 
     def predict_marginalized_over_instances(self, X: np.ndarray):
         """Predict mean and variance marginalized over all instances.
@@ -3,9 +3,6 @@
 import typing, logging
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
-import threading
-from joblib import Parallel, delayed
-from sklearn.utils.fixes import _joblib_parallel_args
 from sklearn.utils.validation import check_is_fitted
 from xbbo.configspace.space import DenseConfigurationSpace
 from xbbo.utils.util import get_types
@@ -17,21 +14,11 @@ except:
     old_sk_version = False
 
 from xbbo.surrogate.base import BaseRF
+from xbbo.surrogate.flat_forest import FlatForest, PredictionCache
 
 logger = logging.getLogger(__name__)
 
 
-def _collect_prediction(predict, X, out, lock):
-    """
-    This is a utility function for joblib's Parallel.
-
-    It can't go locally in ForestClassifier or ForestRegressor, because joblib
-    complains that it cannot pickle it when placed there.
-    """
-    prediction = predict(X, check_input=False)
-    with lock:
-        out.append(prediction)
-
 class skRandomForestWithInstances(BaseRF):
 
     """Random forest that takes instance features into account.
@@ -64,6 +51,7 @@ class skRandomForestWithInstances(BaseRF):
                  max_num_nodes: int=2**20,
                  rng: np.random.RandomState = np.random.RandomState(42),
                  n_jobs: int=None,
+                 compute_law_of_total_variance: bool=False,
                  types=None, bounds=None,
                  **kwargs):
         """
@@ -108,6 +96,8 @@ class skRandomForestWithInstances(BaseRF):
             trees. ``None`` means 1 unless in a :obj:`joblib.parallel_backend`
             context. ``-1`` means using all processors. See :term:`Glossary
             <n_jobs>` for more details.
+        compute_law_of_total_variance : bool
+            Add the mean within-leaf variance to the variance across trees.
         """
         if types is None or bounds is None:
             types, bounds = get_types(configspace)
@@ -133,7 +123,11 @@ class skRandomForestWithInstances(BaseRF):
         self.n_points_per_tree = n_points_per_tree
         self.n_jobs = n_jobs
 
+        self.compute_law_of_total_variance = compute_law_of_total_variance
+
         self.rf = None  # type: RandomForestRegressor
+        self.forest = None  # type: FlatForest
+        self.cache = PredictionCache()
 
     def _train(self, X: np.ndarray, y: np.ndarray, **kwargs):
         """Trains the random forest on X and y.
@@ -186,6 +180,8 @@ class skRandomForestWithInstances(BaseRF):
                 random_state=self.rng,
             )
         self.rf.fit(self.X, self.y)
+        self.forest = FlatForest(self.rf.estimators_)
+        self.cache.clear()
         return self
 
     def predict_mean_var(self, X: np.ndarray):
@@ -196,25 +192,10 @@ class skRandomForestWithInstances(BaseRF):
         # Check data
         if X.ndim == 1:
             X = X.reshape((1, -1))
-        X = self.rf._validate_X_predict(X)
-
-        # Assign chunk of trees to jobs
-        n_jobs, _, _ = _partition_estimators(self.rf.n_estimators, self.rf.n_jobs)
-
-        # collect the output of every estimator
-        all_y_preds = list()
-
-        # Parallel loop
-        lock = threading.Lock()
-        Parallel(n_jobs=n_jobs, verbose=self.rf.verbose,
-                 **_joblib_parallel_args(require="sharedmem"))(
-            delayed(_collect_prediction)(e.predict, X, all_y_preds, lock)
-            for e in self.rf.estimators_)
-        all_y_preds = np.asarray(all_y_preds, dtype=np.float64)
 
-        m = np.mean(all_y_preds, axis=0)
-        v = np.var(all_y_preds, axis=0)
-        return m, v
+        return self.cache(
+            X, lambda X: self.forest.predict_mean_var(
+                X, total_variance=self.compute_law_of_total_variance))
 
     def _predict(self, X: np.ndarray, **kwargs) -> typing.Tuple[np.ndarray, np.ndarray]:
         """Predict means and variances for given X.
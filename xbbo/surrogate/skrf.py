@@ -6,6 +6,7 @@ import numpy as np
 from typing import List, Optional, Tuple, Union
 
 from xbbo.surrogate.base import BaseRF
+from xbbo.surrogate.flat_forest import FlatForest, PredictionCache
 from xbbo.configspace.space import DenseConfigurationSpace
 from xbbo.core.constants import MAXINT
 from xbbo.utils.util import get_types
@@ -58,6 +59,8 @@ class RandomForestSurrogate(BaseRF):
 
         self.normalize_y = normalize_y
         self.is_trained = False
+        self.forest = None
+        self.cache = PredictionCache()
 
     def _train(self, X: np.ndarray, y: np.ndarray, **kwargs):
         """
@@ -83,6 +86,9 @@ class RandomForestSurrogate(BaseRF):
             rf_model = RandomForestRegressor(**configs)
             rf_model.fit(X, y)
             self.models.append(rf_model)
+        self.forest = FlatForest(
+            [tree for model in self.models for tree in model.estimators_])
+        self.cache.clear()
 
         self.is_trained = True
         return self
@@ -109,14 +115,7 @@ class RandomForestSurrogate(BaseRF):
 
         X_test = self._impute_inactive(X_test)
 
-        predictions = list()
-        for i, model in enumerate(self.models):
-            pred = model.predict(X_test)
-            # print(i)
-            predictions.append(pred)
-
-        m = np.mean(predictions, axis=0)
-        v = np.var(predictions, axis=0)
+        m, v = self.cache(X_test, self._predict_mean_var)
 
         # Clip negative variances and set them to the smallest
         # positive float value
@@ -131,6 +130,13 @@ class RandomForestSurrogate(BaseRF):
 
         return m, v
 
+    def _predict_mean_var(self, X: np.ndarray):
+        # every model predicts the mean of its own trees
+        tree_means, _ = self.forest.predict_per_tree(X)
+        predictions = tree_means.reshape(len(self.models), -1,
+                                         X.shape[0]).mean(axis=1)
+        return np.mean(predictions, axis=0), np.var(predictions, axis=0)
+
     def _normalize_y(self, y: np.ndarray) -> np.ndarray:
         """Normalize data to zero mean unit standard deviation.
         """
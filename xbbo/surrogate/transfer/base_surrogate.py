@@ -3,6 +3,7 @@ import numpy as np
 
 from xbbo.core.constants import VERY_SMALL_NUMBER
 from xbbo.surrogate.gaussian_process import GPR_sklearn
+from xbbo.surrogate.flat_forest import PredictionCache
 
 class BaseModel(GPR_sklearn):
     def __init__(
@@ -16,31 +17,36 @@ class BaseModel(GPR_sklearn):
     ):
         super().__init__(cs, rng, n_opt_restarts,instance_features=instance_features,
             pca_components=pca_components,**kwargs)
-        self.cached = {}
-        self.cached_normalize = {}
+        # a base model is not refitted during a run, so its predictions on
+        # recurring candidates (history, local search neighbours) are memoized
+        self.cached = PredictionCache()
+        self.cached_normalize = PredictionCache()
+
+    def clear_cache(self):
+        self.cached.clear()
+        self.cached_normalize.clear()
+
+    def _train(self, X: np.ndarray, y: np.ndarray, **kwargs):
+        super()._train(X, y, **kwargs)
+        self.clear_cache()
 
     def _predict_normalize(self, X_test, cov_return_type: typing.Optional[str] = 'diagonal_cov'):
         assert self.is_fited
-        # key = hash(X_test.data.tobytes()+bytes(cov_return_type if cov_return_type else '', 'utf-8'))
-        # if key in self.cached_normalize:
-        #     return self.cached_normalize[key]
-        
         X_test = self._impute_inactive(X_test)
         if cov_return_type is None:
-            mu = self.gp.predict(X_test)
+            mu = self.cached(
+                X_test, lambda X: (self.gp.predict(X), np.zeros(X.shape[0])))[0]
             var = None
 
             # if self.normalize_y:
             #     mu = self._untransform_y(mu)
 
         else:
-            predict_kwargs = {'return_cov': False, 'return_std': True}
             if cov_return_type == 'full_cov':
-                predict_kwargs = {'return_cov': True, 'return_std': False}
-
-            mu, var = self.gp.predict(X_test, **predict_kwargs)
-
-            if cov_return_type != 'full_cov':
+                mu, var = self.gp.predict(X_test, return_cov=True)
+            else:
+                mu, var = self.cached_normalize(
+                    X_test, lambda X: self.gp.predict(X, return_std=True))
                 var = var**2  # since we get standard deviation for faster computation
 
             # Clip negative variances and set them to the smallest
@@ -53,47 +59,23 @@ class BaseModel(GPR_sklearn):
             if cov_return_type == 'diagonal_std':
                 var = np.sqrt(
                     var)  # converting variance to std deviation if specified
-        # self.cached_normalize[key] = (mu, var)
-        
         return mu, var
     
     def _predict(self, X_test, cov_return_type: typing.Optional[str] = 'diagonal_cov'):
-        assert self.is_fited
-        # key = hash(X_test.data.tobytes()+bytes(cov_return_type if cov_return_type else '', 'utf-8'))
-        # if key in self.cached:
-        #     return self.cached[key]
-        
-        X_test = self._impute_inactive(X_test)
         if cov_return_type is None:
-            mu = self.gp.predict(X_test)
-            var = None
-
+            mu, var = self._predict_normalize(X_test, None)
             if self.normalize_y:
                 mu = self._untransform_y(mu)
-
-        else:
-            predict_kwargs = {'return_cov': False, 'return_std': True}
-            if cov_return_type == 'full_cov':
-                predict_kwargs = {'return_cov': True, 'return_std': False}
-
-            mu, var = self.gp.predict(X_test, **predict_kwargs)
-
-            if cov_return_type != 'full_cov':
-                var = var**2  # since we get standard deviation for faster computation
-
-            # Clip negative variances and set them to the smallest
-            # positive float value
-            var = np.clip(var, VERY_SMALL_NUMBER, np.inf)
-
-            if self.normalize_y:
-                mu, var = self._untransform_y(mu, var)
-
-            if cov_return_type == 'diagonal_std':
-                var = np.sqrt(
-                    var)  # converting variance to std deviation if specified
-        # self.cached[key] = (mu, var)
-        
-        return mu, var   
+            return mu, var
+        mu, var = self._predict_normalize(
+            X_test,
+            'full_cov' if cov_return_type == 'full_cov' else 'diagonal_cov')
+        if self.normalize_y:
+            mu, var = self._untransform_y(mu, var)
+        if cov_return_type == 'diagonal_std':
+            var = np.sqrt(
+                var)  # converting variance to std deviation if specified
+        return mu, var
 
     # def _cached_predict(self, X_test, cov_return_type: typing.Optional[str] = 'diagonal_cov'):
     #     key = hash(X_test.data.tobytes()+bytes(cov_return_type if cov_return_type else '', 'utf-8'))
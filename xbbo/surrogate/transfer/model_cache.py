@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+from sklearn.base import clone
+
+logger = logging.getLogger(__name__)
+
+
+class BaseModelCache():
+    '''
+    On-disk, content-addressed cache of fitted GP base models.
+
+    An entry holds what a fitted ``GPR_sklearn`` needs to predict: the
+    kernel hyperparameters, the target normalization, the training inputs,
+    the Cholesky factor of the training covariance and alpha. It is keyed
+    by a hash of the source-task data and of the kernel/model settings, so
+    repeated runs over the same source tasks fit every base model once.
+    Arrays are loaded with ``mmap_mode='r'``, which lets concurrent runs
+    share the pages of the same entry.
+    '''
+    _ARRAYS = ('X_train', 'y_train', 'L', 'alpha')
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, X: np.ndarray, y: np.ndarray) -> str:
+        h = hashlib.sha1()
+        for arr in (np.ascontiguousarray(X, dtype=np.float64),
+                    np.ascontiguousarray(y, dtype=np.float64)):
+            h.update(str(arr.shape).encode())
+            h.update(arr.tobytes())
+        h.update(type(model).__name__.encode())
+        h.update(repr(model.kernel).encode())
+        h.update(np.asarray(model.kernel.theta).tobytes())
+        h.update(np.asarray(model.kernel.bounds).tobytes())
+        h.update(str((model.normalize_y, model.do_optimize)).encode())
+        return h.hexdigest()
+
+    def train(self, model, X: np.ndarray, y: np.ndarray):
+        '''Load `model` from the cache, or train it and store it.'''
+        key = self.key(model, X, y)
+        path = os.path.join(self.cache_dir, key)
+        if os.path.isdir(path):
+            try:
+                self._load(model, path)
+                self.hits += 1
+                return model
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning('Ignore broken cache entry %s: %s', path, e)
+        self.misses += 1
+        model.train(X, y)
+        self._save(model, path)
+        return model
+
+    def _save(self, model, path):
+        gp = model.gp
+        tmp = tempfile.mkdtemp(dir=self.cache_dir)
+        for name, arr in zip(self._ARRAYS,
+                             (gp.X_train_, gp.y_train_, gp.L_, gp.alpha_)):
+            np.save(os.path.join(tmp, name + '.npy'), np.asarray(arr))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(
+                {
+                    'theta': np.asarray(gp.kernel_.theta).tolist(),
+                    'mean_y': float(getattr(model, 'mean_y_', 0.)),
+                    'std_y': float(getattr(model, 'std_y_', 1.)),
+                }, f)
+        try:
+            os.rename(tmp, path)
+        except OSError:  # written concurrently by another run
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _load(self, model, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+            for name in self._ARRAYS
+        }
+        theta = np.asarray(meta['theta'])
+        model.kernel.theta = theta
+        gp = model._get_gp()
+        gp.kernel_ = clone(model.kernel)
+        gp.kernel_.theta = theta
+        gp.X_train_ = arrays['X_train']
+        gp.y_train_ = arrays['y_train']
+        gp.L_ = arrays['L']
+        gp.alpha_ = arrays['alpha']
+        gp._y_train_mean = np.zeros(1)
+        gp._y_train_std = 1
+        gp.n_features_in_ = gp.X_train_.shape[1]
+        model.gp = gp
+        model.hypers = theta
+        model.mean_y_, model.std_y_ = meta['mean_y'], meta['std_y']
+        model.n_objectives_ = 1
+        model.n_params = gp.n_features_in_ - model.n_feats
+        model.is_fited = True
+        model.clear_cache()
@@ -2,11 +2,11 @@ import typing
 import numpy as np
 from xbbo.surrogate.base import SurrogateModel
 # from xbbo.surrogate.transfer.rf_with_instances import RandomForestWithInstances
-from xbbo.surrogate.prf import RandomForestWithInstances
+from xbbo.surrogate.incremental_rf import IncrementalRandomForest
 # from xbbo.utils.util import get_types
 
 class RandomForestEnsemble(SurrogateModel):
-    def __init__(self, cs, all_budgets, weight_list, fusion_method, types=None, bounds=None, rng=np.random.RandomState(),**kwargs):
+    def __init__(self, cs, all_budgets, weight_list, fusion_method, types=None, bounds=None, rng=np.random.RandomState(), rf_type='prf', **kwargs):
         # if types is None or bounds is None:
         #     types, bounds = get_types(cs)
         super().__init__(types=types, bounds=bounds,**kwargs)
@@ -22,7 +22,13 @@ class RandomForestEnsemble(SurrogateModel):
             # r = int(item)
             # self.surrogate_r.append(r)
             self.surrogate_weight[budget] = self.weight_list[i]
-            self.surrogate_container[budget] = RandomForestWithInstances(cs, rng=rng)
+            if rf_type == 'prf':
+                from xbbo.surrogate.prf import RandomForestWithInstances
+                self.surrogate_container[budget] = RandomForestWithInstances(cs, rng=rng)
+            elif rf_type == 'irf':
+                self.surrogate_container[budget] = IncrementalRandomForest(cs, rng=rng)
+            else:
+                raise ValueError('rf_type {} not in {}'.format(rf_type, ['prf', 'irf']))
 
     def train(self, X: np.ndarray, Y: np.ndarray, r) -> 'SurrogateModel':
         """Trains the Model on X and Y.
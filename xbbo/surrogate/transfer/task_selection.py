@@ -0,0 +1,66 @@
+import logging
+import typing
+import numpy as np
+
+from xbbo.surrogate.transfer.base_surrogate import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+def _ranks(a: np.ndarray) -> np.ndarray:
+    '''Centered, unit-norm ranks along the last axis.'''
+    r = a.argsort(axis=-1).argsort(axis=-1).astype(float)
+    r -= r.mean(axis=-1, keepdims=True)
+    norm = np.linalg.norm(r, axis=-1, keepdims=True)
+    return r / np.where(norm > 0, norm, 1)
+
+
+class SourceTaskSelector():
+    '''
+    Keep the `k` source tasks whose response surface is most similar to the
+    target's active.
+
+    Every base model is evaluated once on a shared probe set and stored as
+    a row of rank-transformed responses. A refresh only predicts the target
+    model on the probe set and takes the Spearman correlation with all rows
+    (one matrix-vector product), so it costs no base-model predictions and
+    the models used downstream (weights, TST, TAF, MoGP) scale with `k`
+    instead of the number of source tasks.
+    '''
+    def __init__(self,
+                 space,
+                 base_models: typing.List[BaseModel],
+                 k: int,
+                 rng: np.random.RandomState,
+                 n_probe: int = 256):
+        self.base_models = list(base_models)
+        self.k = min(k, len(self.base_models))
+        self.probe = np.asarray([
+            config.get_array(sparse=True)
+            for config in space.sample_configuration(size=n_probe)
+        ])
+        self.probe_ranks = _ranks(
+            np.stack([
+                np.ravel(model._predict_normalize(self.probe, None)[0])
+                for model in self.base_models
+            ]))  # [n_tasks, n_probe]
+        self.rng = rng
+        self.similarity = np.zeros(len(self.base_models))
+        # before the target model is fitted, pick k tasks at random
+        self.active_idx = np.sort(
+            self.rng.choice(len(self.base_models), self.k, replace=False))
+
+    @property
+    def active(self) -> typing.List[BaseModel]:
+        return [self.base_models[i] for i in self.active_idx]
+
+    def select(self, target_model) -> typing.List[BaseModel]:
+        '''Refresh the active set from the (trained) target model.'''
+        predict = getattr(target_model, 'target_model_predict',
+                          target_model.predict)
+        target_ranks = _ranks(np.ravel(predict(self.probe, None)[0]))
+        self.similarity = self.probe_ranks @ target_ranks
+        self.active_idx = np.sort(
+            np.argpartition(-self.similarity, self.k - 1)[:self.k])
+        logger.debug('Active source tasks: %s', self.active_idx)
+        return self.active
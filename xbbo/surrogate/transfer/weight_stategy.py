@@ -1,6 +1,7 @@
 import abc
 import typing
 import numpy as np
+from scipy.linalg import cho_solve, cholesky
 from xbbo.core.trials import Trials
 
 # from xbbo.surrogate.base import Surrogate
@@ -8,6 +9,27 @@ from xbbo.surrogate.gaussian_process import GPR_sklearn
 from xbbo.surrogate.transfer.tst import BaseModel
 from xbbo.core.constants import VERY_SMALL_NUMBER
 
+# number of set bits of every byte
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None],
+                          axis=1).sum(axis=1)
+
+
+def _sqrt_psd(cov):
+    '''Square root S of a PSD matrix with S @ S.T == cov.'''
+    w, v = np.linalg.eigh(cov)
+    return v * np.sqrt(np.clip(w, 0, None))
+
+
+def _cholesky_with_jitter(K):
+    jitter = VERY_SMALL_NUMBER * max(np.mean(np.diag(K)), 1)
+    for _ in range(10):
+        try:
+            return cholesky(K, lower=True, check_finite=False)
+        except np.linalg.LinAlgError:
+            K = K + jitter * np.eye(K.shape[0])
+            jitter *= 10
+    return cholesky(K, lower=True, check_finite=False)
+
 class ABCWeightStategy(metaclass=abc.ABCMeta):
     def __init__(self,
                  cs,
@@ -33,9 +55,21 @@ class RankingWeight(ABCWeightStategy):
                  rng,
                  budget,
                  rank_sample_num=256,
-                 is_purn=False,alpha=0, **kwargs):
+                 is_purn=False,alpha=0,
+                 max_rank_elements=2**24,
+                 bit_packed=False, **kwargs):
+        '''
+        max_rank_elements: int
+            Upper bound on the pairwise comparisons held in memory at once
+            when computing ranking losses; samples are processed in chunks.
+        bit_packed: bool
+            Pack the pairwise comparisons into bits before the XOR and count
+            mismatches with a popcount table.
+        '''
         super().__init__(cs, base_models, target_model, rng, **kwargs)
         self.rank_sample_num = rank_sample_num
+        self.max_rank_elements = max_rank_elements
+        self.bit_packed = bit_packed
         # self.iter = 0
         self.budget = budget
         self.is_purn = is_purn
@@ -46,18 +80,30 @@ class RankingWeight(ABCWeightStategy):
         '''
         f_samples 'n_samples x (n) x n' -dim
         '''
-        if f_samples.ndim == 3:  # for target model
-            rank_loss = ((f_samples.diagonal(axis1=-2, axis2=-1)[:, :, None] <
-                          f_samples) ^
-                         (np.expand_dims(f_target, axis=-1) < np.expand_dims(
-                             f_target, axis=-2))).sum(axis=-1).sum(axis=-1)
-        else:
-            rank_loss = ((np.expand_dims(f_samples, axis=-1) < np.expand_dims(
-                f_samples, axis=-2)) ^
-                         (np.expand_dims(f_target, axis=-1) < np.expand_dims(
-                             f_target, axis=-2))).sum(axis=-1).sum(axis=-1)
+        target_order = np.expand_dims(f_target, axis=-1) < np.expand_dims(
+            f_target, axis=-2)
+        if self.bit_packed:
+            target_order = np.packbits(target_order, axis=-1)
+        n = f_target.shape[-1]
+        chunk = max(1, self.max_rank_elements // (n * n))
+        rank_loss = np.empty(f_samples.shape[0], dtype=np.int64)
+        for start in range(0, f_samples.shape[0], chunk):
+            f = f_samples[start:start + chunk]
+            if f.ndim == 3:  # for target model
+                order = f.diagonal(axis1=-2, axis2=-1)[:, :, None] < f
+            else:
+                order = np.expand_dims(f, axis=-1) < np.expand_dims(f, axis=-2)
+            if self.bit_packed:
+                mismatch = _POPCOUNT[np.packbits(order, axis=-1) ^ target_order]
+            else:
+                mismatch = order ^ target_order
+            rank_loss[start:start + chunk] = mismatch.sum(axis=-1).sum(axis=-1)
         return rank_loss
 
+    def _sample(self, mean, cov):
+        return np.ravel(mean) + self.rng.standard_normal(
+            (self.rank_sample_num, cov.shape[0])) @ _sqrt_psd(cov).T
+
     def _get_min_index(self, array):
         best_model_idxs = np.zeros(array.shape[1], dtype=np.int64)
         is_best_model = (array == array.min(axis=0))
@@ -80,11 +126,7 @@ class RankingWeight(ABCWeightStategy):
         for base_model in self.base_models:
             mean, cov = base_model._predict(t_x, "full_cov")
             ranking_losses.append(
-                self._compute_ranking_loss(
-                    self.rng.multivariate_normal(mean,
-                                                 cov,
-                                                 size=self.rank_sample_num),
-                    t_y))
+                self._compute_ranking_loss(self._sample(mean, cov), t_y))
         ranking_losses.append(
             self._compute_ranking_loss(self._get_loocv_preds(t_x, t_y), t_y))
         ranking_losses = np.array(ranking_losses)
@@ -100,25 +142,51 @@ class RankingWeight(ABCWeightStategy):
         return rank_weight  #/ rank_weight.sum()
 
     def _get_loocv_preds(self, x, y):
-        masks = ~np.eye(self.try_num, dtype=np.bool_)
-        x_cv = [x[m] for m in masks]
-        y_cv = [y[m] for m in masks]
-        samples = []
-        for i in range(self.try_num):
-            # kernel = self.new_gp.kernel.copy()
-            model = GPR_sklearn(self.space,
-                                rng=self.rng,
-                                kernel=self.target_model.kernel,
-                                do_optimize=False)
-            model.train(x_cv[i], y_cv[i][:, None])
-            mean, cov = model.predict(x, "full_cov")  # TODO 使用kernel子块
-            # model = GaussianProcessRegressor(self.dim)
-            # model.fit(x_cv[i], y_cv[i][:, None])
-            # mean, cov = model.predict_with_cov(x)
-            samples.append(
-                self.rng.multivariate_normal(np.squeeze(mean), cov,
-                                             self.rank_sample_num))
-        return np.stack(samples, axis=1)
+        '''
+        Samples of the target GP trained without observation i, at all x.
+
+        Uses the closed-form leave-one-out identities on a single Cholesky
+        factor of the training covariance A: with P = A^-1, the model
+        without i has A_{-i}^-1 = P - P[:, i] P[i] / P[i, i] (embedded with a
+        zero row/column i), so its posterior covariance is the full-data one
+        plus a rank-1 term, and all samples share one square root of it.
+        Each model is expressed in its own normalized units (GPR_sklearn
+        standardizes the targets it is trained on), which leaves the
+        rankings of the original models unchanged.
+
+        Returns
+        -------
+        np.ndarray (rank_sample_num, n, n)
+            Sample s of model i at x[j] is [s, i, j].
+        '''
+        kernel = self.target_model.kernel
+        x = self.target_model._impute_inactive(np.atleast_2d(x))
+        y = np.asarray(y, dtype=float).ravel()
+        n = y.shape[0]
+        A = kernel(x)  # training covariance (noise included)
+        C = kernel(x, x)  # cross covariance (noise free)
+        P = cho_solve((_cholesky_with_jitter(A), True), np.eye(n),
+                      check_finite=False)
+        d = np.diag(P)
+
+        # targets of model i are (y_{-i} - m_i) / s_i
+        y_cv = np.broadcast_to(y, (n, n))[~np.eye(n, dtype=np.bool_)].reshape(
+            n, n - 1)
+        m = y_cv.mean(axis=1)
+        s = y_cv.std(axis=1)
+        s[s == 0] = 1
+
+        def loo_weights(v):
+            # column i: A_{-i}^-1 v_{-i}
+            a = P @ v
+            return a[:, None] - P * (a / d)[None, :]
+
+        mean = ((C @ loo_weights(y)) - (C @ loo_weights(np.ones(n))) * m) / s
+        U = (C @ P) / np.sqrt(d)
+        sqrt_cov = _sqrt_psd(A - C @ P @ C.T)
+        z = self.rng.standard_normal((self.rank_sample_num, n, n))
+        zeta = self.rng.standard_normal((self.rank_sample_num, n, 1))
+        return mean.T[None] + z @ sqrt_cov.T + zeta * U.T[None]
 
     # def predict_with_sigma(self, newX):
     #     models = [self.gps[d].cached_predict_with_sigma(newX) for d in range(self.old_D_num)]
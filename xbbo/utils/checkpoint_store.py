@@ -0,0 +1,280 @@
+import collections
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks (Windows): single-process use only
+    fcntl = None
+
+
+class CheckpointStore():
+    '''
+    Checkpoints shared between processes, one pickle file per key in `root`
+    (a new temporary directory by default).
+
+    Writes go to a temporary file that is renamed into place, so a reader in
+    another process never sees a partially written checkpoint. The store
+    itself only holds `root` and can be passed to worker processes.
+    '''
+    def __init__(self, root: str = None):
+        self._temporary = root is None
+        self.root = tempfile.mkdtemp(
+            prefix='xbbo-ckpt-') if root is None else root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.pkl')
+
+    def _write(self, path, data: bytes):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put(self, key: str, checkpoint):
+        self._write(self._path(key),
+                    pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get(self, key: str):
+        with open(self._path(key), 'rb') as f:
+            return pickle.load(f)
+
+    def link(self, key: str, src: str):
+        '''Make `key` refer to the checkpoint stored under `src`.'''
+        with open(self._path(src), 'rb') as f:
+            self._write(self._path(key), f.read())
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def collect(self) -> int:
+        '''Free storage no key refers to; returns the number of bytes freed.'''
+        return 0
+
+    def __contains__(self, key: str):
+        return os.path.exists(self._path(key))
+
+    def close(self):
+        '''Remove the directory if the store created it.'''
+        if self._temporary:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+class _Chunked():
+    '''Manifest entry of an array: its chunk hashes, restored on load.'''
+    def __init__(self, kind, dtype, shape, hashes):
+        self.kind = kind
+        self.dtype = dtype
+        self.shape = shape
+        self.hashes = hashes
+
+
+def _rebuild(d: dict, items):
+    '''Dict of the type of `d` (e.g. a torch state dict, keeping its `_metadata`).'''
+    new = type(d)(items)
+    if hasattr(d, '__dict__'):
+        new.__dict__.update(d.__dict__)
+    return new
+
+
+class DedupCheckpointStore(CheckpointStore):
+    '''
+    Content-addressed ``CheckpointStore``.
+
+    Every array (numpy array or torch tensor) of a checkpoint is cut into
+    chunks of `chunk_size` bytes that are stored once under their SHA-1 in
+    ``root/chunks``; the key itself only holds a small manifest with the
+    remaining (non-array) structure and the chunk hashes. Hence ``link``
+    (exploiting another member) is a pointer copy of the manifest, and
+    ``put`` only writes the chunks that changed since any stored checkpoint.
+
+    The reference count of a chunk (the number of manifests listing it) is
+    kept in ``root/refs`` and updated by ``put``, ``link`` and ``delete``
+    under an exclusive file lock; a chunk whose count drops to zero is queued
+    and ``collect`` evicts the queued chunks that are still unreferenced, so
+    neither has to scan the store. Chunks are hashed and written outside the
+    lock, and rewritten under it if they were evicted in between.
+    '''
+    def __init__(self, root: str = None, chunk_size: int = 1 << 20):
+        super().__init__(root)
+        self.chunk_size = chunk_size
+        self.chunk_dir = os.path.join(self.root, 'chunks')
+        self.ref_dir = os.path.join(self.root, 'refs')
+        self._unreferenced = os.path.join(self.root, 'unreferenced')
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        new_index = not os.path.isdir(self.ref_dir)
+        os.makedirs(self.ref_dir, exist_ok=True)
+        if new_index and os.listdir(self.chunk_dir):
+            self._rebuild_refs()  # store written without the index
+        self.bytes_written = 0  # chunk bytes written by this process
+
+    def _lock(self, exclusive=False):
+        f = open(os.path.join(self.root, '.lock'), 'a')
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return f  # closing the file releases the lock
+
+    def _put_array(self, arr, kind, chunks):
+        arr = np.ascontiguousarray(arr)
+        data = memoryview(arr.reshape(-1).view(np.uint8))
+        hashes = []
+        for start in range(0, len(data), self.chunk_size):
+            chunk = data[start:start + self.chunk_size]
+            h = hashlib.sha1(chunk).hexdigest()
+            self._write_chunk(h, chunk)
+            chunks[h] = chunk
+            hashes.append(h)
+        return _Chunked(kind, arr.dtype.str, arr.shape, hashes)
+
+    def _write_chunk(self, h, chunk):
+        path = os.path.join(self.chunk_dir, h)
+        if not os.path.exists(path):
+            self._write(path, chunk)
+            self.bytes_written += len(chunk)
+
+    def _get_array(self, entry: _Chunked):
+        data = bytearray()
+        for h in entry.hashes:
+            with open(os.path.join(self.chunk_dir, h), 'rb') as f:
+                data += f.read()
+        arr = np.frombuffer(data, dtype=entry.dtype).reshape(entry.shape)
+        if entry.kind == 'torch':
+            import torch
+            return torch.from_numpy(arr)
+        return arr
+
+    def _split(self, obj, chunks):
+        if isinstance(obj, np.ndarray) and obj.dtype != object:
+            return self._put_array(obj, 'numpy', chunks)
+        if type(obj).__module__.startswith('torch') and hasattr(obj, 'numpy'):
+            return self._put_array(obj.detach().cpu().numpy(), 'torch', chunks)
+        if isinstance(obj, dict):
+            return _rebuild(obj,
+                            ((k, self._split(v, chunks)) for k, v in obj.items()))
+        if type(obj) in (list, tuple):
+            return type(obj)(self._split(v, chunks) for v in obj)
+        return obj
+
+    def _join(self, obj):
+        if isinstance(obj, _Chunked):
+            return self._get_array(obj)
+        if isinstance(obj, dict):
+            return _rebuild(obj, ((k, self._join(v)) for k, v in obj.items()))
+        if type(obj) in (list, tuple):
+            return type(obj)(self._join(v) for v in obj)
+        return obj
+
+    def _hashes(self, obj):
+        if isinstance(obj, _Chunked):
+            yield from obj.hashes
+        elif isinstance(obj, dict):
+            for v in obj.values():
+                yield from self._hashes(v)
+        elif isinstance(obj, (list, tuple)):
+            for v in obj:
+                yield from self._hashes(v)
+
+    def _key_hashes(self, key):
+        try:
+            return list(self._hashes(super().get(key)))
+        except FileNotFoundError:
+            return []
+
+    def _count(self, h) -> int:
+        try:
+            with open(os.path.join(self.ref_dir, h), 'rb') as f:
+                return int(f.read())
+        except FileNotFoundError:
+            return 0
+
+    def _add_refs(self, deltas: collections.Counter):
+        '''Add `deltas` to the reference counts; the exclusive lock must be held.'''
+        unreferenced = []
+        for h, delta in deltas.items():
+            if delta == 0:
+                continue
+            count = self._count(h) + delta
+            if count > 0:
+                self._write(os.path.join(self.ref_dir, h), str(count).encode())
+            else:
+                try:
+                    os.remove(os.path.join(self.ref_dir, h))
+                except FileNotFoundError:
+                    pass
+                unreferenced.append(h)
+        if unreferenced:
+            with open(self._unreferenced, 'a') as f:
+                f.write(''.join(h + '\n' for h in unreferenced))
+
+    def _rebuild_refs(self):
+        with self._lock(exclusive=True):
+            counts = collections.Counter()
+            for name in os.listdir(self.root):
+                if name.endswith('.pkl'):
+                    counts.update(self._key_hashes(name[:-len('.pkl')]))
+            self._add_refs(counts)
+            with open(self._unreferenced, 'a') as f:
+                f.write(''.join(h + '\n' for h in os.listdir(self.chunk_dir)
+                                if h not in counts))
+
+    def put(self, key: str, checkpoint):
+        chunks = {}
+        manifest = self._split(checkpoint, chunks)
+        with self._lock(exclusive=True):
+            for h, chunk in chunks.items():  # may be evicted since hashed
+                self._write_chunk(h, chunk)
+            deltas = collections.Counter(self._hashes(manifest))
+            deltas.subtract(self._key_hashes(key))
+            super().put(key, manifest)
+            self._add_refs(deltas)
+
+    def get(self, key: str):
+        return self._join(super().get(key))
+
+    def link(self, key: str, src: str):
+        with self._lock(exclusive=True):
+            deltas = collections.Counter(self._key_hashes(src))
+            deltas.subtract(self._key_hashes(key))
+            super().link(key, src)
+            self._add_refs(deltas)
+
+    def delete(self, key: str):
+        with self._lock(exclusive=True):
+            deltas = collections.Counter()
+            deltas.subtract(self._key_hashes(key))
+            super().delete(key)
+            self._add_refs(deltas)
+
+    def refcounts(self) -> collections.Counter:
+        '''Number of stored checkpoints referencing every chunk.'''
+        with self._lock():
+            return collections.Counter(
+                {h: self._count(h)
+                 for h in os.listdir(self.chunk_dir)})
+
+    def collect(self) -> int:
+        freed = 0
+        with self._lock(exclusive=True):
+            try:
+                with open(self._unreferenced) as f:
+                    queued = set(f.read().split())
+            except FileNotFoundError:
+                return 0
+            for h in queued:
+                if self._count(h) == 0:  # not referenced again since queued
+                    path = os.path.join(self.chunk_dir, h)
+                    try:
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            os.remove(self._unreferenced)
+        return freed
@@ -0,0 +1,96 @@
+import contextvars
+import copy
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
+
+from xbbo.core.constants import MAXINT
+
+logger = logging.getLogger(__name__)
+
+
+class SuggestionPrefetcher():
+    '''
+    Precompute the next model-based suggestion of `optimizer` in a background
+    thread.
+
+    `optimizer._model_suggest(n_suggestions, trials)` (surrogate fitting +
+    acquisition maximization) is scheduled on a snapshot of the history right
+    after an observation, so it runs while the workers evaluate. It runs on a
+    copy of the optimizer made at the first `schedule`, with its own rng and
+    its own deep copy of the attributes `model_attrs` (surrogate, acquisition
+    function, ...), so the background thread never touches the state used by
+    the calling thread. `get` then returns the prefetched trials, or falls
+    back to `optimizer._random_suggest(n_suggestions, trials)` (a cheap
+    random suggestion) if the model is not ready within `deadline` seconds.
+    A finished prefetch is kept until `get` reads it.
+    '''
+    def __init__(self, optimizer, model_attrs=(), deadline: float = 10.):
+        self.optimizer = optimizer
+        self.model_attrs = model_attrs
+        self.deadline = deadline
+        self.n_suggestions = 1
+        self.n_fallback = 0
+        self._worker = None
+        self._future = None
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix='xbbo-prefetch')
+
+    def _make_worker(self):
+        optimizer = self.optimizer
+        worker = copy.copy(optimizer)
+        worker.rng = np.random.RandomState(optimizer.rng.randint(MAXINT))
+        worker.prefetcher = None
+        # one memo: the copied attributes keep referencing each other
+        memo = {id(optimizer.rng): worker.rng, id(optimizer.space): optimizer.space}
+        for attr in self.model_attrs:
+            setattr(worker, attr, copy.deepcopy(getattr(optimizer, attr), memo))
+        return worker
+
+    def schedule(self, trials):
+        '''
+        Start prefetching on `trials` unless the previous prefetch is still
+        running or was not read yet, in which case its (slightly stale)
+        result will be used by the next `get`. Must be called from the
+        thread that owns `trials`.
+        '''
+        if self._future is not None:
+            return False
+        if self._worker is None:
+            self._worker = self._make_worker()
+        # spans of the prefetch go to the tracer active here
+        self._future = self._executor.submit(
+            contextvars.copy_context().run, self._worker._model_suggest,
+            self.n_suggestions, trials.snapshot())
+        return True
+
+    def get(self, n_suggestions, trials):
+        self.n_suggestions = n_suggestions
+        if self._future is None:  # nothing scheduled, compute in place
+            return self.optimizer._model_suggest(n_suggestions, trials)
+        trial_list = []
+        try:
+            trial_list = self._future.result(timeout=self.deadline)
+            self._future = None
+        except TimeoutError:
+            logger.debug('Prefetched suggestion not ready after %fs.',
+                         self.deadline)
+        except Exception:
+            logger.warning('Prefetching suggestion failed:\n%s',
+                           traceback.format_exc())
+            self._future = None
+        # history may have grown while prefetching
+        seen = trials.contains([trial.configuration for trial in trial_list])
+        trial_list = [
+            trial for trial, trial_seen in zip(trial_list, seen)
+            if not trial_seen
+        ][:n_suggestions]
+        if len(trial_list) < n_suggestions:
+            n = n_suggestions - len(trial_list)
+            self.n_fallback += n
+            trial_list += self.optimizer._random_suggest(n, trials)
+        return trial_list
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
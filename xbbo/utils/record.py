@@ -4,6 +4,8 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from xbbo.core.duplicate_index import DuplicateIndex
+
 
 class Record:
 
@@ -27,6 +29,8 @@ class Record:
             'eval_time_per_suggest': []
         }
         self.suggest_dict = []
+        self._dup_index = None
+        self._n_indexed = 0  # features added to _dup_index
         # index = pd.MultiIndex.from_product([self.n_calls * n_suggest, dim])
         self.df = None
 
@@ -55,8 +59,15 @@ class Record:
     #     plt.plot(self.history)
 
     def is_duplicate(self, x, rtol=1e-5, atol=1e-8):
-        return any(np.allclose(x_prev, x, rtol=rtol, atol=atol)
-                   for x_prev in self.features)
+        x = np.ravel(x)
+        index = self._dup_index
+        if index is None or (index.dim, index.rtol, index.atol) != (len(x), rtol, atol):
+            self._dup_index = index = DuplicateIndex(len(x), rtol=rtol, atol=atol)
+            self._n_indexed = 0
+        for feature in self.features[self._n_indexed:]:
+            index.add(np.reshape(feature, (-1, len(x))))
+        self._n_indexed = len(self.features)
+        return bool(index.contains(x)[0])
 
     def save_to_file(self, r):
         if not os.path.exists(self.exp_dir):